@@ -1,11 +1,221 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, Service, Order, OrderTracking
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.http import HttpResponseRedirect
+from django.urls import reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+from . import capacity, counts, money, sharding
+from .models import (
+    User, Service, Order, OrderEvent, OrderTracking, Task, DeliveryEstimate, ServiceCapacity,
+    VersionConflict,
+)
+from .orders import bulk_transition, order_created_data, record_event, save_edit, snapshot
+
+
+def make_status_action(target, label):
+    """Build an admin action that moves the selected orders to ``target``."""
+    def action(modeladmin, request, queryset):
+        ids = list(queryset.values_list('id', flat=True))
+        results = bulk_transition((order_id, target) for order_id in ids)
+        updated = sum(1 for item in results if item['result'] == 'updated')
+        skipped = len(results) - updated
+        modeladmin.message_user(request, f'{updated} order(s) marked as {label}.')
+        if skipped:
+            modeladmin.message_user(
+                request,
+                f'{skipped} order(s) skipped: already {label}, transition not allowed, '
+                'or changed by someone else meanwhile.',
+                level=messages.WARNING,
+            )
+    action.__name__ = f'mark_{target}'
+    action.short_description = f'Mark selected orders as {label}'
+    return action
+
+
+# Query parameter of keyset pages: the primary key of the previous page's last row
+KEYSET_VAR = 'after'
+
+
+def keyset_after(ordering, row):
+    """
+    Filter for the rows that come after ``row`` (field -> value) in
+    ``ordering``, whose last field must be unique.
+    
+    The leading field is also bounded on its own, so the database seeks to
+    the cursor in that field's index instead of scanning up to it.
+    """
+    first = ordering[0].lstrip('-')
+    bound = 'lte' if ordering[0].startswith('-') else 'gte'
+    after = Q()
+    for position, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        equal = {prior.lstrip('-'): row[prior.lstrip('-')] for prior in ordering[:position]}
+        after |= Q(**equal, **{f'{name}__{lookup}': row[name]})
+    return Q(**{f'{first}__{bound}': row[first]}) & after
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator counting with ``api.counts.estimate()``.
+    
+    When the count is not exact, only the pages within the exactly counted
+    rows are offered; KeysetChangeList links past them.
+    """
+    
+    @cached_property
+    def row_count(self):
+        return counts.estimate(self.object_list)
+    
+    @cached_property
+    def count(self):
+        return self.row_count.count
+    
+    @cached_property
+    def num_pages(self):
+        pages = super().num_pages
+        if self.row_count.kind != counts.EXACT:
+            pages = min(pages, max(1, counts.count_cap() // self.per_page))
+        return pages
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Changelist that pages by key once OFFSET pages run out.
+    
+    ``?after=<pk>`` lists the rows following that row in the admin's
+    ``keyset_ordering`` with a WHERE on the ordering columns, rather than an
+    OFFSET that reads and discards every row before the page. The last
+    numbered page links to the keyset pages, which link to each other.
+    Sorting by another column falls back to numbered pages only.
+    """
+    
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(KEYSET_VAR, None)
+        return lookup_params
+    
+    def get_query_string(self, new_params=None, remove=None):
+        # Filters, sorting and page numbers start again from the first rows
+        return super().get_query_string({KEYSET_VAR: None, **(new_params or {})}, remove)
+    
+    def get_results(self, request):
+        super().get_results(request)
+        self.count_kind = self.paginator.row_count.kind
+        self.after = self.params.get(KEYSET_VAR)
+        self.first_page_url = self.get_query_string()
+        self.next_page_url = None
+        ordering = self.model_admin.keyset_ordering
+        if not ordering or ORDER_VAR in self.params or self.show_all:
+            if self.after is not None:
+                raise IncorrectLookupParameters
+            return
+        fields = [field.lstrip('-') for field in ordering]
+        if self.after is not None:
+            try:
+                cursor = self.root_queryset.filter(pk=self.after).values(*fields).first()
+            except (ValueError, ValidationError):
+                cursor = None
+            if cursor is None:
+                raise IncorrectLookupParameters
+            self.result_list = self.queryset.filter(keyset_after(ordering, cursor))[:self.list_per_page]
+        elif self.count_kind == counts.EXACT or self.page_num < self.paginator.num_pages:
+            return
+        rows = list(self.result_list)
+        if rows:
+            last = {field: getattr(rows[-1], field) for field in fields}
+            if self.queryset.filter(keyset_after(ordering, last)).exists():
+                self.next_page_url = self.get_query_string({KEYSET_VAR: rows[-1].pk})
+
+
+class LargeTableAdmin:
+    """
+    Changelist settings for tables too large to count or OFFSET through.
+    
+    Counts are capped estimates, the unfiltered total isn't shown, and
+    deep pages are keyset pages in ``keyset_ordering``, which should be
+    the admin's ``ordering`` and end with a unique field.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    keyset_ordering = None
+    
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+
+class ShardFilter(admin.SimpleListFilter):
+    """Pick the order shard the changelist shows"""
+    title = 'shard'
+    parameter_name = 'shard'
+    
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in sharding.shards()[1:]]
+    
+    def choices(self, changelist):
+        choices = list(super().choices(changelist))
+        choices[0]['display'] = sharding.PRIMARY
+        return choices
+    
+    def queryset(self, request, queryset):
+        # ShardedModelAdmin.get_queryset has already switched databases.
+        return queryset
+
+
+class ShardedModelAdmin(admin.ModelAdmin):
+    """
+    Admin for models stored on the order shards.
+    
+    The changelist shows one shard at a time (``?shard=``); change pages
+    find the row on whichever shard has it. Users and services live on
+    'default', so they are prefetched instead of joined.
+    """
+    shard_prefetch = []
+    
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if not sharding.enabled():
+            return queryset
+        alias = request.GET.get(ShardFilter.parameter_name)
+        if alias in sharding.shards():
+            queryset = queryset.using(alias)
+        return queryset.prefetch_related(*self.shard_prefetch)
+    
+    def get_list_filter(self, request):
+        list_filter = super().get_list_filter(request)
+        if sharding.enabled():
+            return [ShardFilter, *list_filter]
+        return list_filter
+    
+    def get_list_select_related(self, request):
+        if sharding.enabled():
+            related = super().get_list_select_related(request) or []
+            return [path for path in related if path not in self.shard_prefetch]
+        return super().get_list_select_related(request)
+    
+    def get_object(self, request, object_id, from_field=None):
+        if not sharding.enabled() or from_field is not None:
+            return super().get_object(request, object_id, from_field)
+        try:
+            alias = sharding.locate(self.model, int(object_id))
+        except ValueError:
+            return None
+        if alias is None:
+            return None
+        return self.get_queryset(request).using(alias).filter(pk=object_id).first()
 
 
 @admin.register(User)
-class UserAdmin(BaseUserAdmin):
+class UserAdmin(LargeTableAdmin, BaseUserAdmin):
     list_display = ['username', 'mobile_number', 'email', 'is_staff']
+    ordering = ['username']
+    keyset_ordering = ['username']
     fieldsets = BaseUserAdmin.fieldsets + (
         ('Additional Info', {'fields': ('mobile_number',)}),
     )
@@ -13,17 +223,162 @@ class UserAdmin(BaseUserAdmin):
 
 @admin.register(Service)
 class ServiceAdmin(admin.ModelAdmin):
-    list_display = ['name_en', 'service_type', 'price_per_unit', 'unit_name']
+    list_display = ['name_en', 'service_type', 'price_per_unit', 'unit_name', 'daily_capacity']
+    
+    @admin.display(description='Price per unit', ordering='price_per_unit_minor')
+    def price_per_unit(self, obj):
+        return money.to_string(obj.price_per_unit_minor)
+
+
+class OrderAdminForm(forms.ModelForm):
+    """
+    Carries the version the editor loaded, so saving can't overwrite a newer
+    change, and allows only the status changes in ``Order.STATUS_TRANSITIONS``.
+    """
+    conflict_message = (
+        'This order was changed by someone else while you were editing it. '
+        'Reload the page to see the current values.'
+    )
+    
+    class Meta:
+        model = Order
+        fields = '__all__'
+        widgets = {'version': forms.HiddenInput}
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Before validation copies the submitted values onto the instance
+        self.loaded = snapshot(self.instance)
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        loaded = cleaned_data.get('version')
+        if self.instance.pk and loaded is not None and loaded != self.instance.version:
+            raise forms.ValidationError(self.conflict_message)
+        previous, target = self.loaded[0], cleaned_data.get('status')
+        if self.instance.pk and target and target != previous and (
+            target not in Order.STATUS_TRANSITIONS.get(previous, ())
+        ):
+            self.add_error('status', f'An order that is {previous} cannot be moved to {target}.')
+        return cleaned_data
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(LargeTableAdmin, ShardedModelAdmin):
+    form = OrderAdminForm
     list_display = ['id', 'user', 'service', 'status', 'total_cost', 'created_at']
     list_filter = ['status', 'payment_method', 'created_at']
+    list_select_related = ['user', 'service']
+    date_hierarchy = 'created_at'
+    ordering = ['-created_at', '-id']
+    keyset_ordering = ['-created_at', '-id']
+    # A <select> of every user would list millions of them
+    raw_id_fields = ['user']
     search_fields = ['user__username', 'user__mobile_number']
+    shard_prefetch = ['user', 'service']
+    actions = [
+        make_status_action(target, label)
+        for target, label in Order.ORDER_STATUS
+        if target != 'pending'
+    ]
+    
+    def get_search_results(self, request, queryset, search_term):
+        if not sharding.enabled() or not search_term:
+            return super().get_search_results(request, queryset, search_term)
+        # Users can't be joined across databases; look them up first.
+        users = User.objects.filter(
+            Q(username__icontains=search_term) | Q(mobile_number__icontains=search_term)
+        )
+        return queryset.filter(user_id__in=list(users.values_list('id', flat=True))), False
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except VersionConflict:
+            # Saved by someone else after the form's clean() passed
+            self.message_user(request, OrderAdminForm.conflict_message, messages.ERROR)
+            return HttpResponseRedirect(request.get_full_path())
+        except capacity.CapacityExceeded as exc:
+            self.message_user(
+                request, f'Only {exc.available} units are available for {exc.day}.', messages.ERROR
+            )
+            return HttpResponseRedirect(request.get_full_path())
+    
+    def save_model(self, request, obj, form, change):
+        # Admin edits go to the change feed, capacity and ETA tables like API edits do
+        if change:
+            fields = [Order._meta.get_field(name) for name in form.changed_data if name != 'version']
+            save_edit(
+                obj, form.loaded, obj.status,
+                lambda: super(OrderAdmin, self).save_model(request, obj, form, change),
+                [field.attname for field in fields],
+            )
+            return
+        with sharding.atomic(sharding.shard_for_user(obj.user)):
+            super().save_model(request, obj, form, change)
+            record_event(obj, 'created', order_created_data(obj))
+    
+    def delete_model(self, request, obj):
+        with sharding.atomic(obj._state.db):
+            if obj.status != 'cancelled':
+                capacity.release(obj.service_id, obj.reserved_on, obj.quantity)
+            record_event(obj, 'deleted')
+            super().delete_model(request, obj)
+    
+    def delete_queryset(self, request, queryset):
+        with sharding.atomic(queryset.db):
+            rows = list(queryset.values_list('id', 'user_id', 'status', 'service_id', 'reserved_on', 'quantity'))
+            capacity.release_many(row[3:] for row in rows if row[2] != 'cancelled')
+            OrderEvent.objects.bulk_create([
+                OrderEvent(user_id=user_id, order_id=order_id, event_type='deleted', data={})
+                for order_id, user_id, *_ in rows
+            ])
+            super().delete_queryset(request, queryset)
+    
+    @admin.display(description='Total cost', ordering='total_cost_minor')
+    def total_cost(self, obj):
+        return money.to_string(obj.total_cost_minor)
 
 
 @admin.register(OrderTracking)
-class OrderTrackingAdmin(admin.ModelAdmin):
-    list_display = ['order', 'remaining_delivery_time', 'last_updated']
+class OrderTrackingAdmin(LargeTableAdmin, ShardedModelAdmin):
+    list_display = ['id', 'order_link', 'remaining_delivery_time', 'courier_pinged_at', 'last_updated']
+    ordering = ['-id']
+    keyset_ordering = ['-id']
+    raw_id_fields = ['order']
+    
+    @admin.display(description='Order', ordering='order_id')
+    def order_link(self, obj):
+        # From the foreign key alone; Order.__str__ would load the order, user and service
+        url = reverse('admin:api_order_change', args=[obj.order_id])
+        return format_html('<a href="{}">Order #{}</a>', url, obj.order_id)
+
+
+@admin.register(ServiceCapacity)
+class ServiceCapacityAdmin(admin.ModelAdmin):
+    list_display = ['service', 'day', 'capacity', 'reserved']
+    list_filter = ['service']
+    date_hierarchy = 'day'
+    # Only the conditional UPDATEs in api.capacity may change the counter
+    readonly_fields = ['reserved_hundredths']
+    
+    @admin.display(description='Capacity', ordering='capacity_hundredths')
+    def capacity(self, obj):
+        return money.to_string(obj.capacity_hundredths)
+    
+    @admin.display(description='Reserved', ordering='reserved_hundredths')
+    def reserved(self, obj):
+        return money.to_string(obj.reserved_hundredths)
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'status', 'priority', 'attempts', 'run_after', 'created_at']
+    list_filter = ['status', 'name']
+
 
+@admin.register(DeliveryEstimate)
+class DeliveryEstimateAdmin(admin.ModelAdmin):
+    list_display = ['service', 'hour', 'load_level', 'sample_count', 'p50', 'p80', 'p95', 'updated_at']
+    list_filter = ['service', 'load_level']
+    exclude = ['histogram']
@@ -0,0 +1,148 @@
+"""
+Admission control: bound the requests in flight per route class.
+
+API requests fall into the classes ``auth`` (``/api/auth/``), ``read``
+(safe methods) and ``write`` (everything else). Each class admits at most
+``limit`` requests at once in this process. A request that finds its class
+full waits up to ``queue_timeout`` seconds for a slot, counting the time it
+already spent queued in front of Django (``X-Request-Start``). After that it
+is shed with ``503`` and ``Retry-After`` rather than tying up a worker.
+
+Critical routes (``ADMISSION_CRITICAL_PATHS``, e.g. checkout and sign-in)
+may use the whole limit. Other requests leave ``reserved`` slots free for
+them, so a flood of cheap reads can't lock out the requests that matter
+most. Every admit and shed is counted; ``stats()`` feeds ``api/metrics/``.
+
+``api/batch/`` takes no slot itself: each of its sub-requests is admitted
+by its own class as it runs (see api.batch), so a batch of writes counts
+as that many writes.
+"""
+import threading
+import time
+
+from django.conf import settings
+
+DEFAULT_CLASSES = {
+    'auth': {'limit': 8, 'queue_timeout': 1.0, 'reserved': 2, 'retry_after': 2},
+    'read': {'limit': 32, 'queue_timeout': 0.25, 'reserved': 4, 'retry_after': 1},
+    'write': {'limit': 16, 'queue_timeout': 1.0, 'reserved': 4, 'retry_after': 2},
+}
+# Always admitted, so operators can look at a server that is shedding load
+EXEMPT_PATHS = ('/api/metrics/',)
+# Admitted one sub-request at a time instead (see api.batch)
+PER_ITEM_PATHS = ('/api/batch/',)
+BUSY_MESSAGE = 'Server is busy, please retry shortly'
+
+
+class Gate:
+    """In-flight counter for one route class."""
+
+    def __init__(self, name, limit, queue_timeout, reserved=0, retry_after=1):
+        self.name = name
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self.reserved = min(reserved, limit - 1)
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.peak = 0
+        self.counts = {'admitted': 0, 'queued': 0, 'shed_full': 0, 'shed_queue_time': 0, 'shed_critical': 0}
+        self._condition = threading.Condition()
+
+    def acquire(self, critical=False, waited=0.0):
+        """
+        Take a slot, waiting up to the rest of the queue budget.
+
+        ``waited`` is time already spent queued upstream; it only counts
+        against the budget when there is no free slot. Returns ``None`` once
+        admitted, or the reason (``'full'``/``'queue_time'``) for shedding
+        the request.
+        """
+        ceiling = self.limit if critical else self.limit - self.reserved
+        budget = self.queue_timeout - waited
+        with self._condition:
+            if self.in_flight >= ceiling:
+                if budget <= 0:
+                    return self._shed('queue_time', critical)
+                self.counts['queued'] += 1
+                deadline = time.monotonic() + budget
+                while self.in_flight >= ceiling:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return self._shed('full', critical)
+                    self._condition.wait(remaining)
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            self.counts['admitted'] += 1
+        return None
+
+    def _shed(self, reason, critical):
+        self.counts[f'shed_{reason}'] += 1
+        if critical:
+            self.counts['shed_critical'] += 1
+        return reason
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            # Waiters have different ceilings; let each re-check its own.
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            return {
+                'limit': self.limit,
+                'reserved': self.reserved,
+                'in_flight': self.in_flight,
+                'peak_in_flight': self.peak,
+                **self.counts,
+            }
+
+
+def route_class(path, safe):
+    """The route class of a request, or ``None`` if it is not controlled."""
+    if not path.startswith('/api/') or path in EXEMPT_PATHS + PER_ITEM_PATHS:
+        return None
+    if path.startswith('/api/auth/'):
+        return 'auth'
+    return 'read' if safe else 'write'
+
+
+def is_critical(path):
+    return path in getattr(settings, 'ADMISSION_CRITICAL_PATHS', ())
+
+
+def upstream_wait(request):
+    """Seconds since the proxy received the request (``X-Request-Start``), or 0."""
+    header = request.META.get('HTTP_X_REQUEST_START', '')
+    try:
+        started = float(header[2:] if header.startswith('t=') else header)
+    except ValueError:
+        return 0.0
+    if not 0 < started < 1e17:
+        return 0.0
+    # Proxies send seconds, milliseconds or microseconds since the epoch.
+    while started > 1e11:
+        started /= 1000
+    return max(0.0, time.time() - started)
+
+
+_gates = None
+_gates_lock = threading.Lock()
+
+
+def gates():
+    """The process-wide gates, configured from settings on first use."""
+    global _gates
+    if _gates is None:
+        with _gates_lock:
+            if _gates is None:
+                configured = getattr(settings, 'ADMISSION_CONTROL', DEFAULT_CLASSES)
+                _gates = {
+                    name: Gate(name, **{**DEFAULT_CLASSES.get(name, {}), **options})
+                    for name, options in configured.items()
+                }
+    return _gates
+
+
+def stats():
+    return {name: gate.stats() for name, gate in gates().items()}
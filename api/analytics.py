@@ -0,0 +1,373 @@
+"""
+Order analytics computed with NumPy over a columnar extract.
+
+``refresh()`` copies the columns the aggregates need from every order shard
+into typed binary files under ``ANALYTICS_CACHE_DIR``, one file per column
+and shard, read back as memory maps. The first refresh reads every order in
+``id`` order, in chunks; later ones only append orders with a higher ``id``
+and rewrite, in place, the rows of orders updated since the last refresh
+(status changes, deliveries). ``refresh(full=True)`` starts over, which
+also drops deleted orders and picks up orders moved between shards.
+
+A full extract is written to a new directory next to the live one and
+published by replacing the shard's ``CURRENT`` pointer file, so files a
+reader may have mapped are only ever appended to or rewritten in place,
+never truncated. The generation before the current one is kept for readers
+that resolved the pointer just before the swap; older ones are removed.
+
+``summary()`` answers from the files with vectorized operations: orders per
+hour of day, quantity percentiles and delivery-time histograms per service.
+Each shard's memory maps are aggregated on their own and only the small
+per-service results are combined, so the extract is never copied into
+memory as a whole. It never queries orders, so ``api/analytics/`` costs the
+same at any table size; run ``python manage.py refresh_analytics`` on a
+schedule to keep it current.
+
+NumPy is optional: without it ``refresh()`` and ``summary()`` raise
+``AnalyticsUnavailable``.
+"""
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import sharding
+from .models import Order, Service
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+# Column name -> NumPy dtype of the stored values
+COLUMNS = {
+    'id': 'int64',
+    'service_id': 'int32',
+    'created_at': 'int64',  # Seconds since the epoch
+    'hour': 'int8',  # Hour of day placed, in TIME_ZONE
+    'quantity': 'int64',  # Hundredths of a unit
+    'total_cost': 'int64',  # Minor units (see api.money)
+    'status': 'int8',  # Index into Order.ORDER_STATUS
+    'delivery_minutes': 'int32',  # -1 until delivered
+}
+ORDER_FIELDS = ['id', 'service_id', 'created_at', 'quantity', 'total_cost_minor', 'status', 'delivered_at']
+STATUS_CODES = {status: code for code, (status, _) in enumerate(Order.ORDER_STATUS)}
+QUANTITY_PERCENTILES = (50, 90, 95, 99)
+DELIVERY_PERCENTILES = (50, 80, 95)
+HISTOGRAM_BIN_MINUTES = 15
+HISTOGRAM_MAX_MINUTES = 360  # the last bin collects anything longer
+# Updated rows are re-read from this long before the previous refresh
+# started, so a write committed while it ran is not missed.
+UPDATE_OVERLAP = timedelta(minutes=5)
+# Each shard's directory holds generations named GENERATION_PREFIX + a random
+# suffix, and POINTER, a file naming the one readers use.
+POINTER = 'CURRENT'
+GENERATION_PREFIX = 'extract-'
+
+
+class AnalyticsUnavailable(Exception):
+    """NumPy is not installed"""
+
+
+def _require_numpy():
+    if np is None:
+        raise AnalyticsUnavailable('Order analytics need NumPy: pip install numpy')
+
+
+def cache_dir():
+    return Path(getattr(settings, 'ANALYTICS_CACHE_DIR', Path(settings.BASE_DIR) / 'analytics_cache'))
+
+
+class ColumnStore:
+    """The extracted columns of one shard: a binary file per column plus ``meta.json``."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.meta_path = self.directory / 'meta.json'
+
+    def meta(self):
+        if not self.meta_path.exists():
+            return {'rows': 0, 'last_id': 0, 'watermark': None, 'refreshed_at': None}
+        return json.loads(self.meta_path.read_text())
+
+    def save_meta(self, meta):
+        # Readers trust ``rows``, so write it last and atomically.
+        partial = self.meta_path.with_suffix('.tmp')
+        partial.write_text(json.dumps(meta))
+        os.replace(partial, self.meta_path)
+
+    def path(self, column):
+        return self.directory / f'{column}.bin'
+
+    def columns(self, rows=None, mode='r'):
+        """Memory maps of every column, limited to the first ``rows`` rows."""
+        rows = self.meta()['rows'] if rows is None else rows
+        if not rows:
+            return {column: np.zeros(0, dtype) for column, dtype in COLUMNS.items()}
+        return {
+            column: np.memmap(self.path(column), dtype=dtype, mode=mode, shape=(rows,))
+            for column, dtype in COLUMNS.items()
+        }
+
+    @classmethod
+    def create(cls, parent):
+        """An empty store in a new directory under ``parent``, not yet published."""
+        parent.mkdir(parents=True, exist_ok=True)
+        directory = tempfile.mkdtemp(prefix=GENERATION_PREFIX, dir=parent)
+        os.chmod(directory, 0o755)  # mkdtemp makes it private to this user
+        store = cls(directory)
+        store.save_meta({'rows': 0, 'last_id': 0, 'watermark': None, 'refreshed_at': None})
+        for column in COLUMNS:
+            store.path(column).write_bytes(b'')
+        return store
+
+    def append(self, rows, arrays):
+        """Write ``arrays`` after the first ``rows`` rows; returns the new row count."""
+        count = len(arrays['id'])
+        for column, dtype in COLUMNS.items():
+            with open(self.path(column), 'r+b') as out:
+                # Drop whatever an interrupted refresh left past the last saved row.
+                out.truncate(rows * np.dtype(dtype).itemsize)
+                out.seek(0, os.SEEK_END)
+                out.write(np.ascontiguousarray(arrays[column], dtype=dtype).tobytes())
+        return rows + count
+
+
+def current_store(alias):
+    """The published extract of shard ``alias``, or ``None`` before the first refresh."""
+    parent = cache_dir() / alias
+    try:
+        name = (parent / POINTER).read_text().strip()
+    except FileNotFoundError:
+        return None
+    return ColumnStore(parent / name)
+
+
+def _publish(alias, store, previous):
+    """Point readers of ``alias`` at ``store``; keep ``previous``, remove older generations."""
+    parent = store.directory.parent
+    partial = parent / f'{POINTER}.tmp'
+    partial.write_text(store.directory.name)
+    os.replace(partial, parent / POINTER)
+    keep = {store.directory.name, previous.directory.name if previous else None}
+    for directory in parent.glob(f'{GENERATION_PREFIX}*'):
+        if directory.name not in keep:
+            # Unlinking leaves existing memory maps of the files intact.
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def _to_arrays(orders):
+    """Column arrays for ``(id, service_id, created_at, ...)`` rows of ``ORDER_FIELDS``."""
+    columns = {column: [] for column in COLUMNS}
+    for order_id, service_id, created_at, quantity, total_cost, status, delivered_at in orders:
+        columns['id'].append(order_id)
+        columns['service_id'].append(service_id)
+        columns['created_at'].append(int(created_at.timestamp()))
+        columns['hour'].append(timezone.localtime(created_at).hour)
+        columns['quantity'].append(int(quantity * 100))
+        columns['total_cost'].append(total_cost)
+        columns['status'].append(STATUS_CODES[status])
+        columns['delivery_minutes'].append(
+            -1 if delivered_at is None
+            else max(0, int((delivered_at - created_at).total_seconds() // 60))
+        )
+    return {column: np.array(values, dtype=COLUMNS[column]) for column, values in columns.items()}
+
+
+def _chunks(queryset, chunk_size):
+    rows = queryset.values_list(*ORDER_FIELDS).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield _to_arrays(chunk)
+
+
+def _refresh_shard(alias, full, chunk_size):
+    published = current_store(alias)
+    store = published
+    started = timezone.now()
+    if full or store is None or not store.meta_path.exists():
+        # Readers keep the published files until the new extract is complete
+        store = ColumnStore.create(cache_dir() / alias)
+    meta = store.meta()
+    rows, last_id, updated = meta['rows'], meta['last_id'], 0
+    orders = Order.objects.using(alias).order_by('id')
+
+    if rows and meta['watermark']:
+        # Rewrite the rows of orders changed since the last refresh in place
+        since = datetime.fromisoformat(meta['watermark']) - UPDATE_OVERLAP
+        changed = orders.filter(id__lte=last_id, updated_at__gte=since)
+        for arrays in _chunks(changed, chunk_size):
+            columns = store.columns(rows, mode='r+')
+            positions = np.searchsorted(columns['id'], arrays['id'])
+            found = (positions < rows) & (columns['id'][np.minimum(positions, rows - 1)] == arrays['id'])
+            for column in COLUMNS:
+                columns[column][positions[found]] = arrays[column][found]
+                columns[column].flush()
+            updated += int(found.sum())
+
+    added = 0
+    for arrays in _chunks(orders.filter(id__gt=last_id), chunk_size):
+        rows = store.append(rows, arrays)
+        last_id = int(arrays['id'][-1])
+        added += len(arrays['id'])
+        store.save_meta({**meta, 'rows': rows, 'last_id': last_id})
+    store.save_meta({
+        'rows': rows,
+        'last_id': last_id,
+        'watermark': started.isoformat(),
+        'refreshed_at': timezone.now().isoformat(),
+    })
+    if store is not published:
+        _publish(alias, store, published)
+    return {'rows': rows, 'added': added, 'updated': updated}
+
+
+def refresh(full=False, chunk_size=20000):
+    """
+    Bring the extract up to date with every shard.
+
+    Returns ``{alias: {'rows', 'added', 'updated'}}``. Only one refresh
+    should run at a time.
+    """
+    _require_numpy()
+    return {alias: _refresh_shard(alias, full, chunk_size) for alias in sharding.shards()}
+
+
+def _value_counts(values):
+    """Sorted distinct ``values`` and how often each occurs."""
+    return np.unique(values, return_counts=True)
+
+
+def _merge_counts(parts):
+    """Combine ``(values, counts)`` pairs from several shards."""
+    if not parts:
+        return np.zeros(0, 'int64'), np.zeros(0, 'int64')
+    values, inverse = np.unique(np.concatenate([values for values, _ in parts]), return_inverse=True)
+    counts = np.bincount(inverse, weights=np.concatenate([counts for _, counts in parts]))
+    return values, counts.astype('int64')
+
+
+def _percentiles(values, counts, percentiles, scale=1):
+    """``np.percentile`` (linear) of the sample that holds ``counts[i]`` times ``values[i]``."""
+    total = int(counts.sum())
+    if not total:
+        return {f'p{p}': None for p in percentiles}
+    ends = np.cumsum(counts)
+    ranks = np.asarray(percentiles, dtype=float) / 100 * (total - 1)
+    lower = values[np.searchsorted(ends, np.floor(ranks), side='right')].astype(float)
+    upper = values[np.searchsorted(ends, np.ceil(ranks), side='right')].astype(float)
+    found = (lower + (upper - lower) * (ranks - np.floor(ranks))) / scale
+    return {f'p{p}': round(float(value), 2) for p, value in zip(percentiles, found)}
+
+
+def _aggregate_shard(columns, since, service_id):
+    """
+    Per-service partial aggregates of one shard's selected orders.
+
+    Counts add up across shards; quantities and delivery minutes are kept
+    as value counts so percentiles can still be computed exactly.
+    """
+    mask = np.ones(len(columns['id']), dtype=bool)
+    if since is not None:
+        mask &= columns['created_at'] >= since
+    if service_id is not None:
+        mask &= columns['service_id'] == service_id
+    service_ids = columns['service_id'][mask]
+    hours = columns['hour'][mask]
+    quantities = columns['quantity'][mask]
+    minutes = columns['delivery_minutes'][mask]
+    delivered = (columns['status'][mask] == STATUS_CODES['delivered']) & (minutes >= 0)
+    created_at = columns['created_at'][mask]
+
+    services = {}
+    for sid in np.unique(service_ids):
+        mine = service_ids == sid
+        services[int(sid)] = {
+            'orders': int(mine.sum()),
+            'per_hour': np.bincount(hours[mine], minlength=24),
+            'quantity_total': int(quantities[mine].sum()),
+            'quantities': _value_counts(quantities[mine]),
+            'minutes': _value_counts(minutes[mine & delivered]),
+        }
+    span = (int(created_at.min()), int(created_at.max())) if len(created_at) else None
+    return services, span
+
+
+def summary(days=None, service_id=None, now=None):
+    """
+    Aggregates of the orders placed in the last ``days`` days (all if ``None``).
+
+    Per service: the number of orders, the average orders placed in each
+    hour of the day, quantity percentiles, and the delivery times of
+    delivered orders as percentiles and a histogram.
+    """
+    _require_numpy()
+    since = None
+    if days is not None:
+        since = int(((now or timezone.now()) - timedelta(days=days)).timestamp())
+    # One shard's columns at a time: only the small per-service aggregates
+    # are kept, never a concatenated copy of every shard's memory maps.
+    parts, spans, refreshed = [], [], []
+    for alias in sharding.shards():
+        store = current_store(alias)
+        if store is None:
+            refreshed.append(None)
+            continue
+        refreshed.append(store.meta()['refreshed_at'])
+        services, span = _aggregate_shard(store.columns(), since, service_id)
+        parts.append(services)
+        if span is not None:
+            spans.append(span)
+    refreshed_at = None if None in refreshed else min(refreshed)
+
+    names = dict(Service.objects.values_list('id', 'name_en'))
+    span_days = days
+    if span_days is None and spans:
+        first, last = min(start for start, _ in spans), max(end for _, end in spans)
+        span_days = max(1.0, (last - first) / 86400)
+    bins = np.arange(0, HISTOGRAM_MAX_MINUTES + HISTOGRAM_BIN_MINUTES, HISTOGRAM_BIN_MINUTES)
+
+    results = []
+    total = 0
+    for sid in sorted(set().union(*parts)):
+        shards = [services[sid] for services in parts if sid in services]
+        orders = sum(part['orders'] for part in shards)
+        total += orders
+        per_hour = sum(part['per_hour'] for part in shards)
+        quantities = _merge_counts([part['quantities'] for part in shards])
+        minutes = _merge_counts([part['minutes'] for part in shards])
+        histogram, _ = np.histogram(
+            np.minimum(minutes[0], HISTOGRAM_MAX_MINUTES - 1), bins=bins, weights=minutes[1]
+        )
+        results.append({
+            'service_id': sid,
+            'service': names.get(sid, ''),
+            'orders': orders,
+            'orders_per_hour': [round(float(count) / span_days, 3) for count in per_hour],
+            'quantity': {
+                'mean': round(sum(part['quantity_total'] for part in shards) / orders / 100, 2),
+                **_percentiles(*quantities, QUANTITY_PERCENTILES, scale=100),
+            },
+            'delivery_minutes': {
+                'delivered': int(minutes[1].sum()),
+                **_percentiles(*minutes, DELIVERY_PERCENTILES),
+                'histogram': {
+                    'bin_minutes': HISTOGRAM_BIN_MINUTES,
+                    'counts': histogram.astype('int64').tolist(),
+                },
+            },
+        })
+    return {
+        'refreshed_at': refreshed_at,
+        'days': days,
+        'orders': total,
+        'services': results,
+    }
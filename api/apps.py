@@ -1,7 +1,31 @@
 from django.apps import AppConfig
+from django.conf import settings
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """Apply ``SQLITE_PRAGMAS`` to every new SQLite connection."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        if connection.settings_dict['TEST']['MIRROR'] and connection.is_in_memory_db():
+            # A test mirror (the replicas) shares the in-memory test database
+            # through SQLite's shared cache, whose table locks would fail its
+            # reads while a test's transaction is open on the primary.
+            cursor.execute('PRAGMA read_uncommitted = true')
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
-
+    
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_delete, post_save, pre_delete
+        
+        from . import catalog, sharding
+        pre_delete.connect(sharding.delete_user_orders, sender=self.get_model('User'))
+        connection_created.connect(configure_sqlite)
+        for signal in (post_save, post_delete):
+            signal.connect(catalog.invalidate, sender=self.get_model('Service'))
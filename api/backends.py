@@ -13,22 +13,32 @@ class MobileNumberBackend(ModelBackend):
     def authenticate(self, request, mobile_number=None, password=None, **kwargs):
         """
         Authenticate a user based on mobile number and password.
+        
+        Exactly one password hash is computed. On failure the reason is
+        stored as ``request.auth_failure`` ('unknown_user' or
+        'incorrect_password') so callers don't have to query again.
         """
         if mobile_number is None or password is None:
             return None
         
         try:
             user = User.objects.get(mobile_number=mobile_number)
-            if user.check_password(password):
-                return user
         except User.DoesNotExist:
             # Run the default password hasher once to reduce the timing
             # difference between an existing and a nonexistent user.
             User().set_password(password)
+            self._record_failure(request, 'unknown_user')
             return None
         
+        if user.check_password(password):
+            return user
+        self._record_failure(request, 'incorrect_password')
         return None
     
+    def _record_failure(self, request, reason):
+        if request is not None:
+            request.auth_failure = reason
+    
     def get_user(self, user_id):
         """
         Get a user by ID.
@@ -0,0 +1,179 @@
+"""
+Run several API requests in one round trip.
+
+``POST /api/batch/`` takes a list of sub-requests::
+
+    {"requests": [
+        {"method": "GET", "path": "/profile/"},
+        {"method": "GET", "path": "/orders/?fields=id,status"},
+        {"method": "GET", "path": "/orders/7/track/"}
+    ]}
+
+Each one is resolved against the ``api/`` routes and dispatched in-process,
+in order, as the calling user: the sub-request carries the caller's
+cookies, session and headers, and signing in or out affects the
+sub-requests after it. Responses come back in the same order.
+
+Read-only sub-requests share one database connection: with replicas
+configured they all read from the same replica, and after a write in the
+batch the remaining reads go to the primary. Sub-requests that have not
+started when ``BATCH_TIME_LIMIT`` runs out are answered with ``504``.
+
+The batch request itself is not admission-controlled; each sub-request
+takes a slot of its own route class while it runs (see api.admission) and
+is answered with ``503`` when that class is full.
+"""
+import io
+import json
+import logging
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.urls import Resolver404, resolve
+
+from . import admission
+from .db_routers import replica_reads_allowed, single_replica
+from .middleware import SAFE_METHODS, is_pinned
+
+logger = logging.getLogger('api.batch')
+
+API_PREFIX = '/api/'
+BATCH_PATH = API_PREFIX + 'batch/'
+# Request headers a sub-request never takes from the batch request itself
+_NOT_INHERITED = ('CONTENT_TYPE', 'CONTENT_LENGTH', 'HTTP_ACCEPT', 'HTTP_IF_MATCH', 'HTTP_IF_NONE_MATCH')
+
+
+def api_path(path):
+    """Map a path relative to the API root (``/orders/``) to a full path."""
+    path = path.lstrip('/')
+    if path.startswith(API_PREFIX.lstrip('/')):
+        path = path[len(API_PREFIX) - 1:]
+    return API_PREFIX + path
+
+
+def build_request(parent, method, path, body=None, headers=None):
+    """A Django request for one sub-request, authenticated like ``parent``."""
+    url = urlsplit(api_path(path))
+    payload = b'' if body is None else json.dumps(body).encode()
+    environ = {
+        key: value for key, value in parent.META.items()
+        if key not in _NOT_INHERITED
+    }
+    environ.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': url.path,
+        'SCRIPT_NAME': '',
+        'QUERY_STRING': url.query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(payload)),
+        'wsgi.input': io.BytesIO(payload),
+        'wsgi.url_scheme': parent.scheme,
+    })
+    for name, value in (headers or {}).items():
+        key = 'HTTP_' + name.upper().replace('-', '_')
+        if key not in ('HTTP_COOKIE', 'HTTP_AUTHORIZATION', 'HTTP_HOST'):
+            environ[key] = value
+    request = WSGIRequest(environ)
+    # What the session and authentication middleware set on the parent
+    request.session = parent.session
+    request.user = parent.user
+    return request
+
+
+def _body(response):
+    if hasattr(response, 'data'):
+        # DRF responses: use the data instead of rendering and re-parsing it
+        return response.data
+    if response.streaming or not response.content:
+        return None
+    try:
+        return json.loads(response.content)
+    except ValueError:
+        return response.content.decode(response.charset, 'replace')
+
+
+def dispatch(request):
+    """Run one sub-request through its view and describe the response."""
+    if not request.path.startswith(API_PREFIX) or request.path == BATCH_PATH:
+        return {'status': 400, 'body': {'error': 'Path must be an api/ route other than batch/'}}
+    try:
+        # Only the api app's routes; the site URLconf ends in a frontend catch-all.
+        match = resolve(request.path[len(API_PREFIX) - 1:], urlconf='api.urls')
+    except Resolver404:
+        return {'status': 404, 'body': {'error': 'Not found'}}
+    request.resolver_match = match
+    try:
+        response = match.func(request, *match.args, **match.kwargs)
+    except Exception:
+        logger.exception('batch sub-request failed', extra={'path': request.path})
+        return {'status': 500, 'body': {'error': 'Internal server error'}}
+    headers = {
+        name: value for name, value in response.items()
+        if name not in ('Content-Type', 'Content-Length')
+    }
+    return {'status': response.status_code, 'headers': headers, 'body': _body(response)}
+
+
+def admit(request, waited):
+    """
+    Take a slot of the sub-request's route class.
+
+    Returns the gate to release afterwards (``None`` if the route is not
+    controlled), or the ``503`` response for a shed sub-request.
+    """
+    name = admission.route_class(request.path, request.method in SAFE_METHODS)
+    gate = admission.gates().get(name)
+    if gate is None:
+        return None, None
+    if gate.acquire(admission.is_critical(request.path), waited) is not None:
+        return None, {
+            'status': 503,
+            'headers': {'Retry-After': str(gate.retry_after)},
+            'body': {'error': admission.BUSY_MESSAGE},
+        }
+    return gate, None
+
+
+def run(parent, subrequests):
+    """
+    Dispatch ``subrequests`` (dicts with method/path/body/headers) in order.
+
+    Returns ``(responses, read_only)`` where ``read_only`` is true when no
+    sub-request with an unsafe method was run and none set ``db_wrote``.
+    """
+    deadline = time.monotonic() + settings.BATCH_TIME_LIMIT
+    waited = admission.upstream_wait(parent)
+    replica_ok = not is_pinned(parent)
+    read_only = True
+    responses = []
+    with single_replica():
+        for item in subrequests:
+            if time.monotonic() > deadline:
+                responses.append({'status': 504, 'body': {'error': 'Batch time limit exceeded'}})
+                continue
+            method = item['method']
+            request = build_request(
+                parent, method, item['path'], item.get('body'), item.get('headers')
+            )
+            gate, shed = admit(request, waited)
+            if shed is not None:
+                responses.append(shed)
+                continue
+            safe = method in SAFE_METHODS
+            if not safe:
+                # Later reads in this batch must see the write.
+                read_only = replica_ok = False
+            token = replica_reads_allowed.set(safe and replica_ok)
+            try:
+                responses.append(dispatch(request))
+            finally:
+                replica_reads_allowed.reset(token)
+                if gate is not None:
+                    gate.release()
+            if getattr(request, 'db_wrote', False):
+                read_only = replica_ok = False
+            # Carry a sign-in or sign-out over to the following sub-requests
+            parent.user = request.user
+    return responses, read_only
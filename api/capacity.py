@@ -0,0 +1,102 @@
+"""
+Per-service daily delivery capacity.
+
+A service with ``daily_capacity`` set gets one ``ServiceCapacity`` row per
+day, created on first use. ``reserve`` claims quantity with a single
+conditional ``UPDATE``::
+
+    UPDATE ... SET reserved_hundredths = reserved_hundredths + q
+    WHERE service_id = s AND day = d AND reserved_hundredths <= capacity_hundredths - q
+
+The database evaluates the guard and the increment as one statement on the
+current row, so concurrent checkouts can't oversell a day and no row or
+table locks are taken explicitly. Quantities are stored and compared as
+integer hundredths of a unit: SQLite does decimal arithmetic in floats,
+where 0.1 + 0.1 + 0.1 > 0.3. Services without a daily capacity are
+unlimited and cost no queries.
+"""
+from collections import defaultdict
+
+from django.db.models import F
+from django.utils import timezone
+
+from . import money
+from .models import ServiceCapacity
+
+
+def hundredths(quantity):
+    """Integer hundredths of a unit for a decimal quantity"""
+    return money.to_minor(quantity)
+
+
+class CapacityExceeded(Exception):
+    """Raised when a service has too little capacity left for a reservation."""
+
+    def __init__(self, service_id, day, available):
+        self.service_id = service_id
+        self.day = day
+        self.available = available
+        super().__init__(f'Service {service_id} has {available} units left on {day}')
+
+
+def _try_reserve(service_id, day, amount):
+    return ServiceCapacity.objects.filter(
+        service_id=service_id, day=day, reserved_hundredths__lte=F('capacity_hundredths') - amount
+    ).update(reserved_hundredths=F('reserved_hundredths') + amount)
+
+
+def reserve(service, quantity, day=None):
+    """
+    Hold ``quantity`` of ``service`` for ``day`` (today by default).
+
+    Returns the reserved day, or ``None`` for services without a capacity
+    limit. Raises ``CapacityExceeded`` if the day can't fit the quantity.
+    Call inside the transaction that creates the order so a failed
+    checkout gives the capacity back.
+    """
+    if service.daily_capacity is None:
+        return None
+    day = day or timezone.localdate()
+    amount = hundredths(quantity)
+    if _try_reserve(service.id, day, amount):
+        return day
+    # Either the day's row doesn't exist yet or it is full. Creating it is
+    # idempotent under concurrency thanks to the unique constraint.
+    ServiceCapacity.objects.bulk_create(
+        [ServiceCapacity(
+            service_id=service.id, day=day, capacity_hundredths=hundredths(service.daily_capacity)
+        )],
+        ignore_conflicts=True,
+    )
+    if _try_reserve(service.id, day, amount):
+        return day
+    raise CapacityExceeded(service.id, day, available(service.id, day))
+
+
+def release(service_id, day, quantity):
+    """Give back capacity held by an order that will no longer be delivered."""
+    if day is None:
+        return 0
+    return ServiceCapacity.objects.filter(service_id=service_id, day=day).update(
+        reserved_hundredths=F('reserved_hundredths') - hundredths(quantity)
+    )
+
+
+def release_many(orders):
+    """Release ``(service_id, reserved_on, quantity)`` holds, one UPDATE per day."""
+    totals = defaultdict(int)
+    for service_id, day, quantity in orders:
+        if day is not None:
+            totals[service_id, day] += quantity
+    for (service_id, day), quantity in totals.items():
+        release(service_id, day, quantity)
+
+
+def available(service_id, day=None):
+    """Remaining capacity for ``day``, or ``None`` if nothing is recorded."""
+    row = ServiceCapacity.objects.filter(
+        service_id=service_id, day=day or timezone.localdate()
+    ).values_list('capacity_hundredths', 'reserved_hundredths').first()
+    if row is None:
+        return None
+    return money.to_decimal(max(row[0] - row[1], 0))
@@ -0,0 +1,50 @@
+"""
+In-process copy of the service catalog.
+
+There are only a handful of ``Service`` rows and they rarely change, so
+checkout and pricing look them up here instead of querying for one on
+every request. The whole table is loaded with one query and reloaded
+every ``CACHE_SECONDS``, or at once when a service is saved or deleted in
+this process. An ID that isn't cached triggers one reload, so a service
+added by another process is found straight away; changes made elsewhere
+are seen within ``CACHE_SECONDS``.
+
+The cached instances are shared between requests: read them, don't modify
+them.
+"""
+import time
+
+from . import sharding
+from .models import Service
+
+CACHE_SECONDS = 60
+
+_cache = {'loaded_at': 0.0, 'services': {}}
+
+
+def _refresh_cache():
+    # Prices come from the primary, never from a lagging replica.
+    _cache['services'] = {
+        service.id: service for service in Service.objects.using(sharding.PRIMARY)
+    }
+    _cache['loaded_at'] = time.monotonic()
+
+
+def get_service(service_id):
+    """The ``Service`` with ``service_id``; raises ``Service.DoesNotExist``."""
+    try:
+        service_id = int(service_id)
+    except (TypeError, ValueError):
+        raise Service.DoesNotExist(f'Invalid service ID: {service_id!r}')
+    stale = time.monotonic() - _cache['loaded_at'] > CACHE_SECONDS
+    if stale or service_id not in _cache['services']:
+        _refresh_cache()
+    try:
+        return _cache['services'][service_id]
+    except KeyError:
+        raise Service.DoesNotExist(f'Service {service_id} does not exist')
+
+
+def invalidate(**kwargs):
+    """Signal receiver: reload the catalog on the next lookup."""
+    _cache['loaded_at'] = 0.0
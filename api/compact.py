@@ -0,0 +1,68 @@
+"""
+Compact, side-loaded representation of order collections.
+
+Clients opt in with ``Accept: application/vnd.softproject.compact+json``.
+Instead of nesting the full ``user`` and ``service`` objects in every order,
+orders carry ``user_id``/``service_id`` and each distinct related object is
+rendered once under ``included``::
+
+    {
+        "data": [{"id": 7, "user_id": 3, "service_id": 1, ...}, ...],
+        "included": {"users": [{"id": 3, ...}], "services": [{"id": 1, ...}]}
+    }
+
+Change-feed events already refer to services by ID; in compact mode the
+feed gains the same ``included`` section for the services they mention.
+"""
+from rest_framework.renderers import JSONRenderer
+
+from .models import Service, User
+from .serializers import CompactOrderSerializer, ServiceSerializer, UserSerializer
+
+COMPACT_MEDIA_TYPE = 'application/vnd.softproject.compact+json'
+
+
+class CompactJSONRenderer(JSONRenderer):
+    """Selects the compact representation through content negotiation."""
+    media_type = COMPACT_MEDIA_TYPE
+    format = 'compact'
+
+
+def requested(request):
+    """Whether content negotiation picked the compact format."""
+    renderer = getattr(request, 'accepted_renderer', None)
+    return getattr(renderer, 'format', None) == 'compact'
+
+
+def included(user_ids=(), service_ids=()):
+    """Render each referenced user and service once, one query per type."""
+    sections = {}
+    if user_ids:
+        users = User.objects.filter(id__in=set(user_ids)).order_by('id')
+        sections['users'] = UserSerializer(users, many=True).data
+    if service_ids:
+        services = Service.objects.filter(id__in=set(service_ids)).order_by('id')
+        sections['services'] = ServiceSerializer(services, many=True).data
+    return sections
+
+
+def order_document(orders, field_spec=None):
+    """The compact ``{"data", "included"}`` document for an order queryset."""
+    serializer = CompactOrderSerializer(list(orders), many=True, field_spec=field_spec)
+    data = serializer.data
+    fields = serializer.child.fields
+    return {
+        'data': data,
+        'included': included(
+            {row['user_id'] for row in data} if 'user_id' in fields else (),
+            {row['service_id'] for row in data} if 'service_id' in fields else (),
+        ),
+    }
+
+
+def event_service_ids(events):
+    """Service IDs mentioned by change-feed events."""
+    return {
+        event.data['service_id'] for event in events
+        if isinstance(event.data, dict) and event.data.get('service_id')
+    }
@@ -0,0 +1,57 @@
+"""
+Row counts that stay cheap on large tables.
+
+``COUNT(*)`` visits every row it counts, so a listing over millions of
+orders spends most of its time counting them. ``estimate()`` counts at
+most ``cap`` rows. Past that, an unfiltered queryset is answered from the
+row count SQLite's ``ANALYZE`` keeps in ``sqlite_stat1`` (refresh it with
+``python manage.py analyze_tables``), and a filtered one only reports
+that it has more than ``cap`` rows.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connections
+
+EXACT = 'exact'
+ESTIMATE = 'estimate'  # From table statistics, as of the last ANALYZE
+AT_LEAST = 'at_least'  # More than ``count`` rows
+
+RowCount = namedtuple('RowCount', ['count', 'kind'])
+
+
+def count_cap():
+    return getattr(settings, 'COUNT_CAP', 10000)
+
+
+def table_rows(model, using):
+    """Rows in ``model``'s table when ANALYZE last ran on ``using``, or None."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+        if cursor.fetchone() is None:
+            return None
+        # One row per index; each stat starts with the table's row count
+        cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s', [model._meta.db_table])
+        rows = [int(stat.split()[0]) for stat, in cursor.fetchall()]
+    return max(rows) if rows else None
+
+
+def estimate(queryset, cap=None):
+    """
+    The number of rows in ``queryset`` as a ``RowCount``.
+
+    Exact up to ``cap`` rows, which costs at most ``cap`` index entries read.
+    """
+    cap = count_cap() if cap is None else cap
+    count = queryset[:cap + 1].count()
+    if count <= cap:
+        return RowCount(count, EXACT)
+    if not queryset.query.where:
+        rows = table_rows(queryset.model, queryset.db)
+        # Statistics older than the rows counted so far are no use
+        if rows is not None and rows > cap:
+            return RowCount(rows, ESTIMATE)
+    return RowCount(cap, AT_LEAST)
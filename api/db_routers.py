@@ -0,0 +1,120 @@
+"""
+Database routing: order shards, and the primary and read replicas.
+
+``ShardRouter`` handles the sharded order models (see ``api.sharding``)
+and defers everything else to ``ReplicaRouter``.
+
+Reads go to a replica from ``settings.DATABASE_REPLICAS`` only while the
+current request is read-only (see ``api.middleware.ReplicaRoutingMiddleware``)
+and the client has not written recently. Everything else, including every
+write and any read inside a transaction, uses the primary (``default``).
+"""
+import itertools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+from . import sharding
+
+PRIMARY = 'default'
+
+# True while the current request may read from a replica
+replica_reads_allowed = ContextVar('replica_reads_allowed', default=False)
+# Replica every read should use instead of rotating (see single_replica)
+_sticky_replica = ContextVar('sticky_replica', default=None)
+
+_cycle_lock = threading.Lock()
+_replica_cycle = None
+
+
+def _next_replica():
+    global _replica_cycle
+    with _cycle_lock:
+        if _replica_cycle is None:
+            _replica_cycle = itertools.cycle(settings.DATABASE_REPLICAS)
+        return next(_replica_cycle)
+
+
+@contextmanager
+def single_replica():
+    """Send every replica read inside the block to the same replica connection."""
+    replicas = getattr(settings, 'DATABASE_REPLICAS', None)
+    token = _sticky_replica.set(_next_replica() if replicas else None)
+    try:
+        yield
+    finally:
+        _sticky_replica.reset(token)
+
+
+class ReplicaRouter:
+    """Send read-only request traffic round-robin to the replica pool."""
+
+    def db_for_read(self, model, **hints):
+        if not getattr(settings, 'DATABASE_REPLICAS', None):
+            return None
+        if not replica_reads_allowed.get() or connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        return _sticky_replica.get() or _next_replica()
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copies of the primary and are never migrated directly.
+        return db not in getattr(settings, 'DATABASE_REPLICAS', ())
+
+
+class ShardRouter:
+    """Send order and tracking rows to the shard of the user they belong to."""
+
+    def _shard(self, model, hints):
+        instance = hints.get('instance')
+        if not sharding.is_sharded(model):
+            return None
+        if instance is None:
+            return sharding.current_shard.get()
+        # __class__, not type(): request.user is a SimpleLazyObject
+        if not sharding.is_sharded(instance.__class__):
+            # Reverse relation from a user, e.g. user.orders
+            if hasattr(instance, 'order_shard'):
+                return sharding.shard_for_user(instance)
+            return sharding.current_shard.get()
+        if instance._state.db:
+            return instance._state.db
+        # A new row goes with its user (orders) or its order (tracking)
+        if getattr(instance, 'user_id', None) is not None:
+            user = instance.user if type(instance).user.is_cached(instance) else instance.user_id
+            return sharding.shard_for_user(user)
+        if getattr(instance, 'order_id', None) is not None and type(instance).order.is_cached(instance):
+            return instance.order._state.db or sharding.current_shard.get()
+        return sharding.current_shard.get()
+
+    def db_for_read(self, model, **hints):
+        if not sharding.enabled():
+            return None
+        instance = hints.get('instance')
+        if not sharding.is_sharded(model) and instance is not None and sharding.is_sharded(instance.__class__):
+            # order.user, order.service: Django would otherwise read them
+            # from the order's own database.
+            return ReplicaRouter().db_for_read(model) or PRIMARY
+        return self._shard(model, hints)
+
+    def db_for_write(self, model, **hints):
+        if not sharding.enabled():
+            return None
+        if not sharding.is_sharded(model):
+            return PRIMARY
+        return self._shard(model, hints)
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == PRIMARY or db not in sharding.shards():
+            return None
+        # Shards only hold the order tables.
+        return app_label == 'api' and model_name in sharding.SHARDED_MODELS
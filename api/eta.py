@@ -0,0 +1,203 @@
+"""
+Delivery-time estimates learned from completed orders.
+
+Every delivered order adds its duration (``delivered_at - created_at``) to a
+per-minute histogram in ``DeliveryEstimate`` for its service, the hour of
+day it was placed and the load level at the time (orders for the same
+service in the preceding hour). Each cell also feeds the coarser
+"any load" and "any hour" cells used when a cell has too few samples.
+Quantiles are recomputed from the histogram, so updates are incremental.
+
+``estimate()`` answers from an in-process copy of the table that is reloaded
+every ``CACHE_SECONDS``, which keeps checkout at a dictionary lookup.
+
+Order history is read from every order shard (see ``api.sharding``).
+"""
+import bisect
+import heapq
+import time
+from collections import Counter, deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from . import sharding
+from .models import DeliveryEstimate, Order
+from .tasks import task
+
+ANY = DeliveryEstimate.ANY
+LOAD_WINDOW = timedelta(hours=1)
+LOAD_THRESHOLDS = (5, 20)  # orders in LOAD_WINDOW: <5 low, <20 normal, else high
+MAX_MINUTES = 360  # the last histogram bucket collects anything longer
+MIN_SAMPLES = 20  # fewer deliveries than this fall back to a coarser cell
+CACHE_SECONDS = 60
+QUANTILES = {'p50': 0.5, 'p80': 0.8, 'p95': 0.95}
+
+_cache = {'loaded_at': 0.0, 'table': {}, 'loads': {}}
+
+
+def load_level(recent_orders):
+    """Bucket the number of orders placed in the last LOAD_WINDOW."""
+    return bisect.bisect_right(LOAD_THRESHOLDS, recent_orders)
+
+
+def cells(service_id, hour, level):
+    """Lookup keys from most to least specific."""
+    return [(service_id, hour, level), (service_id, hour, ANY), (service_id, ANY, ANY)]
+
+
+def quantile(histogram, q):
+    """The smallest duration (minutes) covering fraction ``q`` of deliveries."""
+    total = sum(histogram)
+    if not total:
+        return 0
+    target = q * total
+    seen = 0
+    for minutes, count in enumerate(histogram):
+        seen += count
+        if seen >= target:
+            return minutes
+    return len(histogram) - 1
+
+
+def _duration_minutes(order_created_at, delivered_at):
+    minutes = int((delivered_at - order_created_at).total_seconds() // 60)
+    return max(0, min(MAX_MINUTES, minutes))
+
+
+def _apply(estimate, durations):
+    histogram = estimate.histogram or [0] * (MAX_MINUTES + 1)
+    for minutes in durations:
+        histogram[minutes] += 1
+    estimate.histogram = histogram
+    estimate.sample_count = sum(histogram)
+    for field, q in QUANTILES.items():
+        setattr(estimate, field, quantile(histogram, q))
+
+
+def _save_histograms(additions):
+    """Add ``{cell: [minutes, ...]}`` to the stored histograms."""
+    with transaction.atomic():
+        for (service_id, hour, level), durations in additions.items():
+            estimate, _ = DeliveryEstimate.objects.select_for_update().get_or_create(
+                service_id=service_id, hour=hour, load_level=level
+            )
+            _apply(estimate, durations)
+            estimate.save()
+
+
+def _recent_orders(service_id, created_at):
+    """Orders for the service in the LOAD_WINDOW before ``created_at``, on the current shard."""
+    return Order.objects.filter(
+        service_id=service_id,
+        created_at__gte=created_at - LOAD_WINDOW,
+        created_at__lt=created_at,
+    ).count()
+
+
+@task(priority=-1)
+def record_deliveries(order_ids):
+    """Fold newly delivered orders into the estimate table."""
+    delivered = [
+        row for rows in sharding.fan_out(lambda alias: list(
+            Order.objects.filter(
+                id__in=order_ids, status='delivered', delivered_at__isnull=False
+            ).values_list('service_id', 'created_at', 'delivered_at')
+        ))
+        for row in rows
+    ]
+    # The load level counts the orders on every shard.
+    recent = [sum(counts) for counts in zip(*sharding.fan_out(lambda alias: [
+        _recent_orders(service_id, created_at) for service_id, created_at, _ in delivered
+    ]))]
+    additions = {}
+    for (service_id, created_at, delivered_at), count in zip(delivered, recent):
+        hour = timezone.localtime(created_at).hour
+        level = load_level(count)
+        minutes = _duration_minutes(created_at, delivered_at)
+        for cell in cells(service_id, hour, level):
+            additions.setdefault(cell, []).append(minutes)
+    _save_histograms(additions)
+
+
+def rebuild(chunk_size=10000):
+    """
+    Recompute the whole table from order history.
+
+    Orders are streamed per service in ``created_at`` order; a sliding window
+    over that stream gives each order's load level without extra queries.
+    The per-shard streams are merged into one.
+    """
+    additions = {}
+    window = {}
+    orders = heapq.merge(*(
+        Order.objects.using(alias).order_by('service_id', 'created_at')
+        .values_list('service_id', 'created_at', 'status', 'delivered_at')
+        .iterator(chunk_size=chunk_size)
+        for alias in sharding.shards()
+    ), key=lambda row: row[:2])
+    for service_id, created_at, status, delivered_at in orders:
+        recent = window.setdefault(service_id, deque())
+        while recent and recent[0] < created_at - LOAD_WINDOW:
+            recent.popleft()
+        level = load_level(len(recent))
+        recent.append(created_at)
+        if status != 'delivered' or delivered_at is None:
+            continue
+        hour = timezone.localtime(created_at).hour
+        minutes = _duration_minutes(created_at, delivered_at)
+        for cell in cells(service_id, hour, level):
+            additions.setdefault(cell, []).append(minutes)
+
+    with transaction.atomic():
+        DeliveryEstimate.objects.all().delete()
+        estimates = []
+        for (service_id, hour, level), durations in additions.items():
+            estimate = DeliveryEstimate(service_id=service_id, hour=hour, load_level=level)
+            _apply(estimate, durations)
+            estimates.append(estimate)
+        DeliveryEstimate.objects.bulk_create(estimates, batch_size=500)
+    _cache['loaded_at'] = 0.0
+    return len(estimates)
+
+
+def _refresh_cache():
+    field = getattr(settings, 'ETA_QUANTILE', 'p80')
+    _cache['table'] = {
+        (service_id, hour, level): minutes
+        for service_id, hour, level, minutes in DeliveryEstimate.objects.filter(
+            sample_count__gte=MIN_SAMPLES
+        ).values_list('service_id', 'hour', 'load_level', field)
+    }
+    since = timezone.now() - LOAD_WINDOW
+    loads = Counter()
+    for counts in sharding.fan_out(lambda alias: list(
+        Order.objects.filter(created_at__gte=since)
+        .values_list('service_id')
+        .annotate(count=Count('id'))
+        .values_list('service_id', 'count')
+    )):
+        loads.update(dict(counts))
+    _cache['loads'] = dict(loads)
+    _cache['loaded_at'] = time.monotonic()
+
+
+def estimate(service_id, at=None):
+    """
+    Estimated delivery minutes for an order placed now, or ``None``.
+
+    The table and current per-service load are cached in-process and
+    reloaded every CACHE_SECONDS, so most calls run no queries.
+    """
+    if time.monotonic() - _cache['loaded_at'] > CACHE_SECONDS:
+        _refresh_cache()
+    hour = timezone.localtime(at).hour
+    level = load_level(_cache['loads'].get(service_id, 0))
+    for cell in cells(service_id, hour, level):
+        minutes = _cache['table'].get(cell)
+        if minutes:
+            return minutes
+    return None
@@ -0,0 +1,53 @@
+"""
+Password hashing configuration and helpers.
+
+``CalibratedPBKDF2PasswordHasher`` takes its work factor from the
+``PASSWORD_HASHER_ITERATIONS`` setting, which ``manage.py calibrate_hasher``
+picks for a target latency on the deployment hardware. ``acheck_password``
+runs a check on a small bounded thread pool so async code never blocks the
+event loop (``hashlib.pbkdf2_hmac`` releases the GIL while it works). Django
+4.2's authentication has no async path, so nothing in the request flow uses
+it yet; ``benchmarks/bench_password_hashing.py`` measures it.
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+_executor = None
+
+
+class CalibratedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2-SHA256 with a configurable iteration count.
+
+    The algorithm name is unchanged, so existing ``pbkdf2_sha256`` hashes keep
+    verifying and are re-encoded with the new count on the next login.
+    """
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'PASSWORD_HASHER_ITERATIONS', None) or PBKDF2PasswordHasher.iterations
+
+
+def get_executor():
+    """The process-wide thread pool used for password hashing."""
+    global _executor
+    if _executor is None:
+        workers = getattr(settings, 'PASSWORD_HASHING_WORKERS', None) or min(4, os.cpu_count() or 1)
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+    return _executor
+
+
+async def run_hashing(func, *args, **kwargs):
+    """Run a CPU-bound hashing call on the hashing pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
+
+
+async def acheck_password(user, raw_password):
+    """Async ``user.check_password`` that hashes off the event loop."""
+    return await run_hashing(user.check_password, raw_password)
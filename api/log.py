@@ -0,0 +1,178 @@
+"""
+Structured, non-blocking logging for the api app.
+
+Request threads only put records on an in-memory queue; a background
+``QueueListener`` thread formats them as JSON lines and does the actual
+stream I/O. Sensitive request fields are redacted before a record leaves the
+request thread, and noisy loggers can be sampled.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import weakref
+from collections.abc import Mapping
+
+SENSITIVE_FIELDS = frozenset({
+    'password',
+    'password_confirm',
+    'old_password',
+    'new_password',
+    'csrfmiddlewaretoken',
+    'sessionid',
+})
+REDACTED = '[REDACTED]'
+
+# Attributes every LogRecord has; anything else was passed through ``extra``.
+_RESERVED_ATTRS = frozenset(
+    logging.LogRecord('', 0, '', 0, '', (), None).__dict__
+) | {'message', 'asctime'}
+
+
+def redact(value):
+    """Return a copy of ``value`` with sensitive mapping keys masked."""
+    if isinstance(value, Mapping):
+        return {
+            key: REDACTED if str(key).lower() in SENSITIVE_FIELDS else redact(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    return value
+
+
+def level_number(level):
+    """The number of a level given as a number or a name such as ``'WARNING'``."""
+    if isinstance(level, int):
+        return level
+    number = logging.getLevelName(str(level).upper())
+    if not isinstance(number, int):
+        raise ValueError(f'Unknown level: {level!r}')
+    return number
+
+
+def _extra_fields(record):
+    return {
+        key: value for key, value in record.__dict__.items()
+        if key not in _RESERVED_ATTRS and not key.startswith('_')
+    }
+
+
+class RedactFilter(logging.Filter):
+    """Mask sensitive fields in ``extra`` data and mapping arguments."""
+
+    def filter(self, record):
+        for key, value in _extra_fields(record).items():
+            setattr(record, key, redact(value))
+        if isinstance(record.args, Mapping):
+            record.args = redact(record.args)
+        elif isinstance(record.args, tuple):
+            record.args = tuple(redact(arg) for arg in record.args)
+        return True
+
+
+class SampleFilter(logging.Filter):
+    """
+    Keep only a fraction of records below ``min_level``.
+
+    Warnings and errors always pass so sampling never hides failures.
+    """
+
+    def __init__(self, rate=1.0, min_level='WARNING'):
+        super().__init__()
+        self.rate = float(rate)
+        self.min_level = level_number(min_level)
+
+    def filter(self, record):
+        if record.levelno >= self.min_level or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """Render a record and its ``extra`` fields as a single JSON line."""
+
+    def format(self, record):
+        payload = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        payload.update(_extra_fields(record))
+        if record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class QueueListenerHandler(logging.handlers.QueueHandler):
+    """
+    Hand records to a bounded queue drained by a background listener.
+
+    ``emit`` never blocks: when the queue is full the record is dropped and
+    counted in ``dropped``. The listener is (re)started lazily in each process
+    so the handler survives a pre-fork server model. ``stats()`` feeds
+    ``api/metrics/``.
+    """
+
+    instances = weakref.WeakSet()
+
+    def __init__(self, stream=None, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        target = logging.StreamHandler(stream or sys.stderr)
+        target.setFormatter(JsonFormatter())
+        self.target = target
+        self.dropped = 0
+        self._listener = None
+        self._pid = None
+        self._listener_lock = threading.Lock()
+        self.instances.add(self)
+        atexit.register(self.flush)
+
+    def _ensure_listener(self):
+        if self._pid == os.getpid():
+            return
+        with self._listener_lock:
+            # Another thread may have started it while this one waited
+            if self._pid == os.getpid():
+                return
+            self.queue = queue.Queue(self.queue.maxsize)
+            self._listener = logging.handlers.QueueListener(
+                self.queue, self.target, respect_handler_level=True
+            )
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._listener_lock:
+                self.dropped += 1
+
+    def flush(self):
+        """Block until every queued record has been written (tests/benchmarks)."""
+        with self._listener_lock:
+            if self._listener is not None and self._pid == os.getpid():
+                self._listener.stop()
+                self._pid = None
+
+    def close(self):
+        self.flush()
+        super().close()
+
+
+def stats():
+    """Records queued and dropped by this process's queue handlers."""
+    handlers = list(QueueListenerHandler.instances)
+    return {
+        'queued': sum(handler.queue.qsize() for handler in handlers),
+        'dropped': sum(handler.dropped for handler in handlers),
+    }
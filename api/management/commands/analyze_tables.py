@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from api import sharding
+
+
+class Command(BaseCommand):
+    help = 'Refresh the table statistics behind estimated row counts and query planning'
+
+    def handle(self, *args, **options):
+        for alias in dict.fromkeys([sharding.PRIMARY, *sharding.shards()]):
+            started = time.perf_counter()
+            with connections[alias].cursor() as cursor:
+                cursor.execute('ANALYZE')
+            self.stdout.write(f'  {alias}: {time.perf_counter() - started:.1f}s')
+        self.stdout.write(self.style.SUCCESS('Analyzed every database'))
@@ -0,0 +1,53 @@
+import time
+
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.core.management.base import BaseCommand
+from django.utils.crypto import get_random_string
+
+
+class Command(BaseCommand):
+    help = 'Pick a PBKDF2 iteration count that takes --target-ms on this machine'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target-ms', type=float, default=100,
+            help='Desired time for one password hash in milliseconds (default: 100)'
+        )
+        parser.add_argument(
+            '--samples', type=int, default=5,
+            help='Hashes timed per measurement; the fastest one is used (default: 5)'
+        )
+
+    def measure(self, hasher, iterations, samples):
+        """Best-of-``samples`` seconds for one hash at ``iterations``."""
+        salt = hasher.salt()
+        password = get_random_string(16)
+        best = float('inf')
+        for _ in range(samples):
+            start = time.perf_counter()
+            hasher.encode(password, salt, iterations)
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    def handle(self, *args, **options):
+        hasher = PBKDF2PasswordHasher()
+        target = options['target_ms'] / 1000
+
+        # PBKDF2 cost is linear in the iteration count, so scale from a
+        # probe and confirm with a second measurement.
+        probe = 50_000
+        per_iteration = self.measure(hasher, probe, options['samples']) / probe
+        iterations = max(10_000, int(target / per_iteration))
+        per_iteration = self.measure(hasher, iterations, options['samples']) / iterations
+        iterations = max(10_000, int(target / per_iteration) // 1000 * 1000)
+        elapsed = self.measure(hasher, iterations, options['samples'])
+
+        self.stdout.write(
+            f'Django default: {PBKDF2PasswordHasher.iterations} iterations '
+            f'({self.measure(hasher, PBKDF2PasswordHasher.iterations, 1) * 1000:.0f} ms)'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'{iterations} iterations take {elapsed * 1000:.1f} ms '
+            f'(target {options["target_ms"]:.0f} ms)'
+        ))
+        self.stdout.write(f'Set PASSWORD_HASHER_ITERATIONS={iterations} in the environment to use it.')
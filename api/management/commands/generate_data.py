@@ -0,0 +1,302 @@
+import math
+import random
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import timedelta
+from decimal import Decimal
+from multiprocessing import get_context
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connections, transaction
+from django.db.models import Max, sql
+from django.utils import timezone
+
+from api import money
+from api.models import Order, OrderTracking, Service, User
+
+TWO_PLACES = Decimal('0.01')
+USERNAME_PREFIX = 'synth_'
+
+# Share of orders per service type
+SERVICE_WEIGHTS = {'electricity': 0.5, 'water': 0.3, 'gas': 0.2}
+
+# Log-normal (mu, sigma) of the ordered quantity per service type
+QUANTITY_PARAMS = {
+    'electricity': (math.log(120), 0.6),   # kWh
+    'water': (math.log(400), 0.7),         # Liter
+    'gas': (math.log(25), 0.5),            # m³
+}
+
+# Relative demand per hour of day: quiet nights, morning and evening peaks
+HOUR_WEIGHTS = [
+    1, 1, 1, 1, 1, 2, 4, 7, 9, 9, 8, 7,
+    7, 6, 6, 6, 7, 9, 10, 10, 8, 5, 3, 2,
+]
+
+# Status mix of orders older than a day; newer ones are still moving
+SETTLED_STATUS_WEIGHTS = {'delivered': 0.9, 'cancelled': 0.1}
+RECENT_STATUS_WEIGHTS = {
+    'pending': 0.25, 'confirmed': 0.2, 'in_progress': 0.25,
+    'delivered': 0.25, 'cancelled': 0.05,
+}
+
+PAYMENT_WEIGHTS = {'cash': 0.7, 'card': 0.3}
+# Delivery fees in minor units (0, 2000.00 and 5000.00 IQD)
+DELIVERY_COSTS = [0, 200000, 500000]
+
+
+def _cumulative(weights):
+    total, result = 0, []
+    for weight in weights:
+        total += weight
+        result.append(total)
+    return result
+
+
+@contextmanager
+def explicit_timestamps():
+    """Let bulk_create keep the generated created_at/updated_at values."""
+    created_at = Order._meta.get_field('created_at')
+    updated_at = Order._meta.get_field('updated_at')
+    saved = created_at.auto_now_add, updated_at.auto_now
+    created_at.auto_now_add = updated_at.auto_now = False
+    try:
+        yield
+    finally:
+        created_at.auto_now_add, updated_at.auto_now = saved
+
+
+def insert_statements(model, objs, connection):
+    """
+    Compile the batched INSERTs ``bulk_create`` would run for ``objs``.
+
+    Compiling is most of bulk_create's cost, so workers do it in parallel and
+    only hold the write lock while executing. ``objs`` must have their
+    primary keys set.
+    """
+    fields = model._meta.concrete_fields
+    batch_size = connection.ops.bulk_batch_size(fields, objs)
+    statements = []
+    for start in range(0, len(objs), batch_size):
+        query = sql.InsertQuery(model)
+        query.insert_values(fields, objs[start:start + batch_size])
+        statements.extend(query.get_compiler(connection=connection).as_sql())
+    return statements
+
+
+# Per-process state shared by every chunk a worker generates
+_context = {}
+
+
+def _init_worker(context):
+    _context.update(context)
+    # Never reuse a connection inherited from the parent process.
+    connections.close_all()
+
+
+def _generate_orders(chunk):
+    """Create one chunk of orders and their tracking rows; return the row count."""
+    index, count = chunk
+    ctx = _context
+    first_id = ctx['first_order_id'] + index * ctx['batch_size']
+    rng = random.Random(ctx['seed'] * 1_000_003 + index)
+    now, span = ctx['now'], ctx['days'] * 86400
+    services = ctx['services']
+    service_types = list(services)
+    service_cum = _cumulative(SERVICE_WEIGHTS[t] for t in service_types)
+    user_ids, user_cum = ctx['user_ids'], ctx['user_cum']
+    hour_cum = _cumulative(HOUR_WEIGHTS)
+
+    orders = []
+    for order_id, service_type, user_id, hour in zip(
+        range(first_id, first_id + count),
+        rng.choices(service_types, cum_weights=service_cum, k=count),
+        rng.choices(user_ids, cum_weights=user_cum, k=count),
+        rng.choices(range(24), cum_weights=hour_cum, k=count),
+    ):
+        service_id, price = services[service_type]
+        mu, sigma = QUANTITY_PARAMS[service_type]
+        quantity = Decimal(max(1.0, rng.lognormvariate(mu, sigma))).quantize(TWO_PLACES)
+        service_cost = money.multiply(price, int(quantity * 100))
+        delivery_cost = rng.choice(DELIVERY_COSTS)
+
+        day = now - timedelta(seconds=rng.randrange(span))
+        created_at = day.replace(hour=hour, minute=rng.randrange(60), second=rng.randrange(60))
+        if created_at > now:
+            created_at -= timedelta(days=1)
+        age = now - created_at
+        weights = SETTLED_STATUS_WEIGHTS if age > timedelta(days=1) else RECENT_STATUS_WEIGHTS
+        status = rng.choices(list(weights), weights=list(weights.values()))[0]
+        eta = rng.choice([30, 45, 60, 60, 90, 120, 180])
+        updated_at = created_at + timedelta(minutes=rng.randrange(eta + 1))
+        delivered_at = None
+        if status == 'delivered':
+            # Actual durations scatter around the quoted ETA with a long tail
+            delivered_at = min(now, created_at + timedelta(minutes=rng.lognormvariate(math.log(eta), 0.35)))
+            updated_at = delivered_at
+
+        orders.append(Order(
+            id=order_id,
+            user_id=user_id,
+            service_id=service_id,
+            quantity=quantity,
+            service_cost_minor=service_cost,
+            delivery_cost_minor=delivery_cost,
+            total_cost_minor=service_cost + delivery_cost,
+            location=f'Baghdad, District {rng.randrange(1, 120)}',
+            payment_method=rng.choices(list(PAYMENT_WEIGHTS), weights=list(PAYMENT_WEIGHTS.values()))[0],
+            notes='',
+            status=status,
+            estimated_delivery_time=eta,
+            created_at=created_at,
+            updated_at=updated_at,
+            delivered_at=delivered_at,
+        ))
+
+    tracking = [
+        OrderTracking(
+            id=ctx['first_tracking_id'] + order.id - ctx['first_order_id'],
+            order_id=order.id,
+            remaining_delivery_time=(
+                0 if order.status in ('delivered', 'cancelled')
+                else rng.randrange(order.estimated_delivery_time + 1)
+            ),
+        )
+        for order in orders
+    ]
+
+    connection = connections['default']
+    with explicit_timestamps():
+        statements = (
+            insert_statements(Order, orders, connection)
+            + insert_statements(OrderTracking, tracking, connection)
+        )
+    with ctx['write_lock'], transaction.atomic(), connection.cursor() as cursor:
+        for statement, params in statements:
+            cursor.execute(statement, params)
+    return count * 2
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic users, orders and tracking rows for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Number of users to create')
+        parser.add_argument('--orders', type=int, default=10000, help='Number of orders to create')
+        parser.add_argument('--days', type=int, default=365, help='Spread created_at over the last N days')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed gives the same data')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Orders per transaction')
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes generating orders')
+        parser.add_argument('--password', default='password', help='Password set on every generated user')
+        parser.add_argument('--clear', action='store_true', help='Delete previously generated users (and their orders) first')
+
+    def handle(self, *args, **options):
+        services = {
+            service.service_type: (service.id, service.price_per_unit_minor)
+            for service in Service.objects.filter(service_type__in=SERVICE_WEIGHTS)
+        }
+        if len(services) != len(SERVICE_WEIGHTS):
+            raise CommandError('Services are missing. Run: python manage.py init_services')
+
+        if options['clear']:
+            deleted, _ = User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+            self.stdout.write(self.style.WARNING(f'Deleted {deleted} previously generated rows'))
+
+        started = time.perf_counter()
+        user_ids = self.create_users(options)
+        users_done = time.perf_counter()
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(user_ids)} users in {users_done - started:.1f}s'
+        ))
+
+        # A few heavy customers and a long tail of occasional ones.
+        rng = random.Random(options['seed'])
+        user_cum = _cumulative(rng.paretovariate(1.5) for _ in user_ids)
+        # Explicit, contiguous primary keys keep the output reproducible and
+        # let tracking rows be built without reading order IDs back.
+        context = {
+            'first_order_id': (Order.objects.aggregate(top=Max('id'))['top'] or 0) + 1,
+            'first_tracking_id': (OrderTracking.objects.aggregate(top=Max('id'))['top'] or 0) + 1,
+            'seed': options['seed'],
+            # Anchored to midnight so a seed reproduces the same data all day.
+            'now': timezone.now().replace(hour=0, minute=0, second=0, microsecond=0),
+            'days': options['days'],
+            'services': services,
+            'user_ids': user_ids,
+            'user_cum': user_cum,
+            'batch_size': options['batch_size'],
+            'write_lock': nullcontext(),
+        }
+
+        # Chunks are fixed by batch size, not by worker count, so the output
+        # is the same for a given seed however many workers are used.
+        total, size = options['orders'], options['batch_size']
+        chunks = [(i, min(size, total - start)) for i, start in enumerate(range(0, total, size))]
+        rows = 0
+        if options['workers'] > 1:
+            connections.close_all()
+            # Workers are forked so they inherit the configured Django setup.
+            mp = get_context('fork')
+            if connections['default'].vendor == 'sqlite':
+                # SQLite has a single writer: generate rows in parallel but
+                # take turns inserting them instead of failing with "locked".
+                context['write_lock'] = mp.Lock()
+            pool = mp.Pool(
+                options['workers'], initializer=_init_worker, initargs=(context,)
+            )
+            with pool:
+                for created in pool.imap_unordered(_generate_orders, chunks):
+                    rows += created
+                    self.report_progress(rows, total * 2, users_done)
+        else:
+            _context.update(context)
+            for chunk in chunks:
+                rows += _generate_orders(chunk)
+                self.report_progress(rows, total * 2, users_done)
+
+        self.reset_sequences()
+        elapsed = time.perf_counter() - users_done
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {total} orders and {total} tracking rows in {elapsed:.1f}s '
+            f'({rows / max(elapsed, 1e-9):,.0f} rows/s)'
+        ))
+
+    def create_users(self, options):
+        """Bulk-create users sharing one precomputed password hash."""
+        password = make_password(options['password'])
+        joined = timezone.now() - timedelta(days=options['days'])
+        prefix = f"{USERNAME_PREFIX}{options['seed']}_"
+        batch = []
+        for i in range(options['users']):
+            batch.append(User(
+                username=f'{prefix}{i}',
+                mobile_number=f"9{options['seed'] % 1000:03d}{i:09d}",
+                password=password,
+                date_joined=joined,
+            ))
+            if len(batch) >= options['batch_size']:
+                User.objects.bulk_create(batch)
+                batch = []
+        User.objects.bulk_create(batch)
+        return list(
+            User.objects.filter(username__startswith=prefix)
+            .order_by('id')
+            .values_list('id', flat=True)
+        )
+
+    def reset_sequences(self):
+        """Move ID sequences past the explicitly inserted primary keys."""
+        connection = connections['default']
+        statements = connection.ops.sequence_reset_sql(no_style(), [Order, OrderTracking])
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+
+    def report_progress(self, rows, total, started):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'  {rows:,}/{total:,} rows ({rows / max(elapsed, 1e-9):,.0f} rows/s)',
+            ending='\r',
+        )
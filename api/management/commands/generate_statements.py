@@ -0,0 +1,257 @@
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from heapq import merge
+from itertools import groupby
+from multiprocessing import get_context
+from operator import itemgetter
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from api import money, sharding
+from api.models import Order, Service, User
+
+DEFAULT_OUTPUT = Path(settings.BASE_DIR) / 'statements'
+CHECKPOINT = 'checkpoint.json'
+# Listed on the statement but not billed
+UNBILLED_STATUSES = {'cancelled'}
+ORDER_COLUMNS = ['user_id', 'created_at', 'id', 'service_id', 'quantity', 'total_cost_minor', 'status']
+USER_COLUMNS = ['id', 'username', 'first_name', 'last_name', 'mobile_number']
+
+
+def month_bounds(month):
+    """The first instants of ``month`` (``YYYY-MM``) and of the month after it."""
+    start = datetime.strptime(month, '%Y-%m')
+    end = start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    return timezone.make_aware(start), timezone.make_aware(end)
+
+
+def previous_month():
+    return (timezone.localdate().replace(day=1) - timedelta(days=1)).strftime('%Y-%m')
+
+
+def user_ranges(range_size):
+    """``[first_id, last_id]`` ranges of ``range_size`` users each."""
+    ids = list(User.objects.order_by('id').values_list('id', flat=True))
+    return [
+        [ids[start], ids[min(start + range_size, len(ids)) - 1]]
+        for start in range(0, len(ids), range_size)
+    ]
+
+
+def range_path(output, first, last):
+    return Path(output) / f'statements-{first:012d}-{last:012d}.jsonl'
+
+
+# Per-process state shared by every range a worker writes
+_context = {}
+
+
+def _init_worker(context):
+    _context.update(context)
+    # Never reuse a connection inherited from the parent process.
+    connections.close_all()
+
+
+def _month_orders(first, last):
+    """
+    The month's orders of users ``first``..``last`` in ``(user_id,
+    created_at, id)`` order, streamed with one cursor per shard.
+
+    Each user's orders are on a single shard, so merging the shards' sorted
+    streams keeps every user's orders together.
+    """
+    ctx = _context
+    return merge(*(
+        Order.objects.using(alias)
+        .filter(
+            user_id__gte=first, user_id__lte=last,
+            created_at__gte=ctx['start'], created_at__lt=ctx['end'],
+        )
+        .order_by('user_id', 'created_at', 'id')
+        .values_list(*ORDER_COLUMNS)
+        .iterator(chunk_size=ctx['chunk_size'])
+        for alias in sharding.shards()
+    ))
+
+
+def statement(user, orders):
+    """One user's statement: their orders and the billed totals per service."""
+    ctx = _context
+    user_id, username, first_name, last_name, mobile_number = user
+    lines, per_service, total = [], {}, 0
+    for _, created_at, order_id, service_id, quantity, cost, status in orders:
+        lines.append({
+            'id': order_id,
+            'created_at': created_at.isoformat(),
+            'service_id': service_id,
+            'quantity': str(quantity),
+            'total_cost': money.to_string(cost),
+            'status': status,
+        })
+        if status in UNBILLED_STATUSES:
+            continue
+        entry = per_service.setdefault(service_id, [0, 0, 0])
+        entry[0] += 1
+        entry[1] += int(quantity * 100)
+        entry[2] += cost
+        total += cost
+    return {
+        'user_id': user_id,
+        'username': username,
+        'name': f'{first_name} {last_name}'.strip(),
+        'mobile_number': mobile_number,
+        'month': ctx['month'],
+        'currency': ctx['currency'],
+        'orders': lines,
+        'services': [
+            {
+                'service_id': service_id,
+                'service': ctx['services'].get(service_id, ''),
+                'orders': count,
+                'quantity': money.to_string(hundredths),
+                'total_cost': money.to_string(cost),
+            }
+            for service_id, (count, hundredths, cost) in sorted(per_service.items())
+        ],
+        'total_cost': money.to_string(total),
+    }
+
+
+def _write_range(user_range):
+    """Write the statements of one user range; returns ``(range, users, orders)``."""
+    first, last = user_range
+    users = (
+        User.objects.filter(id__range=(first, last))
+        .order_by('id')
+        .values_list(*USER_COLUMNS)
+        .iterator(chunk_size=_context['chunk_size'])
+    )
+    groups = groupby(_month_orders(first, last), key=itemgetter(0))
+    group = next(groups, None)
+    path = range_path(_context['output'], first, last)
+    part = path.with_suffix('.part')
+    written = orders = 0
+    with open(part, 'w', encoding='utf-8') as out:
+        for user in users:
+            user_orders = []
+            # Skip orders of users deleted since, then take this user's
+            while group is not None and group[0] <= user[0]:
+                if group[0] == user[0]:
+                    user_orders = list(group[1])
+                group = next(groups, None)
+            out.write(json.dumps(statement(user, user_orders), ensure_ascii=False) + '\n')
+            written += 1
+            orders += len(user_orders)
+    # A range's file only appears once it is complete.
+    os.replace(part, path)
+    return user_range, written, orders
+
+
+class Command(BaseCommand):
+    help = 'Write monthly statements (orders and totals per service) for every user'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', help='Month as YYYY-MM (default: last month)')
+        parser.add_argument('--output', default=str(DEFAULT_OUTPUT),
+                            help='Directory; statements go to a subdirectory per month')
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes writing ranges')
+        parser.add_argument('--range-size', type=int, default=1000, help='Users per range (and per file)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per database round trip')
+        parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and write every range again')
+
+    def handle(self, *args, **options):
+        month = options['month'] or previous_month()
+        try:
+            start, end = month_bounds(month)
+        except ValueError:
+            raise CommandError(f'Invalid month {month!r}; use YYYY-MM')
+        output = Path(options['output']) / month
+        output.mkdir(parents=True, exist_ok=True)
+
+        # Ranges are fixed when a month's run starts, so a resumed run writes
+        # the same files whatever --workers and --range-size it is given.
+        checkpoint = self.load_checkpoint(output)
+        if options['restart'] or checkpoint is None:
+            # Files of an earlier run may cover other ranges
+            for stale in [*output.glob('statements-*.jsonl'), *output.glob('statements-*.part')]:
+                stale.unlink()
+            checkpoint = {'month': month, 'ranges': user_ranges(options['range_size']), 'done': []}
+            self.save_checkpoint(output, checkpoint)
+        recorded = {tuple(user_range) for user_range in checkpoint['done']}
+        checkpoint['done'], todo = [], []
+        for user_range in checkpoint['ranges']:
+            if tuple(user_range) in recorded and range_path(output, *user_range).exists():
+                checkpoint['done'].append(user_range)
+            else:
+                todo.append(user_range)
+        if len(todo) < len(checkpoint['ranges']):
+            self.stdout.write(self.style.WARNING(
+                f'Resuming: {len(checkpoint["ranges"]) - len(todo)} of '
+                f'{len(checkpoint["ranges"])} ranges already written'
+            ))
+
+        context = {
+            'month': month,
+            'start': start,
+            'end': end,
+            'output': str(output),
+            'chunk_size': options['chunk_size'],
+            'currency': getattr(settings, 'DEFAULT_CURRENCY', 'IQD'),
+            'services': dict(Service.objects.values_list('id', 'name_en')),
+        }
+        started = time.perf_counter()
+        users = orders = 0
+        if options['workers'] > 1 and len(todo) > 1:
+            connections.close_all()
+            # Workers are forked so they inherit the configured Django setup.
+            pool = get_context('fork').Pool(
+                options['workers'], initializer=_init_worker, initargs=(context,)
+            )
+            with pool:
+                for result in pool.imap_unordered(_write_range, todo):
+                    users, orders = self.record(output, checkpoint, result, users, orders, started)
+        else:
+            _context.update(context)
+            for user_range in todo:
+                result = _write_range(user_range)
+                users, orders = self.record(output, checkpoint, result, users, orders, started)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {users:,} statements with {orders:,} orders for {month} to {output} '
+            f'in {elapsed:.1f}s ({users / max(elapsed, 1e-9):,.0f} users/s, '
+            f'{orders / max(elapsed, 1e-9):,.0f} orders/s)'
+        ))
+
+    def record(self, output, checkpoint, result, users, orders, started):
+        """Checkpoint a finished range and report progress; returns the new totals."""
+        user_range, range_users, range_orders = result
+        checkpoint['done'].append(list(user_range))
+        self.save_checkpoint(output, checkpoint)
+        users, orders = users + range_users, orders + range_orders
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        self.stdout.write(
+            f'  {len(checkpoint["done"])}/{len(checkpoint["ranges"])} ranges, '
+            f'{users / elapsed:,.0f} users/s, {orders / elapsed:,.0f} orders/s',
+            ending='\r',
+        )
+        return users, orders
+
+    def load_checkpoint(self, output):
+        path = output / CHECKPOINT
+        if not path.exists():
+            return None
+        return json.loads(path.read_text())
+
+    def save_checkpoint(self, output, checkpoint):
+        # Written aside and renamed, so an interrupted run never leaves half a checkpoint
+        path = output / CHECKPOINT
+        partial = path.with_suffix('.tmp')
+        partial.write_text(json.dumps(checkpoint))
+        os.replace(partial, path)
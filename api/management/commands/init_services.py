@@ -1,5 +1,3 @@
-from decimal import Decimal
-
 from django.core.management.base import BaseCommand
 
 from api.models import Service
@@ -14,7 +12,7 @@ class Command(BaseCommand):
                 'service_type': 'electricity',
                 'name_ar': 'كهرباء',
                 'name_en': 'Electricity',
-                'price_per_unit': Decimal('200.00'),
+                'price_per_unit_minor': 20000,  # 200.00 IQD
                 'unit_name': 'kWh',
                 'unit_name_ar': 'كيلوواط'
             },
@@ -22,7 +20,7 @@ class Command(BaseCommand):
                 'service_type': 'water',
                 'name_ar': 'ماء',
                 'name_en': 'Water',
-                'price_per_unit': Decimal('150.00'),
+                'price_per_unit_minor': 15000,  # 150.00 IQD
                 'unit_name': 'Liter',
                 'unit_name_ar': 'لتر'
             },
@@ -30,7 +28,7 @@ class Command(BaseCommand):
                 'service_type': 'gas',
                 'name_ar': 'غاز',
                 'name_en': 'Gas',
-                'price_per_unit': Decimal('180.00'),
+                'price_per_unit_minor': 18000,  # 180.00 IQD
                 'unit_name': 'm³',
                 'unit_name_ar': 'متر مكعب'
             }
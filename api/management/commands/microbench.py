@@ -0,0 +1,223 @@
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from api.backends import MobileNumberBackend
+from api.models import Order, OrderTracking, Service, User
+from api.orders import quote
+from api.serializers import CheckoutSerializer, OrderSerializer, OrderTrackingSerializer
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'results' / 'microbench_baseline.json'
+SIZES = [1, 100, 10_000]
+
+
+def make_orders(count):
+    """Unsaved orders with their user, service and tracking attached."""
+    user = User(id=1, username='bench', mobile_number='07000000000', email='bench@example.com')
+    services = [
+        Service(id=n, service_type=kind, name_ar=kind, name_en=kind.title(),
+                price_per_unit_minor=price, unit_name=unit, unit_name_ar=unit)
+        for n, (kind, price, unit) in enumerate(
+            [('electricity', 25000, 'kWh'), ('water', 50000, 'Liter'), ('gas', 75000, 'm³')], 1
+        )
+    ]
+    now = timezone.now()
+    orders = []
+    for n in range(count):
+        order = Order(
+            id=n + 1, user=user, service=services[n % 3], quantity=Decimal('12.50'),
+            service_cost_minor=312500, delivery_cost_minor=200000,
+            total_cost_minor=512500, location='Baghdad, District 7', payment_method='cash',
+            notes='', status='pending', estimated_delivery_time=60,
+            created_at=now - timedelta(minutes=n), updated_at=now,
+        )
+        OrderTracking(id=n + 1, order=order, remaining_delivery_time=45, last_updated=now)
+        orders.append(order)
+    return orders
+
+
+def build_cases():
+    """Map case name -> zero-argument callable. Database cases need a test DB."""
+    cases = {}
+    for size in SIZES:
+        orders = make_orders(size)
+        tracking = [order.tracking for order in orders]
+        cases[f'order_serializer[{size}]'] = (
+            lambda orders=orders: OrderSerializer(orders, many=True).data
+        )
+        cases[f'tracking_serializer[{size}]'] = (
+            lambda tracking=tracking: OrderTrackingSerializer(tracking, many=True).data
+        )
+
+    price = 25000
+    cases['quote[checkout]'] = lambda: quote(price, Decimal('12.5'), Decimal('2000'))
+    cases['quote[calculate_cost]'] = lambda: quote(price, '12.5')
+
+    payload = {
+        'service_id': 1, 'quantity': '12.50', 'location': 'Baghdad, District 7',
+        'payment_method': 'cash', 'notes': 'Ring twice', 'delivery_cost': '2000',
+    }
+    cases['checkout_serializer.is_valid'] = lambda: CheckoutSerializer(data=payload).is_valid()
+
+    backend = MobileNumberBackend()
+    cases['authenticate[success]'] = (
+        lambda: backend.authenticate(None, mobile_number='07000000000', password='bench-pass')
+    )
+    cases['authenticate[wrong_password]'] = (
+        lambda: backend.authenticate(None, mobile_number='07000000000', password='wrong')
+    )
+    cases['authenticate[unknown_user]'] = (
+        lambda: backend.authenticate(None, mobile_number='07999999999', password='bench-pass')
+    )
+    cases['get_user'] = lambda: backend.get_user(1)
+    return cases
+
+
+def autorange(func, min_time):
+    """Smallest power-of-ten loop count whose run takes at least ``min_time``."""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        if time.perf_counter() - start >= min_time or loops >= 10 ** 6:
+            return loops
+        loops *= 10
+
+
+def time_case(func, repeat, min_time):
+    """Per-call seconds for ``repeat`` samples of an auto-sized loop."""
+    loops = autorange(func, min_time)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        samples.append((time.perf_counter() - start) / loops)
+    return samples
+
+
+def allocations(func):
+    """Blocks allocated and peak traced bytes for one call."""
+    func()  # fill caches first, so only per-call allocations are counted
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    blocks = sum(max(stat.count_diff, 0) for stat in after.compare_to(before, 'lineno'))
+    return blocks, peak
+
+
+class Command(BaseCommand):
+    help = 'Time the CPU-bound parts of a request and compare with a stored baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filter', default='', help='Only run cases whose name contains this')
+        parser.add_argument('--repeat', type=int, default=7, help='Timed samples per case (default: 7)')
+        parser.add_argument(
+            '--min-time', type=float, default=0.2,
+            help='Seconds each sample should take at least; sets the loop count (default: 0.2)'
+        )
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help='Baseline JSON file')
+        parser.add_argument('--save-baseline', action='store_true', help='Write the results as the new baseline')
+        parser.add_argument(
+            '--threshold', type=float, default=10.0,
+            help='Percent slowdown of the median reported as a regression (default: 10)'
+        )
+        parser.add_argument('--check', action='store_true', help='Exit with an error on any regression')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            User.objects.create_user(
+                username='bench', mobile_number='07000000000', password='bench-pass'
+            )
+            results = self.run_cases(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        baseline_path = Path(options['baseline'])
+        baseline = {}
+        if baseline_path.exists() and not options['save_baseline']:
+            baseline = json.loads(baseline_path.read_text())['cases']
+        regressions = self.report(results, baseline, options['threshold'])
+
+        if options['save_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps({
+                'python': sys.version.split()[0],
+                'machine': platform.machine(),
+                'cases': results,
+            }, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Saved baseline to {baseline_path}'))
+        if regressions and options['check']:
+            raise CommandError(f'{len(regressions)} case(s) regressed: {", ".join(regressions)}')
+
+    def run_cases(self, options):
+        results = {}
+        for name, func in build_cases().items():
+            if options['filter'] not in name:
+                continue
+            samples = time_case(func, options['repeat'], options['min_time'])
+            quartiles = statistics.quantiles(samples, n=4) if len(samples) > 1 else samples * 3
+            blocks, peak = allocations(func)
+            results[name] = {
+                'median_us': statistics.median(samples) * 1e6,
+                'iqr_us': (quartiles[2] - quartiles[0]) * 1e6,
+                'min_us': min(samples) * 1e6,
+                'alloc_blocks': blocks,
+                'peak_kib': peak / 1024,
+            }
+        return results
+
+    def report(self, results, baseline, threshold):
+        self.stdout.write(
+            f'{"case":<34} {"median":>12} {"± iqr":>10} {"blocks":>9} {"peak KiB":>10}  vs baseline'
+        )
+        regressions = []
+        for name, result in results.items():
+            line = (
+                f'{name:<34} {format_us(result["median_us"]):>12} '
+                f'{format_us(result["iqr_us"]):>10} {result["alloc_blocks"]:>9} '
+                f'{result["peak_kib"]:>10.1f}'
+            )
+            previous = baseline.get(name)
+            if previous:
+                change = (result['median_us'] / previous['median_us'] - 1) * 100
+                # Only call it a regression when it is also outside the noise
+                noisy = result['median_us'] - previous['median_us'] <= max(result['iqr_us'], previous['iqr_us'])
+                text = f'  {change:+6.1f}%  blocks {result["alloc_blocks"] - previous["alloc_blocks"]:+d}'
+                if change > threshold and not noisy:
+                    regressions.append(name)
+                    line += self.style.ERROR(text + '  REGRESSION')
+                elif change < -threshold and not noisy:
+                    line += self.style.SUCCESS(text)
+                else:
+                    line += text
+            self.stdout.write(line)
+        return regressions
+
+
+def format_us(value):
+    if value >= 1000:
+        return f'{value / 1000:.2f} ms'
+    return f'{value:.2f} µs'
@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from django.utils import timezone
+
+from api.models import OrderEvent
+
+
+class Command(BaseCommand):
+    help = 'Delete order change feed events older than the retention window'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=30,
+            help='Keep events from the last N days (default: 30)'
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        latest = OrderEvent.objects.aggregate(latest=Max('id'))['latest']
+        if latest is None:
+            self.stdout.write(self.style.WARNING('No order events to prune'))
+            return
+
+        # Always keep the newest event so the feed's lower bound stays known
+        # and clients with a pruned cursor are told to resync.
+        deleted, _ = OrderEvent.objects.filter(
+            created_at__lt=cutoff, id__lt=latest
+        ).delete()
+        self.stdout.write(
+            self.style.SUCCESS(f'Deleted {deleted} order event(s) older than {options["days"]} days')
+        )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api import eta
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the delivery-time estimate table from order history'
+
+    def handle(self, *args, **options):
+        cells = eta.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {cells} delivery estimate cells'))
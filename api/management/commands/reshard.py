@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import sharding
+from api.models import Order, User
+
+
+class Command(BaseCommand):
+    help = "Move users' orders between order shards"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='ID of a single user to move')
+        parser.add_argument('--to', help='Target shard alias for --user')
+        parser.add_argument(
+            '--rebalance', action='store_true',
+            help='Move every user to the shard their username hashes to'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would move')
+
+    def handle(self, *args, **options):
+        if not sharding.enabled():
+            raise CommandError('No order shards configured. Set DB_SHARDS=N first.')
+        if options['rebalance'] == (options['user'] is not None):
+            raise CommandError('Pass either --user ID --to ALIAS or --rebalance.')
+
+        if options['rebalance']:
+            users = User.objects.only('id', 'username', 'order_shard').order_by('id')
+            moves = [(user, sharding.placement(user.username)) for user in users.iterator()]
+        else:
+            if options['to'] not in sharding.shards():
+                raise CommandError(f'--to must be one of: {", ".join(sharding.shards())}')
+            try:
+                user = User.objects.only('id', 'username', 'order_shard').get(pk=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f'User {options["user"]} does not exist.')
+            moves = [(user, options['to'])]
+
+        moved_users = moved_orders = 0
+        for user, target in moves:
+            if (user.order_shard or sharding.PRIMARY) == target:
+                # Still sweep: an earlier move may have been interrupted.
+                stray = sum(sharding.fan_out(
+                    lambda alias: 0 if alias == target
+                    else Order.objects.filter(user_id=user.pk).count()
+                ))
+                if not stray:
+                    continue
+            if options['dry_run']:
+                self.stdout.write(f'Would move user {user.pk} ({user.username}) to {target}')
+                moved_users += 1
+                continue
+            moved_orders += sharding.move_user(user, target)
+            moved_users += 1
+
+        verb = 'Would move' if options['dry_run'] else 'Moved'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {moved_users} user(s)' + ('' if options['dry_run'] else f', {moved_orders} order(s)')
+        ))
@@ -0,0 +1,66 @@
+import signal
+import threading
+from datetime import timedelta
+from multiprocessing import get_context
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from api import tasks
+
+
+def _worker(stop, options):
+    # Never reuse a connection inherited from the parent process.
+    connections.close_all()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    return tasks.work(
+        stop,
+        batch_size=options['batch_size'],
+        poll_interval=options['poll_interval'],
+        stale_after=timedelta(seconds=options['stale_after']),
+        once=options['once'],
+    )
+
+
+class Command(BaseCommand):
+    help = 'Run background task workers for the database task queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes to run')
+        parser.add_argument('--batch-size', type=int, default=10, help='Tasks claimed per query')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--stale-after', type=int, default=600, help='Requeue tasks locked longer than this many seconds')
+        parser.add_argument('--once', action='store_true', help='Exit when no due tasks are left')
+
+    def handle(self, *args, **options):
+        if options['workers'] <= 1:
+            stop = threading.Event()
+            signal.signal(signal.SIGTERM, lambda *_: stop.set())
+            try:
+                processed = _worker(stop, options)
+            except KeyboardInterrupt:
+                return
+            self.stdout.write(self.style.SUCCESS(f'Processed {processed} task(s)'))
+            return
+
+        # Workers are forked so they inherit the configured Django setup.
+        mp = get_context('fork')
+        stop = mp.Event()
+        connections.close_all()
+        processes = [
+            mp.Process(target=_worker, args=(stop, options), name=f'task-worker-{i}')
+            for i in range(options['workers'])
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(self.style.SUCCESS(f'Started {len(processes)} workers'))
+
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            stop.set()
+            for process in processes:
+                process.join()
+        self.stdout.write(self.style.SUCCESS('Workers stopped'))
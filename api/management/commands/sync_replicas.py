@@ -0,0 +1,35 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database onto every local read replica'
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('No replicas configured. Set DB_REPLICAS=N first.')
+
+        aliases = ['default'] + settings.DATABASE_REPLICAS
+        if any(connections[alias].vendor != 'sqlite' for alias in aliases):
+            raise CommandError(
+                'sync_replicas only copies SQLite files; use the database '
+                "server's own replication for other backends."
+            )
+
+        # The backup API gives a consistent snapshot even while the primary
+        # is being written to.
+        source = sqlite3.connect(connections['default'].settings_dict['NAME'])
+        try:
+            for alias in settings.DATABASE_REPLICAS:
+                connections[alias].close()
+                target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(self.style.SUCCESS(f'Copied primary to {alias}'))
+        finally:
+            source.close()
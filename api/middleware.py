@@ -0,0 +1,106 @@
+"""
+Request middleware for the api app.
+"""
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import JsonResponse
+
+from . import admission
+from .db_routers import replica_reads_allowed
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_COOKIE = 'db_pin'
+
+
+def is_pinned(request):
+    """Whether the client wrote recently and must read from the primary."""
+    try:
+        pinned_until = float(request.COOKIES.get(PIN_COOKIE) or 0)
+    except ValueError:
+        # Not a cookie we set: treat the client as unpinned
+        return False
+    return pinned_until > time.time()
+
+
+class AdmissionControlMiddleware:
+    """
+    Shed API requests with ``503`` when their route class is full (see api.admission).
+    
+    Sits in front of the session and authentication middleware so a shed
+    request costs almost nothing.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        name = admission.route_class(request.path, request.method in SAFE_METHODS)
+        gate = admission.gates().get(name)
+        if gate is None:
+            return self.get_response(request)
+        reason = gate.acquire(admission.is_critical(request.path), admission.upstream_wait(request))
+        if reason is not None:
+            response = JsonResponse({'error': admission.BUSY_MESSAGE}, status=503)
+            response['Retry-After'] = str(gate.retry_after)
+            return response
+        try:
+            return self.get_response(request)
+        finally:
+            gate.release()
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Allow replica reads for safe requests and pin writers to the primary.
+
+    After a request that writes the client gets a short-lived cookie; while
+    it is present every read goes to the primary so users see their own
+    writes despite replication lag. Requests with an unsafe method count as
+    writes unless the view sets ``request.db_read_only``; a view that writes
+    during a safe request sets ``request.db_wrote``. When ``REPORT_DB_QUERY_COUNTS`` is on, the
+    number of queries per database alias is returned in ``X-DB-Queries``.
+    """
+
+    PIN_COOKIE = PIN_COOKIE
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = replica_reads_allowed.set(request.method in SAFE_METHODS and not is_pinned(request))
+        counts = {}
+        try:
+            if getattr(settings, 'REPORT_DB_QUERY_COUNTS', False):
+                with ExitStack() as stack:
+                    for alias in connections:
+                        stack.enter_context(
+                            connections[alias].execute_wrapper(self._counter(alias, counts))
+                        )
+                    response = self.get_response(request)
+                response['X-DB-Queries'] = ','.join(
+                    f'{alias}={count}' for alias, count in sorted(counts.items())
+                ) or 'none'
+            else:
+                response = self.get_response(request)
+        finally:
+            replica_reads_allowed.reset(token)
+
+        writes = getattr(request, 'db_wrote', False) or (
+            request.method not in SAFE_METHODS and not getattr(request, 'db_read_only', False)
+        )
+        if writes and settings.DATABASE_REPLICAS:
+            window = settings.REPLICA_PIN_SECONDS
+            response.set_cookie(
+                self.PIN_COOKIE, str(time.time() + window), max_age=window, httponly=True
+            )
+        return response
+
+    @staticmethod
+    def _counter(alias, counts):
+        def wrapper(execute, sql, params, many, context):
+            counts[alias] = counts.get(alias, 0) + 1
+            return execute(sql, params, many, context)
+        return wrapper
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-19 16:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import F
+
+
+def backfill_delivered_at(apps, schema_editor):
+    # Before delivered_at existed, updated_at was the best record of delivery.
+    Order = apps.get_model('api', 'Order')
+    Order.objects.filter(status='delivered', delivered_at__isnull=True).update(
+        delivered_at=F('updated_at')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_task'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='delivered_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_delivered_at, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='DeliveryEstimate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.SmallIntegerField()),
+                ('load_level', models.SmallIntegerField()),
+                ('histogram', models.JSONField(default=list)),
+                ('sample_count', models.PositiveIntegerField(default=0)),
+                ('p50', models.PositiveIntegerField(default=0)),
+                ('p80', models.PositiveIntegerField(default=0)),
+                ('p95', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='delivery_estimates', to='api.service')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='deliveryestimate',
+            constraint=models.UniqueConstraint(fields=('service', 'hour', 'load_level'), name='unique_delivery_estimate'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_delivery_estimates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='reserved_on',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='daily_capacity',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.CreateModel(
+            name='ServiceCapacity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('capacity', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('reserved', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='capacities', to='api.service')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='servicecapacity',
+            constraint=models.UniqueConstraint(fields=('service', 'day'), name='unique_service_capacity'),
+        ),
+    ]
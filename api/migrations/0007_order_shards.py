@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:19
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_service_capacity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderIdTicket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='order_shard',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='service',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='api.service'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='orders', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,112 @@
+from django.db import migrations, models
+from django.db.models import BigIntegerField, DecimalField, ExpressionWrapper, F, Value
+from django.db.models.functions import Cast, Round
+
+ORDER_AMOUNTS = ['service_cost', 'delivery_cost', 'total_cost']
+
+
+def to_minor(field):
+    return Cast(Round(F(field) * 100), BigIntegerField())
+
+
+def to_decimal(field):
+    # Divide by a non-integer so SQLite doesn't truncate to whole units
+    return ExpressionWrapper(
+        F(f'{field}_minor') / Value(100.0), output_field=DecimalField(max_digits=10, decimal_places=2)
+    )
+
+
+def services_to_minor(apps, schema_editor):
+    Service = apps.get_model('api', 'Service')
+    Service.objects.using(schema_editor.connection.alias).update(
+        price_per_unit_minor=to_minor('price_per_unit')
+    )
+
+
+def services_to_decimal(apps, schema_editor):
+    Service = apps.get_model('api', 'Service')
+    Service.objects.using(schema_editor.connection.alias).update(
+        price_per_unit=to_decimal('price_per_unit')
+    )
+
+
+def orders_to_minor(apps, schema_editor):
+    Order = apps.get_model('api', 'Order')
+    Order.objects.using(schema_editor.connection.alias).update(
+        **{f'{field}_minor': to_minor(field) for field in ORDER_AMOUNTS}
+    )
+
+
+def orders_to_decimal(apps, schema_editor):
+    Order = apps.get_model('api', 'Order')
+    Order.objects.using(schema_editor.connection.alias).update(
+        **{field: to_decimal(field) for field in ORDER_AMOUNTS}
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_order_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='service',
+            name='price_per_unit_minor',
+            field=models.BigIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='service_cost_minor',
+            field=models.BigIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='delivery_cost_minor',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_cost_minor',
+            field=models.BigIntegerField(default=0),
+            preserve_default=False,
+        ),
+        # Orders live on the order shards too; the hint lets the router run this there.
+        migrations.RunPython(services_to_minor, services_to_decimal, hints={'model_name': 'service'}),
+        migrations.RunPython(orders_to_minor, orders_to_decimal, hints={'model_name': 'order'}),
+        # Defaults for the decimal columns, so that unapplying can add them back
+        migrations.AlterField(
+            model_name='service',
+            name='price_per_unit',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='service_cost',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='total_cost',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RemoveField(
+            model_name='service',
+            name='price_per_unit',
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='service_cost',
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='delivery_cost',
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='total_cost',
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_money_minor_units'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ordertracking',
+            name='courier_latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ordertracking',
+            name='courier_longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ordertracking',
+            name='courier_pinged_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-19 18:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_courier_location'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'created_at'], name='api_order_user_id_d6ac48_idx'),
+        ),
+    ]
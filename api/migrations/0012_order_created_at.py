@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-19 18:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_order_user_created_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at'], name='api_order_created_7fb22c_idx'),
+        ),
+    ]
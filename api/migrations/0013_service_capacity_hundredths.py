@@ -0,0 +1,60 @@
+from django.db import migrations, models
+from django.db.models import BigIntegerField, DecimalField, ExpressionWrapper, F, Value
+from django.db.models.functions import Cast, Round
+
+QUANTITIES = ['capacity', 'reserved']
+
+
+def to_hundredths(apps, schema_editor):
+    ServiceCapacity = apps.get_model('api', 'ServiceCapacity')
+    ServiceCapacity.objects.using(schema_editor.connection.alias).update(**{
+        f'{field}_hundredths': Cast(Round(F(field) * 100), BigIntegerField()) for field in QUANTITIES
+    })
+
+
+def to_decimal(apps, schema_editor):
+    ServiceCapacity = apps.get_model('api', 'ServiceCapacity')
+    # Divide by a non-integer so SQLite doesn't truncate to whole units
+    ServiceCapacity.objects.using(schema_editor.connection.alias).update(**{
+        field: ExpressionWrapper(
+            F(f'{field}_hundredths') / Value(100.0),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        )
+        for field in QUANTITIES
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_order_created_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='servicecapacity',
+            name='capacity_hundredths',
+            field=models.BigIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='servicecapacity',
+            name='reserved_hundredths',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(to_hundredths, to_decimal, hints={'model_name': 'servicecapacity'}),
+        # A default for the capacity column, so that unapplying can add it back
+        migrations.AlterField(
+            model_name='servicecapacity',
+            name='capacity',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RemoveField(
+            model_name='servicecapacity',
+            name='capacity',
+        ),
+        migrations.RemoveField(
+            model_name='servicecapacity',
+            name='reserved',
+        ),
+    ]
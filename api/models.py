@@ -1,5 +1,9 @@
 from django.contrib.auth.models import AbstractUser, BaseUserManager
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, router
+from django.utils import timezone
+
+from . import money, sharding
 
 
 class UserManager(BaseUserManager):
@@ -17,6 +21,9 @@ class UserManager(BaseUserManager):
         if email:
             email = self.normalize_email(email)
         
+        if sharding.enabled():
+            extra_fields.setdefault('order_shard', sharding.placement(username))
+        
         user = self.model(
             username=username,
             mobile_number=mobile_number,
@@ -45,6 +52,7 @@ class User(AbstractUser):
     """Custom User model with mobile number"""
     mobile_number = models.CharField(max_length=20, unique=True)
     email = models.EmailField(blank=True, null=True)
+    order_shard = models.CharField(max_length=32, blank=True, default='')  # Database alias holding the user's orders; blank is 'default'
     
     objects = UserManager()
     
@@ -63,15 +71,63 @@ class Service(models.Model):
     service_type = models.CharField(max_length=20, choices=SERVICE_TYPES, unique=True)
     name_ar = models.CharField(max_length=100)  # Arabic name
     name_en = models.CharField(max_length=100)  # English name
-    price_per_unit = models.DecimalField(max_digits=10, decimal_places=2)  # Price per kWh/Liter/m³
+    price_per_unit_minor = models.BigIntegerField()  # Price per kWh/Liter/m³ in 1/100 IQD (see api.money)
     unit_name = models.CharField(max_length=50)  # kWh, Liter, m³
     unit_name_ar = models.CharField(max_length=50)  # Arabic unit name
+    daily_capacity = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True)  # Units deliverable per day; empty means unlimited
     
     def __str__(self):
         return f"{self.name_en} ({self.service_type})"
 
 
-class Order(models.Model):
+class OrderIdTicket(models.Model):
+    """Per-shard sequence behind globally unique order IDs (see api.sharding)"""
+    
+    @classmethod
+    def issue(cls, alias, count=1):
+        """Reserve ``count`` IDs on shard ``alias``."""
+        tickets = cls.objects.using(alias).bulk_create([cls() for _ in range(count)])
+        # Only the sequence matters; AUTOINCREMENT never reuses a number.
+        cls.objects.using(alias).filter(pk__lte=tickets[-1].pk).delete()
+        return [sharding.global_id(alias, ticket.pk) for ticket in tickets]
+
+
+class ShardedQuerySet(models.QuerySet):
+    
+    def create(self, **kwargs):
+        if self._db is not None or not sharding.enabled():
+            return super().create(**kwargs)
+        # Outside a request's shard context, put the row with its user or order.
+        obj = self.model(**kwargs)
+        self._for_write = True
+        obj.save(force_insert=True, using=router.db_for_write(self.model, instance=obj))
+        return obj
+
+
+class ShardedModel(models.Model):
+    """Stored on the owning user's order shard"""
+    
+    objects = ShardedQuerySet.as_manager()
+    
+    def save(self, *args, **kwargs):
+        if self.pk is None and sharding.enabled():
+            using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+            self.pk = OrderIdTicket.issue(using)[0]
+        super().save(*args, **kwargs)
+    
+    class Meta:
+        abstract = True
+
+
+class VersionConflict(Exception):
+    """An order changed since it was loaded, so saving it would overwrite that change"""
+    
+    def __init__(self, order):
+        super().__init__(f'Order #{order.pk} was modified since version {order.version} was loaded')
+        self.order = order
+
+
+class Order(ShardedModel):
     """Order model"""
     PAYMENT_METHODS = [
         ('cash', 'Cash'),
@@ -86,12 +142,23 @@ class Order(models.Model):
         ('cancelled', 'Cancelled'),
     ]
     
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
-    service = models.ForeignKey(Service, on_delete=models.CASCADE)
+    # Allowed status changes: current status -> statuses it may move to
+    STATUS_TRANSITIONS = {
+        'pending': {'confirmed', 'cancelled'},
+        'confirmed': {'in_progress', 'cancelled'},
+        'in_progress': {'delivered', 'cancelled'},
+        'delivered': set(),
+        'cancelled': set(),
+    }
+    
+    # Users and services stay on 'default' while orders may be on a shard
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders', db_constraint=False)
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, db_constraint=False)
     quantity = models.DecimalField(max_digits=10, decimal_places=2)  # Number of units (kWh, Liters, m³)
-    service_cost = models.DecimalField(max_digits=10, decimal_places=2)  # Cost of service
-    delivery_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0)  # Delivery cost
-    total_cost = models.DecimalField(max_digits=10, decimal_places=2)  # Total cost
+    # Amounts in 1/100 IQD (see api.money)
+    service_cost_minor = models.BigIntegerField()  # Cost of service
+    delivery_cost_minor = models.BigIntegerField(default=0)  # Delivery cost
+    total_cost_minor = models.BigIntegerField()  # Total cost
     location = models.TextField()  # Delivery location
     payment_method = models.CharField(max_length=10, choices=PAYMENT_METHODS)
     notes = models.TextField(blank=True, null=True)  # Special notes
@@ -99,20 +166,160 @@ class Order(models.Model):
     estimated_delivery_time = models.IntegerField(default=60)  # Estimated delivery time in minutes
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    delivered_at = models.DateTimeField(blank=True, null=True)  # Set when status becomes delivered
+    reserved_on = models.DateField(blank=True, null=True)  # Day whose service capacity this order holds
+    version = models.PositiveIntegerField(default=1)  # Incremented by every write; see _do_update()
     
     def __str__(self):
         return f"Order #{self.id} - {self.user.username} - {self.service.name_en}"
     
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'version'}
+        super().save(*args, **kwargs)
+    
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        """
+        Optimistic concurrency: write only if the row still has the version
+        this instance was loaded with, and bump it in the same UPDATE.
+        
+        Raises VersionConflict when someone else saved the order first.
+        """
+        loaded = self.version
+        values = [
+            (field, model, loaded + 1 if field.attname == 'version' else value)
+            for field, model, value in values
+        ]
+        updated = super()._do_update(
+            base_qs.filter(version=loaded), using, pk_val, values, update_fields, forced_update
+        )
+        if updated:
+            self.version = loaded + 1
+        elif base_qs.filter(pk=pk_val).exists():
+            raise VersionConflict(self)
+        return updated
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # A user's orders by date: order lists and monthly statements
+            models.Index(fields=['user', 'created_at']),
+            # The admin changelist's date hierarchy and newest-first pages
+            models.Index(fields=['created_at']),
+        ]
 
 
-class OrderTracking(models.Model):
+class OrderTracking(ShardedModel):
     """Order tracking information"""
     order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='tracking')
     remaining_delivery_time = models.IntegerField()  # Remaining time in minutes
     last_updated = models.DateTimeField(auto_now=True)
+    # Latest courier position, written in batches by api.pings
+    courier_latitude = models.FloatField(blank=True, null=True)
+    courier_longitude = models.FloatField(blank=True, null=True)
+    courier_pinged_at = models.DateTimeField(blank=True, null=True)  # When the courier's device took the fix
     
     def __str__(self):
         return f"Tracking for Order #{self.order.id}"
 
+
+class ServiceCapacity(models.Model):
+    """Capacity and reserved quantity of a service for one day (see api.capacity)"""
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='capacities')
+    day = models.DateField()
+    # Quantities in 1/100 of a unit, so api.capacity compares integers
+    capacity_hundredths = models.BigIntegerField()  # Copied from Service.daily_capacity, editable per day
+    reserved_hundredths = models.BigIntegerField(default=0)  # Held by active orders
+    
+    def __str__(self):
+        return (
+            f"{self.service.name_en} {self.day}: "
+            f"{money.to_string(self.reserved_hundredths)}/{money.to_string(self.capacity_hundredths)}"
+        )
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['service', 'day'], name='unique_service_capacity'),
+        ]
+
+
+class DeliveryEstimate(models.Model):
+    """Delivery duration histogram per service, hour of day and load level (see api.eta)"""
+    ANY = -1  # hour/load_level value of the rows aggregated over all hours or loads
+    
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='delivery_estimates')
+    hour = models.SmallIntegerField()  # Hour of day the order was placed, 0-23
+    load_level = models.SmallIntegerField()  # Bucket of recent orders for the service
+    histogram = models.JSONField(default=list)  # Deliveries per minute of duration
+    sample_count = models.PositiveIntegerField(default=0)
+    p50 = models.PositiveIntegerField(default=0)  # Duration quantiles in minutes
+    p80 = models.PositiveIntegerField(default=0)
+    p95 = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"ETA {self.service_id}/{self.hour}/{self.load_level}: {self.p50} min"
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['service', 'hour', 'load_level'], name='unique_delivery_estimate'
+            ),
+        ]
+
+
+class OrderEvent(models.Model):
+    """Append-only log of order changes; ``id`` is the sync sequence number"""
+    EVENT_TYPES = [
+        ('created', 'Created'),
+        ('updated', 'Updated'),
+        ('status', 'Status Changed'),
+        ('tracking', 'Tracking Updated'),
+        ('deleted', 'Deleted'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='order_events')
+    order_id = models.BigIntegerField()  # Kept after the order itself is deleted
+    event_type = models.CharField(max_length=20, choices=EVENT_TYPES)
+    data = models.JSONField(default=dict, encoder=DjangoJSONEncoder)  # Changed fields
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"Event #{self.id} - Order #{self.order_id} {self.event_type}"
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['user', 'id']),
+        ]
+
+
+class Task(models.Model):
+    """Background job stored in the database (see api.tasks)"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('failed', 'Failed'),
+    ]
+    
+    name = models.CharField(max_length=200)  # Dotted path of the task function
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder)  # Keyword arguments
+    priority = models.SmallIntegerField(default=0)  # Higher runs first
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)  # Not claimed before this time
+    claim_token = models.CharField(max_length=32, blank=True, default='')  # Set by the claiming worker
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"Task #{self.id} - {self.name} ({self.status})"
+    
+    class Meta:
+        ordering = ['-priority', 'run_after', 'id']
+        indexes = [
+            models.Index(fields=['status', 'priority', 'run_after']),
+        ]
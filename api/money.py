@@ -0,0 +1,47 @@
+"""
+Money as integer minor units.
+
+Prices and order amounts are stored as integers counting 1/100 of the
+currency unit (``*_minor`` fields), so SQL sums them as integers and reading
+a row creates no ``Decimal`` objects. Amounts are converted to decimals only
+at the edges: parsing client input and rendering ``"35000.00"`` strings.
+
+Rounding matches the decimal code it replaced: half to even, to two places.
+"""
+from decimal import Decimal, InvalidOperation
+
+MINOR_UNITS = 100
+TWO_PLACES = Decimal('0.01')
+
+
+def to_minor(amount):
+    """Minor units for a decimal amount (``Decimal``, ``str`` or ``int``)."""
+    amount = Decimal(amount)
+    if not amount.is_finite():
+        raise InvalidOperation(f'Invalid amount: {amount}')
+    return int(amount.quantize(TWO_PLACES) * MINOR_UNITS)
+
+
+def to_decimal(minor):
+    """The ``Decimal`` with two places for an amount in minor units."""
+    return Decimal(minor).scaleb(-2)
+
+
+def to_string(minor):
+    """Render minor units as a two-place decimal string, e.g. ``"35000.00"``."""
+    units, cents = divmod(abs(minor), MINOR_UNITS)
+    return f'{"-" if minor < 0 else ""}{units}.{cents:02d}'
+
+
+def divide_rounded(numerator, denominator):
+    """``numerator / denominator`` rounded half to even, in integers."""
+    quotient, remainder = divmod(numerator, denominator)
+    twice = 2 * remainder
+    if twice > denominator or (twice == denominator and quotient % 2):
+        quotient += 1
+    return quotient
+
+
+def multiply(price_minor, hundredths):
+    """Cost in minor units of ``hundredths``/100 units at ``price_minor`` each."""
+    return divide_rounded(price_minor * hundredths, MINOR_UNITS)
@@ -0,0 +1,322 @@
+"""
+Order workflow operations shared by the API views and the admin.
+"""
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import capacity, eta, money, sharding
+from .models import Order, OrderEvent, OrderIdTicket, OrderTracking
+
+# Statuses after which nothing is left to deliver
+TERMINAL_STATUSES = {'delivered', 'cancelled'}
+
+
+def quote(price_per_unit_minor, quantity, delivery_cost=0):
+    """
+    Price an order as ``(quantity, service_cost, delivery_cost, total_cost)``.
+
+    The amounts are in minor units (see ``api.money``), computed in integers
+    with the same half-to-even rounding to two places as before. ``quantity``
+    and ``delivery_cost`` may be strings or decimals; invalid input, including
+    NaN and infinity, raises ``InvalidOperation``.
+    """
+    quantity = Decimal(quantity)
+    if not quantity.is_finite():
+        raise InvalidOperation(f'Invalid quantity: {quantity}')
+    quantity = quantity.quantize(money.TWO_PLACES)
+    service_cost = money.multiply(price_per_unit_minor, int(quantity * 100))
+    delivery_cost = money.to_minor(delivery_cost)
+    return quantity, service_cost, delivery_cost, service_cost + delivery_cost
+
+
+def place_order(user, service, data):
+    """
+    Create an order with its tracking row and change-feed event.
+
+    ``data`` is validated ``CheckoutSerializer`` data. Everything is written
+    in one transaction with a fixed number of statements:
+
+    - ``UPDATE`` of the day's capacity, only for services with a limit;
+    - with order shards, one ticket ``INSERT`` and ``DELETE`` issuing both IDs;
+    - ``INSERT`` of the order, its tracking row and its event.
+
+    Nothing is read back: the returned order carries ``user`` and
+    ``service``, so serializing it runs no queries. The delivery estimate is
+    looked up first, so when ``api.eta`` reloads its cache the reads run
+    outside the transaction. Raises ``capacity.CapacityExceeded`` if the
+    day is full.
+    """
+    quantity, service_cost, delivery_cost, total_cost = quote(
+        service.price_per_unit_minor, data['quantity'], data.get('delivery_cost', 0)
+    )
+    # Learned from delivery history; the client value is only a fallback
+    # until there is enough data.
+    estimated_delivery_time = eta.estimate(service.id) or data.get('estimated_delivery_time', 60)
+    with sharding.atomic(sharding.shard_for_user(user)) as alias:
+        reserved_on = capacity.reserve(service, quantity)
+        order_id = tracking_id = None
+        if sharding.enabled():
+            order_id, tracking_id = OrderIdTicket.issue(alias, 2)
+        order = Order.objects.create(
+            id=order_id,
+            user=user,
+            service=service,
+            quantity=quantity,
+            service_cost_minor=service_cost,
+            delivery_cost_minor=delivery_cost,
+            total_cost_minor=total_cost,
+            location=data['location'],
+            payment_method=data['payment_method'],
+            notes=data.get('notes', ''),
+            reserved_on=reserved_on,
+            estimated_delivery_time=estimated_delivery_time,
+        )
+        order.tracking = OrderTracking.objects.create(
+            id=tracking_id,
+            order=order,
+            remaining_delivery_time=order.estimated_delivery_time,
+        )
+        record_event(order, 'created', order_created_data(order))
+    return order
+
+
+def order_created_data(order):
+    """The fields a syncing client needs to add a new order to its list."""
+    return {
+        'status': order.status,
+        'service_id': order.service_id,
+        'quantity': order.quantity,
+        'total_cost': money.to_string(order.total_cost_minor),
+        'estimated_delivery_time': order.estimated_delivery_time,
+        'created_at': order.created_at,
+    }
+
+
+def record_event(order, event_type, data=None):
+    """Append one entry to the order change feed."""
+    return OrderEvent.objects.create(
+        user_id=order.user_id,
+        order_id=order.id,
+        event_type=event_type,
+        data=data or {},
+    )
+
+
+def snapshot(order):
+    """``(status, service_id, reserved_on, quantity)`` of ``order`` before an edit, for ``save_edit``."""
+    return order.status, order.service_id, order.reserved_on, order.quantity
+
+
+def save_edit(order, loaded, status, save, fields):
+    """
+    Save an edit of one order, from the API or the admin.
+
+    ``loaded`` is ``snapshot(order)`` from before the edit, ``status`` the
+    status being saved and ``save()`` writes the edited order. In the same
+    transaction the order's capacity hold follows the edit (see
+    ``_rebook_capacity``) and a change-feed event lists ``fields``.
+    Delivering stamps ``delivered_at`` and queues the order for the ETA
+    tables. Raises ``capacity.CapacityExceeded`` if a new hold doesn't fit;
+    nothing is saved then.
+    """
+    previous_status = loaded[0]
+    delivered = status == 'delivered' and previous_status != 'delivered'
+    if delivered:
+        order.delivered_at = timezone.now()
+    with sharding.atomic(order._state.db):
+        save()
+        _rebook_capacity(order, loaded)
+        event_type = 'status' if order.status != previous_status else 'updated'
+        record_event(order, event_type, {field: getattr(order, field) for field in fields})
+    if delivered:
+        eta.record_deliveries.delay(order_ids=[order.id])
+    return order
+
+
+def _rebook_capacity(order, loaded):
+    """
+    Move the capacity hold of an edited order.
+
+    Cancelling gives the held quantity back, leaving 'cancelled' reserves
+    it again and a quantity or service change moves the hold, all on the
+    day first reserved. Orders that never held capacity are left alone.
+    """
+    previous_status, service_id, day, quantity = loaded
+    if day is None:
+        return
+    held = previous_status != 'cancelled'
+    holds = order.status != 'cancelled'
+    if held and holds and (order.service_id, order.quantity) == (service_id, quantity):
+        return
+    if held:
+        capacity.release(service_id, day, quantity)
+    if holds:
+        order.reserved_on = capacity.reserve(order.service, order.quantity, day)
+        order.save(update_fields=['reserved_on'])
+
+
+def allowed_sources(target):
+    """Return the statuses an order may be in to move to ``target``."""
+    return [
+        source for source, targets in Order.STATUS_TRANSITIONS.items()
+        if target in targets
+    ]
+
+
+def _transition_shard(alias, targets, now):
+    """
+    Apply ``targets`` to the orders stored on shard ``alias``.
+
+    Returns ``(current, by_target, conflicts)``: the locked rows found on this
+    shard, the IDs moved to each target status and the IDs a concurrent
+    writer changed between the read and the ``UPDATE``.
+    """
+    by_target = defaultdict(list)
+    conflicts = []
+    with transaction.atomic(using=alias):
+        current = {
+            row[0]: row[1:]
+            for row in Order.objects.select_for_update()
+            .filter(id__in=list(targets))
+            .values_list(
+                'id', 'status', 'estimated_delivery_time', 'tracking__id', 'user_id',
+                'service_id', 'reserved_on', 'quantity',
+            )
+        }
+        for order_id, row in current.items():
+            target = targets[order_id]
+            if row[0] != target and target in Order.STATUS_TRANSITIONS.get(row[0], ()):
+                by_target[target].append(order_id)
+
+        for target, ids in by_target.items():
+            values = {'status': target, 'updated_at': now, 'version': F('version') + 1}
+            if target == 'delivered':
+                values['delivered_at'] = now
+            updated = Order.objects.filter(
+                id__in=ids, status__in=allowed_sources(target)
+            ).update(**values)
+            if updated < len(ids):
+                # select_for_update() locks nothing on SQLite, so another
+                # writer may have moved some orders since they were read.
+                changed = set(
+                    Order.objects.filter(id__in=ids, status=target, updated_at=now)
+                    .values_list('id', flat=True)
+                )
+                conflicts += [order_id for order_id in ids if order_id not in changed]
+                ids[:] = [order_id for order_id in ids if order_id in changed]
+                if not ids:
+                    continue
+
+            tracking = {'last_updated': now}
+            if target in TERMINAL_STATUSES:
+                tracking['remaining_delivery_time'] = 0
+            OrderTracking.objects.filter(order_id__in=ids).update(**tracking)
+            missing = [order_id for order_id in ids if current[order_id][2] is None]
+            if not missing:
+                continue
+            # bulk_create skips ShardedModel.save(), so take the IDs here
+            tracking_ids = (
+                OrderIdTicket.issue(alias, len(missing)) if sharding.enabled()
+                else [None] * len(missing)
+            )
+            OrderTracking.objects.bulk_create([
+                OrderTracking(
+                    id=tracking_id,
+                    order_id=order_id,
+                    remaining_delivery_time=(
+                        0 if target in TERMINAL_STATUSES else current[order_id][1]
+                    ),
+                )
+                for tracking_id, order_id in zip(tracking_ids, missing)
+            ])
+    return current, by_target, conflicts
+
+
+def bulk_transition(changes):
+    """
+    Move many orders to new statuses in one transaction.
+
+    ``changes`` is an iterable of ``(order_id, target_status)`` pairs; if an
+    ID appears more than once the last target wins. Orders are grouped by
+    target status and each group is written with a single ``UPDATE``, guarded
+    by the state table so a concurrent change can't be overwritten. Tracking
+    rows are touched (and created when missing), cancelled orders give back
+    their reserved capacity and delivered orders are queued for the ETA
+    tables in the same transaction.
+
+    With order shards the orders are updated on every shard in parallel,
+    one transaction per shard, and the shards commit before the change-feed
+    events and capacity releases are written to ``'default'``.
+
+    Returns a list of per-ID outcome dicts in request order. An order moved
+    by someone else between the read and the ``UPDATE`` is reported as a
+    ``'conflict'`` and left as the other writer set it.
+    """
+    targets = {}
+    for order_id, target in changes:
+        targets.pop(order_id, None)
+        targets[order_id] = target
+
+    results = {}
+    now = timezone.now()
+
+    with transaction.atomic():
+        current = {}
+        by_target = defaultdict(list)
+        for shard_current, shard_moves, shard_conflicts in sharding.fan_out(
+            lambda alias: _transition_shard(alias, targets, now)
+        ):
+            current.update(shard_current)
+            for target, ids in shard_moves.items():
+                by_target[target] += ids
+            for order_id in shard_conflicts:
+                results[order_id] = {'id': order_id, 'result': 'conflict', 'to': targets[order_id]}
+
+        for order_id, target in targets.items():
+            if order_id in results:
+                continue
+            if order_id not in current:
+                results[order_id] = {'id': order_id, 'result': 'not_found'}
+                continue
+            source = current[order_id][0]
+            if source == target:
+                results[order_id] = {'id': order_id, 'result': 'unchanged', 'status': source}
+            elif target not in Order.STATUS_TRANSITIONS.get(source, ()):
+                results[order_id] = {
+                    'id': order_id,
+                    'result': 'invalid_transition',
+                    'from': source,
+                    'to': target,
+                }
+
+        events = []
+        for target, ids in by_target.items():
+            if target == 'delivered':
+                eta.record_deliveries.delay(order_ids=ids)
+            elif target == 'cancelled':
+                capacity.release_many(current[order_id][4:7] for order_id in ids)
+
+            event_data = {'status': target}
+            if target in TERMINAL_STATUSES:
+                event_data['remaining_delivery_time'] = 0
+            for order_id in ids:
+                events.append(OrderEvent(
+                    user_id=current[order_id][3],
+                    order_id=order_id,
+                    event_type='status',
+                    data=event_data,
+                ))
+                results[order_id] = {
+                    'id': order_id,
+                    'result': 'updated',
+                    'from': current[order_id][0],
+                    'to': target,
+                }
+
+        OrderEvent.objects.bulk_create(events)
+
+    return [results[order_id] for order_id in targets]
@@ -0,0 +1,124 @@
+"""
+Cache of serialized order detail payloads.
+
+``orders/{id}/`` and ``orders/{id}/track/`` look up the row's version first
+(``Order.updated_at``, plus ``OrderTracking.last_updated`` for tracking) and
+serve the payload stored under a key containing it. A changed order is looked
+up under a new key, so a stale payload is never served and nothing has to be
+invalidated; old entries fall out of the LRU or expire.
+
+There are two tiers: a bounded in-process LRU and, when
+``PAYLOAD_CACHE_ALIAS`` names a Django cache, a shared one behind it. Nested
+users and services carry no version of their own; ``PAYLOAD_CACHE_TIMEOUT``
+bounds how long a change to them can go unseen.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class PayloadCache:
+    """Bounded LRU with an optional shared Django cache behind it."""
+
+    def __init__(self, max_entries=1000, timeout=300, shared=None):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.shared = shared
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counts = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'evictions': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def _store(self, key, payload, expires):
+        with self._lock:
+            self._entries[key] = (payload, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counts['evictions'] += 1
+
+    def get_or_render(self, key, render):
+        """The payload stored under ``key``, calling ``render()`` on a miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                self._counts['local_hits'] += 1
+                return entry[0]
+        expires = now + self.timeout
+        if self.shared is not None:
+            payload = self.shared.get(key)
+            if payload is not None:
+                self._count('shared_hits')
+                self._store(key, payload, expires)
+                return payload
+        self._count('misses')
+        payload = render()
+        self._store(key, payload, expires)
+        if self.shared is not None:
+            self.shared.set(key, payload, self.timeout)
+        return payload
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+            size = len(self._entries)
+        lookups = counts['local_hits'] + counts['shared_hits'] + counts['misses']
+        return {
+            **counts,
+            'hit_ratio': round((lookups - counts['misses']) / lookups, 4) if lookups else None,
+            'size': size,
+            'max_entries': self.max_entries,
+            'shared': self.shared is not None,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._counts = dict.fromkeys(self._counts, 0)
+
+
+def spec_token(spec):
+    """A short, stable token for a ``FieldSpec`` (``None`` is the full payload)."""
+    if spec is None:
+        return 'all'
+    text = ','.join(sorted(spec.fields or ['*'])) + '|' + ','.join(sorted(spec.expand))
+    return hashlib.md5(text.encode()).hexdigest()[:16]
+
+
+def key(kind, object_id, versions, spec=None):
+    """Cache key for one object's payload at the given version timestamps."""
+    stamps = '.'.join(stamp.isoformat() for stamp in versions)
+    return f'payload:{kind}:{object_id}:{stamps}:{spec_token(spec)}'
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """The process-wide cache, configured from settings on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                alias = getattr(settings, 'PAYLOAD_CACHE_ALIAS', None)
+                _cache = PayloadCache(
+                    max_entries=getattr(settings, 'PAYLOAD_CACHE_MAX_ENTRIES', 1000),
+                    timeout=getattr(settings, 'PAYLOAD_CACHE_TIMEOUT', 300),
+                    shared=caches[alias] if alias else None,
+                )
+    return _cache
+
+
+def get_or_render(kind, object_id, versions, spec, render):
+    """Shortcut for ``get_cache().get_or_render(key(...), render)``."""
+    return get_cache().get_or_render(key(kind, object_id, versions, spec), render)
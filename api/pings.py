@@ -0,0 +1,282 @@
+"""
+Write-behind buffer for courier location pings.
+
+Couriers post a GPS fix every few seconds for each order they carry.
+Writing each one to ``OrderTracking`` would mean thousands of tiny
+transactions per second, most of them overwritten moments later. Instead
+each server process keeps only the latest ping per order in memory and
+writes the lot in batches: every ``flush_interval`` seconds from a
+background thread, or as soon as ``flush_size`` orders are waiting.
+
+A flush reads the orders of the batch with one ``SELECT`` per shard and
+writes their tracking rows with one prepared ``UPDATE`` run for every row,
+recomputing ``remaining_delivery_time`` from the order's estimate and the
+time of the fix; one ``INSERT`` in the same transaction appends a
+``'tracking'`` event per written order to the change feed. Pings are
+dropped, and counted, when the buffer holds ``max_pending`` orders
+already, when they are older than the ping already held (or written) for
+their order or than ``MAX_AGE``, when the order is finished or unknown,
+and when a flush fails: the next ping soon replaces a lost one. ``stats()`` feeds ``api/metrics/``.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from . import sharding
+from .models import Order, OrderEvent, OrderIdTicket, OrderTracking
+from .orders import TERMINAL_STATUSES
+
+logger = logging.getLogger('api.pings')
+
+# Fixes older than this when they arrive are no use for tracking
+MAX_AGE = timedelta(minutes=5)
+TRACKING_FIELDS = [
+    'courier_latitude', 'courier_longitude', 'courier_pinged_at',
+    'remaining_delivery_time', 'last_updated',
+]
+
+Ping = namedtuple('Ping', 'latitude longitude recorded_at')
+
+
+def remaining_minutes(created_at, estimate, at):
+    """Minutes left at ``at`` of an ``estimate`` for an order placed at ``created_at``."""
+    elapsed = int((at - created_at).total_seconds() // 60)
+    return max(0, estimate - elapsed)
+
+
+def update_statement(connection):
+    """``UPDATE`` of one tracking row's ``TRACKING_FIELDS``, by ID."""
+    quote = connection.ops.quote_name
+    fields = ', '.join(
+        f'{quote(OrderTracking._meta.get_field(name).column)} = %s' for name in TRACKING_FIELDS
+    )
+    return f'UPDATE {quote(OrderTracking._meta.db_table)} SET {fields} WHERE {quote("id")} = %s'
+
+
+def update_params(tracking, connection):
+    return [
+        OrderTracking._meta.get_field(name).get_db_prep_save(getattr(tracking, name), connection)
+        for name in TRACKING_FIELDS
+    ] + [tracking.id]
+
+
+def write(alias, pings, now=None):
+    """
+    Apply ``pings`` (order ID -> ``Ping``) to the tracking rows on ``alias``
+    and record a ``'tracking'`` event for each order written.
+
+    Orders stored elsewhere are ignored. Returns ``(found, written,
+    stale, inactive)``: the IDs of the orders found here and how many of
+    them were written, skipped for an older fix or skipped as finished.
+    """
+    now = now or timezone.now()
+    written, stale, inactive = [], 0, 0
+    missing, events = [], []
+    with sharding.atomic(alias):
+        rows = (
+            Order.objects.using(alias).select_for_update()
+            .filter(id__in=list(pings))
+            .values_list(
+                'id', 'user_id', 'status', 'created_at', 'estimated_delivery_time',
+                'tracking__id', 'tracking__courier_pinged_at',
+            )
+        )
+        found = set()
+        for order_id, user_id, status, created_at, estimate, tracking_id, pinged_at in rows:
+            found.add(order_id)
+            ping = pings[order_id]
+            if status in TERMINAL_STATUSES:
+                inactive += 1
+                continue
+            if pinged_at is not None and pinged_at >= ping.recorded_at:
+                # Another process already wrote a newer fix
+                stale += 1
+                continue
+            tracking = OrderTracking(
+                id=tracking_id,
+                order_id=order_id,
+                courier_latitude=ping.latitude,
+                courier_longitude=ping.longitude,
+                courier_pinged_at=ping.recorded_at,
+                remaining_delivery_time=remaining_minutes(created_at, estimate, ping.recorded_at),
+                last_updated=now,
+            )
+            (written if tracking_id is not None else missing).append(tracking)
+            events.append(OrderEvent(user_id=user_id, order_id=order_id, event_type='tracking', data={
+                name: getattr(tracking, name) for name in TRACKING_FIELDS if name != 'last_updated'
+            }))
+        if written:
+            # One prepared statement run for every row: bulk_update() would
+            # build a CASE per field and row, which costs more than the write.
+            connection = connections[alias]
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    update_statement(connection),
+                    [update_params(tracking, connection) for tracking in written],
+                )
+        if missing:
+            # bulk_create skips ShardedModel.save(), so take the IDs here
+            if sharding.enabled():
+                for tracking, tracking_id in zip(missing, OrderIdTicket.issue(alias, len(missing))):
+                    tracking.id = tracking_id
+            OrderTracking.objects.using(alias).bulk_create(missing)
+        OrderEvent.objects.bulk_create(events)
+    return found, len(written) + len(missing), stale, inactive
+
+
+class PingBuffer:
+    """Latest ping per order, written to the database in batches."""
+
+    def __init__(self, max_pending=10000, flush_size=500, flush_interval=2.0):
+        self.max_pending = max_pending
+        self.flush_size = min(flush_size, max_pending)
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._counts = {
+            'received': 0, 'coalesced': 0, 'flushes': 0, 'size_flushes': 0, 'written': 0,
+            'dropped_full': 0, 'dropped_stale': 0, 'dropped_inactive': 0,
+            'dropped_unknown': 0, 'dropped_error': 0, 'flush_errors': 0,
+        }
+        self._flush_ms = {'last': None, 'max': None, 'total': 0.0}
+
+    def add(self, order_id, latitude, longitude, recorded_at=None):
+        """
+        Buffer one ping, replacing an older one for the same order.
+
+        ``recorded_at`` is when the device took the fix (now if omitted;
+        clamped to now). Returns ``False`` if the ping was dropped.
+        """
+        now = timezone.now()
+        recorded_at = min(recorded_at or now, now)
+        with self._lock:
+            self._counts['received'] += 1
+            held = self._pending.get(order_id)
+            if recorded_at < now - MAX_AGE or (held is not None and held.recorded_at >= recorded_at):
+                self._counts['dropped_stale'] += 1
+                return False
+            if held is not None:
+                self._counts['coalesced'] += 1
+            elif len(self._pending) >= self.max_pending:
+                self._counts['dropped_full'] += 1
+                return False
+            self._pending[order_id] = Ping(latitude, longitude, recorded_at)
+            due = held is None and len(self._pending) == self.flush_size
+            if due:
+                self._counts['size_flushes'] += 1
+        if self.flush_interval > 0:
+            self._start()
+            if due:
+                self._wake.set()
+        elif due:
+            # No background thread: the request that fills the batch writes it
+            self.flush()
+        return True
+
+    def flush(self):
+        """Write the buffered pings now; returns the number of rows written."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            start = time.perf_counter()
+            try:
+                now = timezone.now()
+                results = sharding.fan_out(lambda alias: write(alias, pending, now))
+            except Exception:
+                logger.exception('Writing %d courier pings failed', len(pending))
+                with self._lock:
+                    self._counts['flush_errors'] += 1
+                    self._counts['dropped_error'] += len(pending)
+                return 0
+            elapsed = (time.perf_counter() - start) * 1000
+            found = set().union(*(result[0] for result in results))
+            written = sum(result[1] for result in results)
+            with self._lock:
+                self._counts['flushes'] += 1
+                self._counts['written'] += written
+                self._counts['dropped_stale'] += sum(result[2] for result in results)
+                self._counts['dropped_inactive'] += sum(result[3] for result in results)
+                self._counts['dropped_unknown'] += len(pending) - len(found)
+                self._flush_ms['last'] = elapsed
+                self._flush_ms['max'] = max(self._flush_ms['max'] or 0.0, elapsed)
+                self._flush_ms['total'] += elapsed
+            return written
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None or self._stopping:
+                return
+            self._thread = threading.Thread(target=self._run, name='courier-pings', daemon=True)
+            self._thread.start()
+        # Write what is left when the process exits
+        atexit.register(self.close)
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            finally:
+                # This thread owns its connections; don't leak them.
+                connections.close_all()
+
+    def close(self):
+        """Stop the background thread and write the buffered pings."""
+        self._stopping = True
+        thread = self._thread
+        if thread is not None:
+            self._wake.set()
+            thread.join()
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+            flush_ms = dict(self._flush_ms)
+            pending = len(self._pending)
+        return {
+            **counts,
+            'pending': pending,
+            'max_pending': self.max_pending,
+            'flush_size': self.flush_size,
+            'flush_interval': self.flush_interval,
+            'last_flush_ms': round(flush_ms['last'], 2) if flush_ms['last'] is not None else None,
+            'max_flush_ms': round(flush_ms['max'], 2) if flush_ms['max'] is not None else None,
+            'mean_flush_ms': (
+                round(flush_ms['total'] / counts['flushes'], 2) if counts['flushes'] else None
+            ),
+        }
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    """The process-wide buffer, configured from settings on first use."""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = PingBuffer(
+                    max_pending=getattr(settings, 'PING_BUFFER_MAX_PENDING', 10000),
+                    flush_size=getattr(settings, 'PING_FLUSH_SIZE', 500),
+                    flush_interval=getattr(settings, 'PING_FLUSH_INTERVAL', 2.0),
+                )
+    return _buffer
@@ -3,10 +3,27 @@ from decimal import Decimal
 from django.conf import settings
 from django.contrib.auth import authenticate
 from rest_framework import serializers
-from .models import User, Service, Order, OrderTracking
+from . import money
+from .models import User, Service, Order, OrderEvent, OrderTracking
+from .sparse import SparseFieldsMixin
 
 
-class UserSerializer(serializers.ModelSerializer):
+class MoneyField(serializers.DecimalField):
+    """An amount stored in minor units, rendered as a two-place decimal string"""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('max_digits', 10)
+        kwargs.setdefault('decimal_places', 2)
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        return money.to_minor(super().to_internal_value(data))
+
+    def to_representation(self, value):
+        return money.to_string(value)
+
+
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """User serializer"""
     class Meta:
         model = User
@@ -76,8 +93,9 @@ class SignInSerializer(serializers.Serializer):
         return attrs
 
 
-class ServiceSerializer(serializers.ModelSerializer):
+class ServiceSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Service serializer"""
+    price_per_unit = MoneyField(source='price_per_unit_minor')
     currency = serializers.SerializerMethodField()
 
     class Meta:
@@ -97,11 +115,14 @@ class ServiceSerializer(serializers.ModelSerializer):
         return getattr(settings, 'DEFAULT_CURRENCY', 'IQD')
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Order serializer"""
     service = ServiceSerializer(read_only=True)
     service_id = serializers.IntegerField(write_only=True)
     user = UserSerializer(read_only=True)
+    service_cost = MoneyField(source='service_cost_minor')
+    delivery_cost = MoneyField(source='delivery_cost_minor', required=False)
+    total_cost = MoneyField(source='total_cost_minor')
     currency = serializers.SerializerMethodField()
     
     class Meta:
@@ -109,9 +130,9 @@ class OrderSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'user', 'service', 'service_id', 'quantity', 'service_cost',
             'delivery_cost', 'total_cost', 'location', 'payment_method', 'currency',
-            'notes', 'status', 'estimated_delivery_time', 'created_at', 'updated_at'
+            'notes', 'status', 'estimated_delivery_time', 'created_at', 'updated_at', 'version'
         ]
-        read_only_fields = ['id', 'user', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'user', 'created_at', 'updated_at', 'version']
     
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
@@ -121,14 +142,51 @@ class OrderSerializer(serializers.ModelSerializer):
         return getattr(settings, 'DEFAULT_CURRENCY', 'IQD')
 
 
-class OrderTrackingSerializer(serializers.ModelSerializer):
+class CompactOrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """Order serializer for side-loaded responses (see api.compact)"""
+    user_id = serializers.IntegerField(read_only=True)
+    service_id = serializers.IntegerField(read_only=True)
+    service_cost = MoneyField(source='service_cost_minor', read_only=True)
+    delivery_cost = MoneyField(source='delivery_cost_minor', read_only=True)
+    total_cost = MoneyField(source='total_cost_minor', read_only=True)
+    currency = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Order
+        fields = [
+            'id', 'user_id', 'service_id', 'quantity', 'service_cost',
+            'delivery_cost', 'total_cost', 'location', 'payment_method', 'currency',
+            'notes', 'status', 'estimated_delivery_time', 'created_at', 'updated_at', 'version'
+        ]
+        read_only_fields = fields
+    
+    def get_currency(self, obj):
+        return getattr(settings, 'DEFAULT_CURRENCY', 'IQD')
+
+
+class OrderTrackingSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Order tracking serializer"""
     order = OrderSerializer(read_only=True)
     
     class Meta:
         model = OrderTracking
-        fields = ['id', 'order', 'remaining_delivery_time', 'last_updated']
-        read_only_fields = ['id', 'last_updated']
+        fields = [
+            'id', 'order', 'remaining_delivery_time', 'last_updated',
+            'courier_latitude', 'courier_longitude', 'courier_pinged_at',
+        ]
+        read_only_fields = [
+            'id', 'last_updated', 'courier_latitude', 'courier_longitude', 'courier_pinged_at',
+        ]
+
+
+class OrderEventSerializer(serializers.ModelSerializer):
+    """Order change feed entry serializer"""
+    seq = serializers.IntegerField(source='id', read_only=True)
+    
+    class Meta:
+        model = OrderEvent
+        fields = ['seq', 'order_id', 'event_type', 'data', 'created_at']
+        read_only_fields = fields
 
 
 class CheckoutSerializer(serializers.Serializer):
@@ -147,3 +205,64 @@ class CheckoutSerializer(serializers.Serializer):
     )
     estimated_delivery_time = serializers.IntegerField(default=60)
 
+
+class OrderStatusChangeSerializer(serializers.Serializer):
+    """A single requested order status change"""
+    id = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=Order.ORDER_STATUS)
+
+
+class BulkOrderStatusSerializer(serializers.Serializer):
+    """Bulk order status transition serializer"""
+    MAX_TRANSITIONS = 1000
+
+    transitions = OrderStatusChangeSerializer(many=True, allow_empty=False)
+
+    def validate_transitions(self, value):
+        if len(value) > self.MAX_TRANSITIONS:
+            raise serializers.ValidationError(
+                f"At most {self.MAX_TRANSITIONS} transitions per request."
+            )
+        return value
+
+
+class CourierPingSerializer(serializers.Serializer):
+    """One courier location fix for an order"""
+    order_id = serializers.IntegerField(min_value=1)
+    latitude = serializers.FloatField(min_value=-90, max_value=90)
+    longitude = serializers.FloatField(min_value=-180, max_value=180)
+    recorded_at = serializers.DateTimeField(required=False)  # When the device took the fix; defaults to now
+
+
+class CourierPingBatchSerializer(serializers.Serializer):
+    """Courier location pings serializer"""
+    MAX_PINGS = 500
+
+    pings = CourierPingSerializer(many=True, allow_empty=False)
+
+    def validate_pings(self, value):
+        if len(value) > self.MAX_PINGS:
+            raise serializers.ValidationError(f"At most {self.MAX_PINGS} pings per request.")
+        return value
+
+
+class BatchSubrequestSerializer(serializers.Serializer):
+    """One request inside a batch"""
+    method = serializers.ChoiceField(
+        choices=['GET', 'HEAD', 'OPTIONS', 'POST', 'PUT', 'PATCH', 'DELETE'], default='GET'
+    )
+    path = serializers.CharField()  # Relative to /api/, e.g. /orders/?fields=id
+    body = serializers.JSONField(required=False)
+    headers = serializers.DictField(child=serializers.CharField(), required=False)
+
+
+class BatchSerializer(serializers.Serializer):
+    """Batch request serializer"""
+    requests = BatchSubrequestSerializer(many=True, allow_empty=False)
+    
+    def validate_requests(self, value):
+        if len(value) > settings.BATCH_MAX_REQUESTS:
+            raise serializers.ValidationError(
+                f'A batch may contain at most {settings.BATCH_MAX_REQUESTS} requests.'
+            )
+        return value
@@ -0,0 +1,167 @@
+"""
+User-sharded storage for orders.
+
+``Order`` and ``OrderTracking`` rows live on one of ``settings.ORDER_SHARDS``
+per user; ``User.order_shard`` records which (blank means ``'default'``).
+New users are placed by a hash of their username. Everything else,
+including users and services, stays on ``'default'``, so foreign keys from
+orders to users and services are not enforced by the database.
+
+``api.db_routers.ShardRouter`` sends order queries to the shard set with
+``use_shard()`` (``OrderViewSet`` does this for the requesting user) or
+implied by a model instance. Code that works on orders of many users uses
+``fan_out()`` to query every shard in parallel.
+
+With sharding enabled, order and tracking IDs are
+``(shard position + 1) << 48 | n`` where ``n`` comes from the shard's
+``OrderIdTicket`` sequence. They stay unique when users move between shards
+and never collide with the smaller IDs issued before sharding.
+"""
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections, transaction
+
+PRIMARY = 'default'
+ID_SHARD_SHIFT = 48
+# api models stored on the order shards
+SHARDED_MODELS = {'order', 'ordertracking', 'orderidticket'}
+
+# Shard used by order queries that carry no instance hint
+current_shard = ContextVar('current_shard', default=None)
+
+
+def shards():
+    return getattr(settings, 'ORDER_SHARDS', None) or [PRIMARY]
+
+
+def enabled():
+    return len(shards()) > 1
+
+
+def is_sharded(model):
+    return model._meta.app_label == 'api' and model._meta.model_name in SHARDED_MODELS
+
+
+def placement(username):
+    """The shard a new user with ``username`` is assigned to."""
+    aliases = shards()
+    return aliases[zlib.crc32(username.encode()) % len(aliases)]
+
+
+def shard_for_user(user):
+    """Shard holding ``user``'s orders (a User instance or ID)."""
+    if not enabled():
+        return PRIMARY
+    if not hasattr(user, 'order_shard'):
+        from .models import User
+        user = User.objects.using(PRIMARY).only('order_shard').get(pk=user)
+    return user.order_shard or PRIMARY
+
+
+def global_id(alias, number):
+    """Order/tracking ID for ticket ``number`` issued by shard ``alias``."""
+    return ((shards().index(alias) + 1) << ID_SHARD_SHIFT) | number
+
+
+@contextmanager
+def use_shard(alias):
+    """Route order queries without an instance hint to ``alias``."""
+    token = current_shard.set(alias)
+    try:
+        yield alias
+    finally:
+        current_shard.reset(token)
+
+
+@contextmanager
+def atomic(alias=None):
+    """
+    A transaction on ``'default'`` and, when different, on the order shard.
+
+    The two commit one after the other, not atomically; the shard commits
+    first so a failure on it also rolls back the ``'default'`` work.
+    """
+    alias = alias or current_shard.get() or PRIMARY
+    with ExitStack() as stack:
+        stack.enter_context(transaction.atomic(using=PRIMARY))
+        if alias != PRIMARY:
+            stack.enter_context(transaction.atomic(using=alias))
+        yield alias
+
+
+def _on_shard(func, alias, close):
+    try:
+        with use_shard(alias):
+            return func(alias)
+    finally:
+        if close:
+            # Worker threads own their connections; don't leak them.
+            connections.close_all()
+
+
+def fan_out(func, aliases=None):
+    """
+    Call ``func(alias)`` for every shard, in parallel threads.
+
+    Returns the results in shard order. With a single shard ``func`` runs
+    in the calling thread, inside any transaction it has open.
+    """
+    aliases = list(aliases or shards())
+    if len(aliases) == 1:
+        return [_on_shard(func, aliases[0], close=False)]
+    workers = max(1, min(len(aliases), getattr(settings, 'ORDER_SHARD_WORKERS', len(aliases))))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_on_shard, func, alias, True) for alias in aliases]
+        return [future.result() for future in futures]
+
+
+def locate(model, pk):
+    """The shard that stores ``model`` row ``pk``, or ``None``."""
+    found = fan_out(lambda alias: model.objects.using(alias).filter(pk=pk).exists())
+    return next((alias for alias, hit in zip(shards(), found) if hit), None)
+
+
+def move_user(user, target):
+    """
+    Move ``user``'s orders and tracking rows to shard ``target``.
+
+    Rows are copied with their IDs, the user is switched over, and any row
+    written to an old shard meanwhile is swept across in a second pass.
+    Returns the number of orders moved.
+    """
+    from .models import Order, OrderTracking, User
+
+    def sweep():
+        moved = 0
+        for source in shards():
+            if source == target:
+                continue
+            # The copy commits before the delete, so a failure leaves duplicates, never gaps.
+            with transaction.atomic(using=source), transaction.atomic(using=target):
+                orders = list(Order.objects.using(source).select_for_update().filter(user_id=user.pk))
+                if not orders:
+                    continue
+                tracking = list(OrderTracking.objects.using(source).filter(order__in=orders))
+                # ignore_conflicts: rows left over from an interrupted move
+                Order.objects.using(target).bulk_create(orders, ignore_conflicts=True)
+                OrderTracking.objects.using(target).bulk_create(tracking, ignore_conflicts=True)
+                # Tracking rows go with their orders (on_delete=CASCADE)
+                Order.objects.using(source).filter(pk__in=[order.pk for order in orders]).delete()
+                moved += len(orders)
+        return moved
+
+    moved = sweep()
+    User.objects.using(PRIMARY).filter(pk=user.pk).update(order_shard=target)
+    return moved + sweep()
+
+
+def delete_user_orders(sender, instance, using, **kwargs):
+    """pre_delete handler: the cascade from a user only reaches ``'default'``."""
+    from .models import Order
+    alias = shard_for_user(instance)
+    if alias != using:
+        Order.objects.using(alias).filter(user_id=instance.pk).delete()
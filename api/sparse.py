@@ -0,0 +1,158 @@
+"""
+Sparse fieldsets for read endpoints.
+
+``?fields=id,status,order.remaining_delivery_time`` limits a response to the
+listed fields (dotted names reach into nested objects) and
+``?expand=service,order.user`` chooses which relations are rendered as nested
+objects. Once either parameter is given, relations that are not expanded are
+rendered as their primary key. Without them responses are unchanged.
+Names the serializer does not render, and expansions of fields that are
+not relations, fail with a ``ValidationError`` (``400``).
+
+``narrow_queryset`` turns the same request into ``select_related``/``only``
+so the database only loads the columns the response will contain.
+Relations from an order to a user or service cross databases when orders
+are sharded; those are loaded with ``prefetch_related`` instead.
+"""
+from rest_framework import serializers
+
+from . import sharding
+
+
+def _split(value):
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class FieldSpec:
+    """The fields and expansions requested for one serializer level."""
+
+    def __init__(self, fields=None, expand=(), prefix=''):
+        self.fields = set(fields) if fields else None
+        self.expand = set(expand)
+        # Dotted path of this level, for error messages
+        self.prefix = prefix
+
+    @classmethod
+    def from_request(cls, request):
+        """Parse ``fields``/``expand`` query parameters; ``None`` if absent."""
+        params = request.query_params
+        if 'fields' not in params and 'expand' not in params:
+            return None
+        return cls(_split(params.get('fields', '')), _split(params.get('expand', '')))
+
+    def includes(self, name):
+        if self.fields is None:
+            return True
+        return any(field.split('.', 1)[0] == name for field in self.fields)
+
+    def expands(self, name):
+        prefix = name + '.'
+        return (
+            any(item.split('.', 1)[0] == name for item in self.expand)
+            or any(field.startswith(prefix) for field in self.fields or ())
+        )
+
+    def child(self, name):
+        """The spec for the nested serializer rendered under ``name``."""
+        prefix = name + '.'
+        return FieldSpec(
+            [field[len(prefix):] for field in self.fields or () if field.startswith(prefix)],
+            [item[len(prefix):] for item in self.expand if item.startswith(prefix)],
+            self.prefix + prefix,
+        )
+
+    def errors(self, fields):
+        """Messages for requested names that are not among ``fields``, by parameter."""
+        def known(name, nested):
+            head, _, rest = name.partition('.')
+            field = fields.get(head)
+            if field is None or field.write_only:
+                return False
+            return isinstance(field, SparseFieldsMixin) or not (rest or nested)
+
+        errors = {}
+        for param, names, nested in [('fields', self.fields or (), False), ('expand', self.expand, True)]:
+            unknown = sorted(name for name in names if not known(name, nested))
+            if unknown:
+                errors[param] = [f'Unknown field: {self.prefix}{name}' for name in unknown]
+        return errors
+
+
+class SparseFieldsMixin:
+    """
+    Serializer mixin that applies a ``FieldSpec`` passed as ``field_spec``.
+
+    Nested serializers that also use the mixin receive the child spec; nested
+    relations that are not expanded become read-only primary key fields.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.field_spec = kwargs.pop('field_spec', None)
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        spec = self.field_spec
+        if spec is None:
+            return fields
+        errors = spec.errors(fields)
+        if errors:
+            raise serializers.ValidationError(errors)
+
+        for name in list(fields):
+            field = fields[name]
+            if not spec.includes(name) and not field.write_only:
+                del fields[name]
+            elif isinstance(field, SparseFieldsMixin):
+                if spec.expands(name):
+                    field.field_spec = spec.child(name)
+                else:
+                    kwargs = {'source': field.source} if field.source != name else {}
+                    fields[name] = serializers.PrimaryKeyRelatedField(read_only=True, **kwargs)
+        return fields
+
+
+def _crosses_shards(model, related_model):
+    return sharding.enabled() and sharding.is_sharded(model) != sharding.is_sharded(related_model)
+
+
+def _projection(serializer, prefix=''):
+    """Collect ``only()``, ``select_related()`` and ``prefetch_related()`` paths."""
+    model = serializer.Meta.model
+    columns = {field.name for field in model._meta.concrete_fields}
+    columns |= {field.attname for field in model._meta.concrete_fields}
+    only = [prefix + model._meta.pk.name]
+    related = []
+    prefetch = []
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+        if isinstance(field, SparseFieldsMixin):
+            path = prefix + field.source
+            only.append(path)
+            child_only, child_related, child_prefetch = _projection(field, path + '__')
+            if _crosses_shards(model, field.Meta.model):
+                # A separate query on the other database loads whole rows.
+                prefetch += [path] + child_related + child_prefetch
+                continue
+            related.append(path)
+            only += child_only
+            related += child_related
+            prefetch += child_prefetch
+        elif field.source in columns:
+            only.append(prefix + field.source)
+    return only, related, prefetch
+
+
+def narrow_queryset(queryset, serializer_class, spec):
+    """Load only what ``serializer_class`` will render for ``spec``."""
+    if spec is None:
+        # Full output: still join the nested relations instead of N+1 lookups.
+        related, prefetch = _projection(serializer_class())[1:]
+    else:
+        only, related, prefetch = _projection(serializer_class(field_spec=spec))
+        queryset = queryset.only(*only)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    # select_related() without arguments would follow every foreign key.
+    return queryset.select_related(*related) if related else queryset
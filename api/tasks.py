@@ -0,0 +1,164 @@
+"""
+A small database-backed task queue.
+
+Declare work with ``@task`` and enqueue it from a view::
+
+    @task(priority=5)
+    def notify_customer(order_id):
+        ...
+
+    notify_customer.delay(order_id=order.id)
+
+``delay`` inserts a ``Task`` row in the caller's transaction, so work queued
+inside ``transaction.atomic()`` only becomes visible to workers once that
+transaction commits and disappears if it rolls back. Workers started with
+``python manage.py run_workers`` claim batches of due tasks with a guarded
+``UPDATE``, which is safe with any number of concurrent workers, and retry
+failures with exponential backoff.
+
+A task runs in a transaction on ``'default'`` that also deletes its row, so
+its writes there commit exactly when the task is marked done: a task that
+fails, or whose row was requeued by ``requeue_stale`` while it ran, leaves
+nothing behind and runs again. Keep task transactions short; on SQLite
+they hold the database's write lock. Writes to other databases (order
+shards) are not covered and must be safe to repeat.
+"""
+import logging
+import random
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Task
+
+logger = logging.getLogger('api.tasks')
+
+CLAIM_ORDER = ['-priority', 'run_after', 'id']
+RETRY_BASE_SECONDS = 5
+RETRY_MAX_SECONDS = 3600
+
+
+def task(priority=0, max_attempts=5):
+    """Register a function as a task and give it a ``delay`` method."""
+    def decorator(func):
+        func.task_name = f'{func.__module__}.{func.__qualname__}'
+        func.task_priority = priority
+        func.task_max_attempts = max_attempts
+        func.delay = lambda **payload: enqueue(func, payload)
+        return func
+    return decorator
+
+
+def enqueue(func, payload=None, priority=None, delay=None, max_attempts=None):
+    """Queue ``func(**payload)``; ``delay`` is a timedelta or seconds."""
+    if not hasattr(func, 'task_name'):
+        raise ValueError(f'{func!r} is not registered with @task')
+    if isinstance(delay, (int, float)):
+        delay = timedelta(seconds=delay)
+    return Task.objects.create(
+        name=func.task_name,
+        payload=payload or {},
+        priority=func.task_priority if priority is None else priority,
+        max_attempts=max_attempts or func.task_max_attempts,
+        run_after=timezone.now() + (delay or timedelta()),
+    )
+
+
+def claim(batch_size):
+    """
+    Atomically take up to ``batch_size`` due tasks for this worker.
+
+    The ``status='queued'`` guard on the UPDATE means a row picked by two
+    workers at once is only claimed by the first; the other simply gets a
+    smaller batch. No row locks are held between statements.
+    """
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    due = (
+        Task.objects.filter(status='queued', run_after__lte=now)
+        .order_by(*CLAIM_ORDER)
+        .values('id')[:batch_size]
+    )
+    Task.objects.filter(id__in=due, status='queued').update(
+        status='running',
+        claim_token=token,
+        locked_at=now,
+        attempts=F('attempts') + 1,
+    )
+    return list(Task.objects.filter(claim_token=token, status='running').order_by(*CLAIM_ORDER))
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter for the given attempt number."""
+    seconds = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    return timedelta(seconds=seconds * random.uniform(0.5, 1.0))
+
+
+class ClaimLost(Exception):
+    """The task's row was requeued while it ran, so its work is rolled back."""
+
+
+def run(job):
+    """Execute one claimed task and record the outcome."""
+    try:
+        func = import_string(job.name)
+        if getattr(func, 'task_name', None) != job.name:
+            raise ValueError(f'{job.name} is not registered with @task')
+        with transaction.atomic():
+            func(**job.payload)
+            # Finished tasks are deleted so the table only holds pending work.
+            deleted, _ = Task.objects.filter(id=job.id, claim_token=job.claim_token).delete()
+            if not deleted:
+                raise ClaimLost(job.id)
+    except ClaimLost:
+        logger.warning('task requeued while running', extra={'task_id': job.id, 'task': job.name})
+        return False
+    except Exception:
+        error = traceback.format_exc()
+        remaining = job.attempts < job.max_attempts
+        Task.objects.filter(id=job.id, claim_token=job.claim_token).update(
+            status='queued' if remaining else 'failed',
+            run_after=timezone.now() + retry_delay(job.attempts),
+            claim_token='',
+            locked_at=None,
+            last_error=error,
+        )
+        logger.warning('task failed', extra={
+            'task_id': job.id, 'task': job.name,
+            'attempts': job.attempts, 'will_retry': remaining,
+        })
+        return False
+    return True
+
+
+def requeue_stale(timeout):
+    """Release tasks whose worker died mid-run (locked longer than ``timeout``)."""
+    cutoff = timezone.now() - timeout
+    stale = Task.objects.filter(status='running', locked_at__lt=cutoff)
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status='failed', claim_token='', locked_at=None, last_error='Worker timed out'
+    )
+    requeued = stale.update(status='queued', claim_token='', locked_at=None)
+    return requeued + failed
+
+
+def work(stop, batch_size=10, poll_interval=1.0, stale_after=timedelta(minutes=10), once=False):
+    """Claim and run tasks until ``stop`` (a threading/multiprocessing Event) is set."""
+    processed = 0
+    while not stop.is_set():
+        requeue_stale(stale_after)
+        jobs = claim(batch_size)
+        if not jobs:
+            if once:
+                break
+            stop.wait(poll_interval)
+            continue
+        for job in jobs:
+            run(job)
+            processed += 1
+    return processed
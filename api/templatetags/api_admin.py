@@ -0,0 +1,160 @@
+"""
+Admin changelist tags for large tables.
+
+``indexed_date_hierarchy`` renders the drill-down of the admin's
+``date_hierarchy`` tag, which runs SELECT DISTINCT over a date function of
+every row it links to. Here each year, month or day with rows costs one
+seek in the date field's index instead.
+"""
+import datetime
+
+from django.conf import settings
+from django.contrib.admin.templatetags.base import InclusionAdminNode
+from django.contrib.admin.utils import get_fields_from_path
+from django.db import models
+from django.template import Library
+from django.utils import formats, timezone
+from django.utils.text import capfirst
+from django.utils.translation import gettext as _
+
+register = Library()
+
+
+def period_start(day, kind):
+    if kind == 'year':
+        return datetime.date(day.year, 1, 1)
+    if kind == 'month':
+        return datetime.date(day.year, day.month, 1)
+    return datetime.date(day.year, day.month, day.day)
+
+
+def next_period(day, kind):
+    if kind == 'year':
+        return day.replace(year=day.year + 1)
+    if kind == 'month':
+        return (day + datetime.timedelta(days=32)).replace(day=1)
+    return day + datetime.timedelta(days=1)
+
+
+def periods(queryset, field_name, kind, start=None, end=None):
+    """
+    First days of the years, months or days (``kind``) between ``start``
+    and ``end`` in which ``queryset`` has rows.
+    
+    Each query takes the earliest row from the start of the period after
+    the last one found, so it costs one index seek per period with rows.
+    """
+    field = get_fields_from_path(queryset.model, field_name)[-1]
+    is_datetime = isinstance(field, models.DateTimeField)
+    
+    def bound(day):
+        if not is_datetime:
+            return day
+        value = datetime.datetime.combine(day, datetime.time())
+        return timezone.make_aware(value) if settings.USE_TZ else value
+    
+    rows = queryset.filter(**{f'{field_name}__isnull': False})
+    # SQLite seeks with the first bound it finds on the column, so the
+    # period's bounds have to come before the changelist's own date range.
+    leading = queryset.model._base_manager.db_manager(queryset.db).all()
+    if queryset.query.distinct:
+        leading = leading.distinct()
+    bounds = {} if end is None else {f'{field_name}__lt': bound(end)}
+    found = []
+    while True:
+        if start is not None:
+            bounds[f'{field_name}__gte'] = bound(start)
+        value = (
+            (leading.filter(**bounds) & rows)
+            .order_by(field_name)
+            .values_list(field_name, flat=True)
+            .first()
+        )
+        if value is None:
+            return found
+        if is_datetime and timezone.is_aware(value):
+            value = timezone.localtime(value)
+        found.append(period_start(value, kind))
+        start = next_period(found[-1], kind)
+
+
+def indexed_date_hierarchy(cl):
+    """Same context as ``admin_list.date_hierarchy``, from ``periods()``."""
+    field_name = cl.date_hierarchy
+    year_field = f'{field_name}__year'
+    month_field = f'{field_name}__month'
+    day_field = f'{field_name}__day'
+    year_lookup = cl.params.get(year_field)
+    month_lookup = cl.params.get(month_field)
+    day_lookup = cl.params.get(day_field)
+    
+    def link(filters):
+        return cl.get_query_string(filters, [f'{field_name}__'])
+    
+    years = months = None
+    if not (year_lookup or month_lookup or day_lookup):
+        # Start at the months of a single year, or the days of a single month
+        years = periods(cl.queryset, field_name, 'year')
+        if len(years) == 1:
+            year_lookup = years[0].year
+            months = periods(cl.queryset, field_name, 'month', years[0], next_period(years[0], 'year'))
+            if len(months) == 1:
+                month_lookup = months[0].month
+    
+    if year_lookup and month_lookup and day_lookup:
+        day = datetime.date(int(year_lookup), int(month_lookup), int(day_lookup))
+        return {
+            'show': True,
+            'back': {
+                'link': link({year_field: year_lookup, month_field: month_lookup}),
+                'title': capfirst(formats.date_format(day, 'YEAR_MONTH_FORMAT')),
+            },
+            'choices': [{'title': capfirst(formats.date_format(day, 'MONTH_DAY_FORMAT'))}],
+        }
+    if year_lookup and month_lookup:
+        month = datetime.date(int(year_lookup), int(month_lookup), 1)
+        days = periods(cl.queryset, field_name, 'day', month, next_period(month, 'month'))
+        return {
+            'show': True,
+            'back': {'link': link({year_field: year_lookup}), 'title': str(year_lookup)},
+            'choices': [
+                {
+                    'link': link({year_field: year_lookup, month_field: month_lookup, day_field: day.day}),
+                    'title': capfirst(formats.date_format(day, 'MONTH_DAY_FORMAT')),
+                }
+                for day in days
+            ],
+        }
+    if year_lookup:
+        if months is None:
+            year = datetime.date(int(year_lookup), 1, 1)
+            months = periods(cl.queryset, field_name, 'month', year, next_period(year, 'year'))
+        return {
+            'show': True,
+            'back': {'link': link({}), 'title': _('All dates')},
+            'choices': [
+                {
+                    'link': link({year_field: year_lookup, month_field: month.month}),
+                    'title': capfirst(formats.date_format(month, 'YEAR_MONTH_FORMAT')),
+                }
+                for month in months
+            ],
+        }
+    if years is None:
+        years = periods(cl.queryset, field_name, 'year')
+    return {
+        'show': True,
+        'back': None,
+        'choices': [
+            {'link': link({year_field: str(year.year)}), 'title': str(year.year)}
+            for year in years
+        ],
+    }
+
+
+@register.tag(name='indexed_date_hierarchy')
+def indexed_date_hierarchy_tag(parser, token):
+    return InclusionAdminNode(
+        parser, token, func=indexed_date_hierarchy,
+        template_name='date_hierarchy.html', takes_context=False,
+    )
@@ -0,0 +1,246 @@
+from datetime import datetime, timezone as dt_timezone
+from unittest import mock
+from urllib.parse import urlencode
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from api import counts, sharding
+from api.admin import OrderAdmin, OrderAdminForm
+from api.models import Order, OrderEvent, Service, ServiceCapacity, Task, User
+from api.orders import place_order
+from api.templatetags.api_admin import periods
+from api.tests.utils import statements
+
+
+class LargeTableAdminTests(TestCase):
+
+    # Orders may be stored on any order shard
+    databases = '__all__'
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='admin', mobile_number='07700000000', password='secret-pass'
+        )
+        self.customer = User.objects.create_user(username='customer', mobile_number='07700000001')
+        self.service = Service.objects.create(
+            service_type='water', name_ar='ماء', name_en='Water',
+            price_per_unit_minor=15000, unit_name='Liter', unit_name_ar='لتر',
+        )
+        self.alias = sharding.shard_for_user(self.customer)
+        # The changelists show one shard at a time
+        self.shard = {'shard': self.alias} if sharding.enabled() else {}
+        self.client.force_login(self.admin)
+
+    def order(self, month, day):
+        order = place_order(self.customer, self.service, {
+            'quantity': '1', 'location': 'Baghdad', 'payment_method': 'cash',
+        })
+        created_at = datetime(2026, month, day, 12, tzinfo=dt_timezone.utc)
+        Order.objects.using(self.alias).filter(id=order.id).update(created_at=created_at)
+        return order.id
+
+    def changelist(self, path, **params):
+        response = self.client.get(path, {**self.shard, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.context['cl']
+
+    def test_tracking_changelist_reads_no_orders(self):
+        for day in range(1, 4):
+            self.order(9, day)
+        with statements() as run:
+            cl = self.changelist('/admin/api/ordertracking/')
+        self.assertEqual(len(cl.result_list), 3)
+        self.assertNotIn(('SELECT', 'api_order'), run)
+        # Only the signed-in admin
+        self.assertEqual(run.count(('SELECT', 'api_user')), 1)
+
+    @override_settings(COUNT_CAP=3)
+    def test_keyset_pages_past_the_counted_rows(self):
+        ids = [self.order(9, day) for day in range(1, 6)]
+        newest_first = ids[::-1]
+        with mock.patch.object(OrderAdmin, 'list_per_page', 2):
+            cl = self.changelist('/admin/api/order/')
+            self.assertEqual((cl.result_count, cl.count_kind), (3, counts.AT_LEAST))
+            self.assertEqual([order.id for order in cl.result_list], newest_first[:2])
+            self.assertIn(f'after={newest_first[1]}', cl.next_page_url)
+
+            cl = self.changelist('/admin/api/order/', after=newest_first[1])
+            self.assertEqual([order.id for order in cl.result_list], newest_first[2:4])
+            cl = self.changelist('/admin/api/order/', after=newest_first[3])
+            self.assertEqual([order.id for order in cl.result_list], newest_first[4:])
+            self.assertIsNone(cl.next_page_url)
+            # An unknown cursor falls back to the first page
+            response = self.client.get('/admin/api/order/', {**self.shard, 'after': 'x'})
+            self.assertIn('e=1', response['Location'])
+
+    def test_date_hierarchy(self):
+        self.order(8, 30)
+        self.order(9, 2)
+        self.order(9, 20)
+        queryset = Order.objects.using(self.alias)
+        self.assertEqual(
+            [day.isoformat() for day in periods(queryset, 'created_at', 'month')],
+            ['2026-08-01', '2026-09-01'],
+        )
+        cl = self.changelist('/admin/api/order/', created_at__year=2026, created_at__month=9)
+        self.assertEqual(len(cl.result_list), 2)
+        response = self.client.get(
+            '/admin/api/order/', {**self.shard, 'created_at__year': 2026, 'created_at__month': 9}
+        )
+        self.assertContains(response, 'September 2')
+        self.assertContains(response, 'September 20')
+        self.assertNotContains(response, 'August 30')
+
+    @override_settings(DEBUG=True)
+    def test_debug_users_pages(self):
+        client = APIClient()
+        first = client.get('/api/debug/users/', {'limit': 1}).data
+        self.assertEqual([user['username'] for user in first['users']], ['admin'])
+        self.assertEqual((first['total_users'], first['total_is_exact']), (2, True))
+        self.assertTrue(first['has_more'])
+        second = client.get('/api/debug/users/', {'limit': 1, 'after': first['cursor']}).data
+        self.assertEqual([user['username'] for user in second['users']], ['customer'])
+        self.assertFalse(second['has_more'])
+        self.assertEqual(client.get('/api/debug/users/', {'after': 'x'}).status_code, 400)
+
+
+class CountEstimateTests(TestCase):
+
+    # Not the replicas: their test mirrors would hold the schema lock ANALYZE needs
+    databases = {'default'}
+
+    def setUp(self):
+        User.objects.create_user(username='admin', mobile_number='07700000000')
+        User.objects.create_user(username='customer', mobile_number='07700000001')
+
+    def test_estimated_counts(self):
+        self.assertEqual(counts.estimate(User.objects.all(), cap=5), (2, counts.EXACT))
+        self.assertEqual(counts.estimate(User.objects.all(), cap=1), (1, counts.AT_LEAST))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertEqual(counts.estimate(User.objects.all(), cap=1), (2, counts.ESTIMATE))
+        # Statistics say nothing about a filtered queryset
+        self.assertEqual(
+            counts.estimate(User.objects.filter(is_staff=False), cap=0), (0, counts.AT_LEAST)
+        )
+
+
+class OrderAdminEditTests(TransactionTestCase):
+
+    # Committed rows: with order shards, change pages locate orders from worker threads
+    databases = '__all__'
+
+    def setUp(self):
+        admin = User.objects.create_superuser(
+            username='admin', mobile_number='07700000000', password='secret-pass'
+        )
+        self.customer = User.objects.create_user(username='customer', mobile_number='07700000001')
+        self.service = Service.objects.create(
+            service_type='water', name_ar='ماء', name_en='Water',
+            price_per_unit_minor=15000, unit_name='Liter', unit_name_ar='لتر',
+        )
+        self.orders = Order.objects.using(sharding.shard_for_user(self.customer))
+        self.order = place_order(self.customer, self.service, {
+            'quantity': '1', 'location': 'Baghdad', 'payment_method': 'cash',
+        })
+        self.url = f'/admin/api/order/{self.order.id}/change/'
+        self.client.force_login(admin)
+
+    def form_data(self, **changes):
+        form = self.client.get(self.url).context['adminform'].form
+        data = {name: form[name].value() for name in form.fields}
+        return {**{name: '' if value is None else value for name, value in data.items()}, **changes}
+
+    def events(self):
+        return list(
+            OrderEvent.objects.filter(order_id=self.order.id).values_list('event_type', 'data')
+        )
+
+    def test_change_and_delete_are_recorded(self):
+        response = self.client.post(self.url, self.form_data(status='confirmed', notes='Gate 2'))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.orders.get(id=self.order.id).status, 'confirmed')
+        response = self.client.post(
+            f'/admin/api/order/{self.order.id}/delete/', {'post': 'yes'}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.events()[1:], [
+            ('status', {'status': 'confirmed', 'notes': 'Gate 2'}),
+            ('deleted', {}),
+        ])
+
+    def test_delete_action_records_each_order(self):
+        other = place_order(self.customer, self.service, {
+            'quantity': '1', 'location': 'Baghdad', 'payment_method': 'cash',
+        })
+        shard = {'shard': self.orders.db} if sharding.enabled() else {}
+        response = self.client.post(f'/admin/api/order/?{urlencode(shard)}', {
+            'action': 'delete_selected', 'post': 'yes',
+            '_selected_action': [self.order.id, other.id],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(self.orders.filter(id__in=[self.order.id, other.id]).exists())
+        deleted = OrderEvent.objects.filter(event_type='deleted')
+        self.assertCountEqual(deleted.values_list('order_id', flat=True), [self.order.id, other.id])
+
+    def test_save_racing_another_edit_shows_the_conflict(self):
+        data = self.form_data(notes='Gate 2')
+        clean = OrderAdminForm.clean
+
+        def edited_meanwhile(form):
+            cleaned_data = clean(form)
+            # Another editor saves after this form was validated
+            order = self.orders.get(id=self.order.id)
+            order.notes = 'Gate 5'
+            order.save()
+            return cleaned_data
+
+        with mock.patch.object(OrderAdminForm, 'clean', autospec=True, side_effect=edited_meanwhile):
+            response = self.client.post(self.url, data, follow=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'changed by someone else')
+        # The other edit shared this test's connection, so the rollback undid it too
+        self.assertNotEqual(self.orders.get(id=self.order.id).notes, 'Gate 2')
+        self.assertEqual([event_type for event_type, _ in self.events()], ['created'])
+
+    def test_status_changes_follow_the_allowed_transitions(self):
+        response = self.client.post(self.url, self.form_data(status='delivered'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('status', response.context['adminform'].form.errors)
+        self.assertEqual(self.orders.get(id=self.order.id).status, 'pending')
+
+        self.client.post(self.url, self.form_data(status='cancelled'))
+        response = self.client.post(self.url, self.form_data(status='pending'))
+        self.assertIn('status', response.context['adminform'].form.errors)
+        self.assertEqual(self.orders.get(id=self.order.id).status, 'cancelled')
+
+    def test_cancelling_releases_capacity(self):
+        limited = Service.objects.create(
+            service_type='gas', name_ar='غاز', name_en='Gas',
+            price_per_unit_minor=5000, unit_name='m3', unit_name_ar='م3', daily_capacity='10.00',
+        )
+        order = place_order(self.customer, limited, {
+            'quantity': '4', 'location': 'Baghdad', 'payment_method': 'cash',
+        })
+        capacity = ServiceCapacity.objects.get(service=limited)
+        self.assertEqual(capacity.reserved_hundredths, 400)
+        self.url = f'/admin/api/order/{order.id}/change/'
+
+        response = self.client.post(self.url, self.form_data(quantity='6'))
+        self.assertEqual(response.status_code, 302)
+        capacity.refresh_from_db()
+        self.assertEqual(capacity.reserved_hundredths, 600)
+        response = self.client.post(self.url, self.form_data(status='cancelled'))
+        self.assertEqual(response.status_code, 302)
+        capacity.refresh_from_db()
+        self.assertEqual(capacity.reserved_hundredths, 0)
+
+    def test_delivering_stamps_and_queues_the_order(self):
+        for status in ['confirmed', 'in_progress', 'delivered']:
+            response = self.client.post(self.url, self.form_data(status=status))
+            self.assertEqual(response.status_code, 302)
+        self.assertIsNotNone(self.orders.get(id=self.order.id).delivered_at)
+        queued = Task.objects.filter(name='api.eta.record_deliveries')
+        self.assertEqual([task.payload for task in queued], [{'order_ids': [self.order.id]}])
@@ -0,0 +1,32 @@
+from django.test import SimpleTestCase
+
+from api.admission import Gate
+
+
+class GateTests(SimpleTestCase):
+
+    def gate(self):
+        return Gate('read', limit=2, queue_timeout=0.05, reserved=1)
+
+    def test_free_slot_admits_however_long_the_request_waited_upstream(self):
+        gate = self.gate()
+        self.assertIsNone(gate.acquire(waited=30.0))
+        self.assertEqual(gate.stats()['shed_queue_time'], 0)
+        # The reserved slot is still free for critical routes
+        self.assertIsNone(gate.acquire(critical=True, waited=30.0))
+        self.assertEqual(gate.stats()['in_flight'], 2)
+
+    def test_full_gate_sheds(self):
+        gate = self.gate()
+        self.assertIsNone(gate.acquire())
+        # Upstream wait already spent the queue budget
+        self.assertEqual(gate.acquire(waited=30.0), 'queue_time')
+        # Waits out the budget for a slot that never frees up
+        self.assertEqual(gate.acquire(), 'full')
+        gate.release()
+        self.assertIsNone(gate.acquire(waited=30.0))
+        stats = gate.stats()
+        self.assertEqual(
+            (stats['admitted'], stats['queued'], stats['shed_queue_time'], stats['shed_full']),
+            (2, 1, 1, 1),
+        )
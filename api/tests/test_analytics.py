@@ -0,0 +1,161 @@
+import shutil
+import tempfile
+import unittest
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api import analytics, sharding
+from api.analytics import np
+from api.models import Order, Service, User
+from api.orders import place_order
+from api.tests.utils import statements
+
+
+@unittest.skipUnless(analytics.np is not None, 'NumPy is not installed')
+class OrderAnalyticsTests(TestCase):
+
+    # Orders may be stored on any order shard
+    databases = '__all__'
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings = override_settings(ANALYTICS_CACHE_DIR=directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create_user(
+            username='buyer', mobile_number='07700000001', password='secret-pass', is_staff=True
+        )
+        self.service = Service.objects.create(
+            service_type='water', name_ar='ماء', name_en='Water',
+            price_per_unit_minor=15000, unit_name='Liter', unit_name_ar='لتر',
+        )
+        self.now = timezone.now().replace(minute=30)
+
+    def order(self, quantity, placed, delivered=None, user=None):
+        user = user or self.user
+        order = place_order(user, self.service, {
+            'quantity': quantity, 'location': 'Baghdad', 'payment_method': 'cash',
+        })
+        Order.objects.using(sharding.shard_for_user(user)).filter(id=order.id).update(
+            created_at=placed,
+            status='delivered' if delivered else 'pending',
+            delivered_at=delivered,
+        )
+        return order.id
+
+    def test_summary(self):
+        for minutes, quantity in [(20, '1'), (50, '2'), (65, '3'), (140, '4')]:
+            placed = self.now - timedelta(days=1)
+            self.order(quantity, placed, placed + timedelta(minutes=minutes))
+        self.order('10', self.now - timedelta(days=1, hours=2))
+        self.order('99', self.now - timedelta(days=40))
+        analytics.refresh()
+
+        with statements() as run:
+            result = analytics.summary(days=30, now=self.now)
+        # Only the service names are read from the database
+        self.assertEqual(run, [('SELECT', 'api_service')])
+        self.assertEqual(result['orders'], 5)
+        water, = result['services']
+        self.assertEqual((water['service'], water['orders']), ('Water', 5))
+        hour = timezone.localtime(self.now).hour
+        self.assertEqual(water['orders_per_hour'][hour], round(4 / 30, 3))
+        self.assertEqual(water['orders_per_hour'][(hour - 2) % 24], round(1 / 30, 3))
+        self.assertEqual(water['quantity']['mean'], 4.0)
+        self.assertEqual(water['quantity']['p50'], 3.0)
+        delivery = water['delivery_minutes']
+        self.assertEqual(delivery['delivered'], 4)
+        self.assertEqual(delivery['histogram']['counts'][:10], [0, 1, 0, 1, 1, 0, 0, 0, 0, 1])
+        self.assertEqual(sum(delivery['histogram']['counts']), 4)
+        self.assertEqual(analytics.summary()['orders'], 6)
+
+    def test_shards_are_aggregated_separately_and_combined(self):
+        placed = self.now - timedelta(days=1)
+        quantities, minutes = [], []
+        for index, alias in enumerate(sharding.shards()):
+            user = User.objects.create_user(
+                username=f'buyer{index}', mobile_number=f'0770000010{index}', order_shard=alias
+            )
+            for step in range(3):
+                quantity, duration = index * 3 + step + 1, 10 + 25 * (index + step)
+                self.order(str(quantity), placed, placed + timedelta(minutes=duration), user=user)
+                quantities.append(quantity)
+                minutes.append(duration)
+        analytics.refresh()
+
+        water, = analytics.summary()['services']
+        self.assertEqual(water['orders'], len(quantities))
+        expected = np.percentile(quantities, analytics.QUANTITY_PERCENTILES)
+        for p, value in zip(analytics.QUANTITY_PERCENTILES, expected):
+            self.assertEqual(water['quantity'][f'p{p}'], round(float(value), 2))
+        self.assertEqual(water['quantity']['mean'], round(sum(quantities) / len(quantities), 2))
+        delivery = water['delivery_minutes']
+        expected = np.percentile(minutes, analytics.DELIVERY_PERCENTILES)
+        for p, value in zip(analytics.DELIVERY_PERCENTILES, expected):
+            self.assertEqual(delivery[f'p{p}'], round(float(value), 2))
+        self.assertEqual(sum(delivery['histogram']['counts']), len(minutes))
+
+    def test_refresh_appends_new_and_rewrites_changed_orders(self):
+        first = self.order('1', self.now - timedelta(minutes=45))
+        self.assertEqual(sum(r['added'] for r in analytics.refresh().values()), 1)
+        self.assertEqual(analytics.summary()['services'][0]['delivery_minutes']['delivered'], 0)
+
+        now = timezone.now()
+        Order.objects.using(sharding.shard_for_user(self.user)).filter(id=first).update(
+            status='delivered', delivered_at=now, updated_at=now
+        )
+        self.order('2', self.now - timedelta(minutes=5))
+        results = analytics.refresh()
+        self.assertEqual(sum(r['added'] for r in results.values()), 1)
+        self.assertEqual(sum(r['updated'] for r in results.values()), 1)
+        self.assertEqual(sum(r['rows'] for r in results.values()), 2)
+        water = analytics.summary()['services'][0]
+        self.assertEqual(water['orders'], 2)
+        self.assertEqual(water['delivery_minutes']['delivered'], 1)
+
+        results = analytics.refresh(full=True)
+        self.assertEqual(sum(r['added'] for r in results.values()), 2)
+        self.assertEqual(analytics.summary()['orders'], 2)
+
+    def test_full_refresh_leaves_mapped_columns_intact(self):
+        self.order('1', self.now - timedelta(hours=1))
+        self.order('2', self.now - timedelta(hours=2))
+        analytics.refresh()
+        alias = sharding.shard_for_user(self.user)
+        store = analytics.current_store(alias)
+        columns = store.columns()
+        ids = columns['id'].tolist()
+        # Resolved before the swap but mapped after it, like a request racing the refresh
+        racing = analytics.current_store(alias)
+
+        Order.objects.using(alias).filter(id=ids[0]).delete()
+        analytics.refresh(full=True)
+        self.assertEqual(columns['id'].tolist(), ids)
+        self.assertEqual(racing.columns()['id'].tolist(), ids)
+        self.assertEqual(analytics.current_store(alias).columns()['id'].tolist(), ids[1:])
+        self.assertEqual(analytics.summary()['orders'], 1)
+
+        # Only the published generation and the one before it are kept
+        analytics.refresh(full=True)
+        self.assertEqual(columns['id'].tolist(), ids)
+        self.assertFalse(store.directory.exists())
+        self.assertEqual(len(list((analytics.cache_dir() / alias).glob('extract-*'))), 2)
+
+    def test_endpoint(self):
+        self.order('1', self.now - timedelta(days=2))
+        analytics.refresh()
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get(f'/api/analytics/?days=7&service_id={self.service.id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['days'], response.data['orders']), (7, 1))
+        self.assertIsNotNone(response.data['refreshed_at'])
+        self.assertEqual(client.get('/api/analytics/?days=week').status_code, 400)
+
+        self.user.is_staff = False
+        self.user.save()
+        self.assertEqual(client.get('/api/analytics/').status_code, 403)
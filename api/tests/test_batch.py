@@ -0,0 +1,118 @@
+from unittest import mock
+
+from django.test import TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from api import admission, db_routers, sharding
+from api.admission import Gate
+from api.middleware import PIN_COOKIE
+from api.models import OrderTracking, Service, User
+from api.orders import place_order
+
+
+class BatchTests(TransactionTestCase):
+
+    # Committed rows: with order shards the order list is read from worker threads
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='buyer', mobile_number='07700000001', password='secret-pass'
+        )
+        service = Service.objects.create(
+            service_type='water', name_ar='ماء', name_en='Water',
+            price_per_unit_minor=15000, unit_name='Liter', unit_name_ar='لتر',
+        )
+        self.order_id = place_order(self.user, service, {
+            'quantity': '1', 'location': 'Baghdad', 'payment_method': 'cash',
+        }).id
+        self.tracking = OrderTracking.objects.using(sharding.shard_for_user(self.user))
+        self.client = APIClient()
+        # A session, as batch sub-requests are authenticated with the caller's
+        self.client.force_login(self.user)
+
+    def batch(self, *requests):
+        return self.client.post('/api/batch/', {'requests': list(requests)}, format='json')
+
+    def test_each_sub_request_has_its_own_response(self):
+        response = self.batch(
+            {'method': 'GET', 'path': '/profile/'},
+            {'method': 'PATCH', 'path': f'/orders/{self.order_id}/', 'body': {'notes': 'Ring twice'}},
+            {'method': 'GET', 'path': f'/api/orders/{self.order_id}/?fields=id,notes'},
+            {'method': 'GET', 'path': '/no-such-route/'},
+            {'method': 'GET', 'path': '/batch/'},
+            {'method': 'PATCH', 'path': f'/orders/{self.order_id}/', 'headers': {'If-Match': '"1"'}},
+        )
+        self.assertEqual(response.status_code, 200)
+        profile, patch, order, missing, nested, stale = response.data['responses']
+        self.assertEqual((profile['status'], profile['body']['username']), (200, 'buyer'))
+        self.assertEqual((patch['status'], patch['headers']['ETag']), (200, '"2"'))
+        # The read after the write in the same batch sees it
+        self.assertEqual(order['body'], {'id': self.order_id, 'notes': 'Ring twice'})
+        self.assertEqual(missing['status'], 404)
+        self.assertEqual(nested['status'], 400)
+        self.assertEqual(stale['status'], 412)
+
+    @override_settings(BATCH_MAX_REQUESTS=2)
+    def test_size_limit(self):
+        response = self.batch(*[{'method': 'GET', 'path': '/profile/'}] * 3)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('requests', response.data)
+        self.assertEqual(self.batch().status_code, 400)
+        response = self.batch(*[{'method': 'GET', 'path': '/profile/'}] * 2)
+        self.assertEqual([item['status'] for item in response.data['responses']], [200, 200])
+
+    # 'default' stands in for a replica: only the pin cookie is under test
+    @override_settings(DATABASE_REPLICAS=['default'])
+    @mock.patch.object(db_routers, '_replica_cycle', None)
+    def test_only_batches_that_write_pin_to_the_primary(self):
+        response = self.batch({'method': 'GET', 'path': '/profile/'})
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        response = self.batch(
+            {'method': 'GET', 'path': '/profile/'},
+            {'method': 'PATCH', 'path': f'/orders/{self.order_id}/', 'body': {'notes': 'Gate 2'}},
+        )
+        self.assertEqual(response.data['responses'][1]['status'], 200)
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        # Tracking is created on first view: a GET that writes pins too
+        self.tracking.filter(order_id=self.order_id).delete()
+        response = self.batch({'method': 'GET', 'path': f'/orders/{self.order_id}/track/'})
+        self.assertEqual(response.data['responses'][0]['status'], 200)
+        self.assertIn(PIN_COOKIE, response.cookies)
+        response = self.client.get(f'/api/orders/{self.order_id}/track/')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        self.tracking.filter(order_id=self.order_id).delete()
+        response = self.client.get(f'/api/orders/{self.order_id}/track/')
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_sub_requests_are_admitted_by_their_own_class(self):
+        gates = {
+            'read': Gate('read', limit=2, queue_timeout=0),
+            'write': Gate('write', limit=2, queue_timeout=0, retry_after=3),
+        }
+        with mock.patch.object(admission, '_gates', gates):
+            response = self.batch(*[
+                {'method': 'PATCH', 'path': f'/orders/{self.order_id}/', 'body': {'notes': str(n)}}
+                for n in range(3)
+            ])
+            self.assertEqual([item['status'] for item in response.data['responses']], [200] * 3)
+            # The batch took no slot itself; each write took and released one
+            self.assertEqual(
+                (gates['read'].stats()['admitted'], gates['write'].stats()['admitted']), (0, 3)
+            )
+
+            self.assertIsNone(gates['write'].acquire())
+            self.assertIsNone(gates['write'].acquire())
+            response = self.batch(
+                {'method': 'GET', 'path': '/profile/'},
+                {'method': 'PATCH', 'path': f'/orders/{self.order_id}/', 'body': {'notes': 'late'}},
+            )
+        profile, shed = response.data['responses']
+        self.assertEqual(profile['status'], 200)
+        self.assertEqual(shed, {
+            'status': 503,
+            'headers': {'Retry-After': '3'},
+            'body': {'error': admission.BUSY_MESSAGE},
+        })
+        self.assertEqual(gates['write'].stats()['in_flight'], 2)
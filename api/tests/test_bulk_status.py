@@ -0,0 +1,53 @@
+from unittest import mock
+
+from django.test import TransactionTestCase
+
+from api import orders, sharding
+from api.models import Order, OrderEvent, OrderTracking, Service, User
+from api.orders import bulk_transition, place_order
+
+
+class BulkTransitionTests(TransactionTestCase):
+
+    # Committed rows: with order shards, transitions read them from worker threads
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='buyer', mobile_number='07700000001', password='secret-pass'
+        )
+        self.service = Service.objects.create(
+            service_type='water', name_ar='ماء', name_en='Water',
+            price_per_unit_minor=15000, unit_name='Liter', unit_name_ar='لتر',
+        )
+        self.orders = Order.objects.using(sharding.shard_for_user(self.user))
+
+    def order(self):
+        return place_order(self.user, self.service, {
+            'quantity': '1', 'location': 'Baghdad', 'payment_method': 'cash',
+        }).id
+
+    def test_order_changed_between_read_and_update_is_a_conflict(self):
+        raced, other = self.order(), self.order()
+        tracking = OrderTracking.objects.using(self.orders.db)
+        touched = tracking.get(order_id=raced).last_updated
+        allowed_sources = orders.allowed_sources
+
+        def cancel_first(target):
+            # Another writer cancels one order after bulk_transition read it
+            self.orders.filter(id=raced).update(status='cancelled')
+            return allowed_sources(target)
+
+        with mock.patch.object(orders, 'allowed_sources', side_effect=cancel_first):
+            results = bulk_transition([(raced, 'confirmed'), (other, 'confirmed')])
+
+        self.assertEqual(results, [
+            {'id': raced, 'result': 'conflict', 'to': 'confirmed'},
+            {'id': other, 'result': 'updated', 'from': 'pending', 'to': 'confirmed'},
+        ])
+        self.assertEqual(self.orders.get(id=raced).status, 'cancelled')
+        self.assertEqual(self.orders.get(id=other).status, 'confirmed')
+        status_events = OrderEvent.objects.filter(event_type='status')
+        self.assertEqual(list(status_events.values_list('order_id', flat=True)), [other])
+        # The conflicting order's tracking row is left alone
+        self.assertEqual(tracking.get(order_id=raced).last_updated, touched)
@@ -0,0 +1,148 @@
+import threading
+from decimal import Decimal
+
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api import capacity
+from api.models import Service, ServiceCapacity, User
+
+
+def reserve_retrying(service, quantity):
+    # The in-memory SQLite test database runs in shared-cache mode, which
+    # reports a busy table immediately instead of waiting for the lock.
+    # A statement that fails this way did not run, so retrying is safe.
+    while True:
+        try:
+            return capacity.reserve(service, quantity)
+        except OperationalError as exc:
+            if 'locked' not in str(exc):
+                raise
+
+
+def make_service(daily_capacity):
+    return Service.objects.create(
+        service_type='water', name_ar='ماء', name_en='Water',
+        price_per_unit_minor=50, unit_name='Liter', unit_name_ar='لتر',
+        daily_capacity=daily_capacity,
+    )
+
+
+class ConcurrentReservationTests(TransactionTestCase):
+    """Parallel reservations must never exceed a day's capacity."""
+
+    THREADS = 8
+    ATTEMPTS_PER_THREAD = 10
+
+    def test_no_overselling_under_concurrency(self):
+        service = make_service(Decimal('50.00'))
+        quantity = Decimal('1.50')
+        start = threading.Barrier(self.THREADS)
+        outcomes = []
+        lock = threading.Lock()
+
+        def client():
+            accepted = rejected = 0
+            try:
+                start.wait()
+                for _ in range(self.ATTEMPTS_PER_THREAD):
+                    try:
+                        reserve_retrying(service, quantity)
+                        accepted += 1
+                    except capacity.CapacityExceeded:
+                        rejected += 1
+            finally:
+                connection.close()
+            with lock:
+                outcomes.append((accepted, rejected))
+
+        threads = [threading.Thread(target=client) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        accepted = sum(item[0] for item in outcomes)
+        rejected = sum(item[1] for item in outcomes)
+        row = ServiceCapacity.objects.get(service=service, day=timezone.localdate())
+        self.assertEqual(len(outcomes), self.THREADS)
+        self.assertEqual(accepted + rejected, self.THREADS * self.ATTEMPTS_PER_THREAD)
+        # 50 / 1.5 = 33 whole reservations fit; every one of them must succeed
+        self.assertEqual(accepted, 33)
+        self.assertEqual(row.reserved_hundredths, 150 * accepted)
+        self.assertLessEqual(row.reserved_hundredths, row.capacity_hundredths)
+
+
+class CheckoutCapacityTests(TestCase):
+    # Orders may be stored on any order shard
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='buyer', mobile_number='07700000001', password='secret-pass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.service = make_service(Decimal('10.00'))
+
+    def checkout(self, quantity):
+        return self.client.post('/api/orders/checkout/', {
+            'service_id': self.service.id,
+            'quantity': quantity,
+            'location': 'Baghdad',
+            'payment_method': 'cash',
+        }, format='json')
+
+    def reserved(self):
+        return ServiceCapacity.objects.get(service=self.service).reserved_hundredths
+
+    def test_checkout_rejects_orders_over_capacity(self):
+        self.assertEqual(self.checkout('6.00').status_code, 201)
+        response = self.checkout('5.00')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Decimal(response.data['available']), Decimal('4.00'))
+        self.assertEqual(self.user.orders.count(), 1)
+        self.assertEqual(self.reserved(), 600)
+
+    def test_cancelling_releases_capacity(self):
+        order_id = self.checkout('10.00').data['order']['id']
+        self.assertEqual(self.checkout('1.00').status_code, 409)
+        response = self.client.patch(f'/api/orders/{order_id}/', {'status': 'cancelled'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.reserved(), 0)
+        self.assertEqual(self.checkout('10.00').status_code, 201)
+
+    def test_edits_move_the_hold(self):
+        order_id = self.checkout('4.00').data['order']['id']
+        url = f'/api/orders/{order_id}/'
+        self.assertEqual(self.client.patch(url, {'quantity': '7.00'}, format='json').status_code, 200)
+        self.assertEqual(self.reserved(), 700)
+        response = self.client.patch(url, {'quantity': '11.00'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('quantity', response.data)
+        self.assertEqual(self.reserved(), 700)
+
+        self.client.patch(url, {'status': 'cancelled'}, format='json')
+        self.assertEqual(self.reserved(), 0)
+        # Leaving 'cancelled' takes the capacity back
+        self.assertEqual(self.client.patch(url, {'status': 'pending'}, format='json').status_code, 200)
+        self.assertEqual(self.reserved(), 700)
+
+    def test_fractional_quantities_fill_the_day_exactly(self):
+        # None of 0.1, 0.2, ... 0.9 is exact in binary floating point
+        self.service.daily_capacity = Decimal('1.00')
+        self.service.save()
+        for _ in range(10):
+            self.assertEqual(self.checkout('0.10').status_code, 201)
+        self.assertEqual(self.reserved(), 100)
+        response = self.checkout('0.10')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Decimal(response.data['available']), Decimal('0.00'))
+
+    def test_unlimited_service_reserves_nothing(self):
+        self.service.daily_capacity = None
+        self.service.save()
+        self.assertEqual(self.checkout('1000.00').status_code, 201)
+        self.assertFalse(ServiceCapacity.objects.exists())
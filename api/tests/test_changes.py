@@ -0,0 +1,104 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.models import OrderEvent, Service, User
+from api.orders import place_order
+from api.views import OrderViewSet
+
+
+class OrderChangesTests(TestCase):
+
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', mobile_number='07700000001')
+        self.service = Service.objects.create(
+            service_type='water', name_ar='ماء', name_en='Water',
+            price_per_unit_minor=15000, unit_name='Liter', unit_name_ar='لتر',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def place(self, user=None):
+        return place_order(user or self.user, self.service, {
+            'quantity': '1', 'location': 'Baghdad', 'payment_method': 'cash',
+        }).id
+
+    def start(self):
+        """The cursor before the first event; sequence numbers are not reset between tests."""
+        return OrderEvent.objects.earliest('id').id - 1
+
+    def changes(self, **params):
+        response = self.client.get('/api/orders/changes/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_cursor(self):
+        first = self.place()
+        other = User.objects.create_user(username='other', mobile_number='07700000002')
+        self.place(other)
+        feed = self.changes(since=self.start())
+        self.assertFalse(feed['resync_required'])
+        self.assertEqual([(e['order_id'], e['event_type']) for e in feed['events']], [(first, 'created')])
+        self.assertEqual(feed['events'][0]['data']['service_id'], self.service.id)
+        # Nothing new for this user: the cursor moves past other users' events
+        latest = OrderEvent.objects.latest('id').id
+        self.assertEqual(feed['cursor'], feed['events'][0]['seq'])
+        self.assertEqual(self.changes(since=feed['cursor'])['cursor'], latest)
+
+        self.client.patch(f'/api/orders/{first}/', {'notes': 'Ring twice'}, format='json')
+        second = self.place()
+        feed = self.changes(since=latest)
+        self.assertEqual(
+            [(e['order_id'], e['event_type']) for e in feed['events']],
+            [(first, 'updated'), (second, 'created')],
+        )
+        self.assertEqual(feed['events'][0]['data'], {'notes': 'Ring twice'})
+        self.assertEqual(self.changes(since=feed['cursor'])['events'], [])
+
+    def test_pages_are_bounded(self):
+        for _ in range(3):
+            self.place()
+        seqs = []
+        feed = {'cursor': self.start(), 'has_more': True}
+        while feed['has_more']:
+            # limit below 1 is raised to 1
+            feed = self.changes(since=feed['cursor'], limit=0)
+            seqs += [event['seq'] for event in feed['events']]
+            self.assertLessEqual(len(feed['events']), 1)
+        self.assertEqual(seqs, sorted(OrderEvent.objects.values_list('id', flat=True)))
+
+        with mock.patch.object(OrderViewSet, 'CHANGES_MAX_PAGE_SIZE', 2):
+            feed = self.changes(since=self.start(), limit=1000)
+        self.assertEqual((len(feed['events']), feed['has_more']), (2, True))
+        feed = self.changes(since=self.start(), limit=3)
+        self.assertEqual((len(feed['events']), feed['has_more']), (3, False))
+
+        for params in [{}, {'since': 'latest'}, {'since': 0, 'limit': 'all'}]:
+            with self.subTest(params=params):
+                response = self.client.get('/api/orders/changes/', params)
+                self.assertEqual(response.status_code, 400)
+
+    def test_pruned_cursor_requires_resync(self):
+        orders = [self.place() for _ in range(3)]
+        OrderEvent.objects.filter(order_id__in=orders[:2]).update(
+            created_at=timezone.now() - timedelta(days=40)
+        )
+        call_command('prune_order_events', stdout=StringIO())
+        oldest = OrderEvent.objects.get()
+        self.assertEqual(oldest.order_id, orders[2])
+
+        resync = {'resync_required': True, 'cursor': oldest.id, 'has_more': False, 'events': []}
+        for since in [0, oldest.id - 2, oldest.id + 1, -1]:
+            with self.subTest(since=since):
+                self.assertEqual(self.changes(since=since), resync)
+        # Right before the oldest retained event nothing was lost
+        feed = self.changes(since=oldest.id - 1)
+        self.assertFalse(feed['resync_required'])
+        self.assertEqual([event['seq'] for event in feed['events']], [oldest.id])
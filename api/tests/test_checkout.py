@@ -0,0 +1,130 @@
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api import catalog, eta, sharding
+from api.models import Order, OrderEvent, OrderTracking, Service, User
+from api.tests.utils import statements
+
+
+class CheckoutQueryBudgetTests(TestCase):
+    """Checkout runs the statements documented in ``orders.place_order``, no more."""
+
+    # Orders may be stored on any order shard
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='buyer', mobile_number='07700000001', password='secret-pass'
+        )
+        self.service = Service.objects.create(
+            service_type='water', name_ar='ماء', name_en='Water',
+            price_per_unit_minor=15000, unit_name='Liter', unit_name_ar='لتر',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.body = {
+            'service_id': self.service.id, 'quantity': '12.5', 'location': 'Baghdad',
+            'payment_method': 'cash', 'delivery_cost': '2000',
+        }
+
+    def checkout(self):
+        response = self.client.post('/api/orders/checkout/', self.body, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response
+
+    def expected(self, *before):
+        tickets = [('INSERT', 'api_orderidticket'), ('DELETE', 'api_orderidticket')]
+        return [
+            *before,
+            *(tickets if sharding.enabled() else []),
+            ('INSERT', 'api_order'),
+            ('INSERT', 'api_ordertracking'),
+            ('INSERT', 'api_orderevent'),
+        ]
+
+    def test_cached_service(self):
+        self.checkout()
+        with statements() as run:
+            response = self.checkout()
+        self.assertCountEqual(run, self.expected())
+        order = response.data['order']
+        self.assertEqual(order['total_cost'], '3875.00')
+        self.assertEqual(order['service']['name_en'], 'Water')
+        self.assertEqual(order['user']['username'], 'buyer')
+        shard = sharding.shard_for_user(self.user)
+        self.assertTrue(OrderTracking.objects.using(shard).filter(order_id=order['id']).exists())
+        self.assertEqual(OrderEvent.objects.filter(order_id=order['id']).count(), 1)
+
+    def test_service_lookup_is_one_query(self):
+        self.checkout()
+        catalog.invalidate()
+        with statements() as run:
+            self.checkout()
+        self.assertCountEqual(run, self.expected(('SELECT', 'api_service')))
+
+    def test_capacity_limit_adds_one_update(self):
+        self.service.daily_capacity = Decimal('100.00')
+        self.service.save()
+        self.checkout()
+        with statements() as run:
+            self.checkout()
+        self.assertCountEqual(run, self.expected(('UPDATE', 'api_servicecapacity')))
+
+    def test_edited_price_is_used_at_once(self):
+        self.checkout()
+        self.service.price_per_unit_minor = 20000
+        self.service.save()
+        self.assertEqual(self.checkout().data['order']['total_cost'], '4500.00')
+        self.assertEqual(self.user.orders.count(), 2)
+
+    def test_unknown_service(self):
+        self.body['service_id'] = self.service.id + 1
+        response = self.client.post('/api/orders/checkout/', self.body, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Order.objects.exists())
+
+
+class ColdEtaCacheCheckoutTests(TransactionTestCase):
+
+    # Committed rows: with order shards, the ETA reload counts orders from worker threads
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='buyer', mobile_number='07700000001', password='secret-pass'
+        )
+        self.service = Service.objects.create(
+            service_type='water', name_ar='ماء', name_en='Water',
+            price_per_unit_minor=15000, unit_name='Liter', unit_name_ar='لتر',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_reload_runs_before_the_transaction(self):
+        body = {
+            'service_id': self.service.id, 'quantity': '12.5', 'location': 'Baghdad',
+            'payment_method': 'cash',
+        }
+        self.client.post('/api/orders/checkout/', body, format='json')
+        catalog.get_service(self.service.id)
+        eta._cache['loaded_at'] = 0.0
+        with CaptureQueriesContext(connection) as captured, statements() as run:
+            response = self.client.post('/api/orders/checkout/', body, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        tickets = [('INSERT', 'api_orderidticket'), ('DELETE', 'api_orderidticket')]
+        # The recent orders are counted on every shard
+        loads = [('SELECT', 'api_order')] * len(sharding.shards())
+        self.assertCountEqual(run, [
+            ('SELECT', 'api_deliveryestimate'), *loads,
+            *(tickets if sharding.enabled() else []),
+            ('INSERT', 'api_order'), ('INSERT', 'api_ordertracking'), ('INSERT', 'api_orderevent'),
+        ])
+        sql = [query['sql'] for query in captured.captured_queries]
+        begin = sql.index('BEGIN')
+        reload = [i for i, query in enumerate(sql) if 'api_deliveryestimate' in query or 'COUNT' in query]
+        self.assertTrue(reload)
+        self.assertLess(max(reload), begin)
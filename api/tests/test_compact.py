@@ -0,0 +1,93 @@
+from django.test import TransactionTestCase
+from rest_framework.test import APIClient
+
+from api.compact import COMPACT_MEDIA_TYPE
+from api.models import OrderEvent, Service, User
+from api.orders import place_order
+
+
+def make_service(service_type, name):
+    return Service.objects.create(
+        service_type=service_type, name_ar='خدمة', name_en=name,
+        price_per_unit_minor=15000, unit_name='Liter', unit_name_ar='لتر',
+    )
+
+
+class CompactOrderTests(TransactionTestCase):
+
+    # Committed rows: with order shards the order list is read from worker threads
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', mobile_number='07700000001')
+        other = User.objects.create_user(username='other', mobile_number='07700000002')
+        self.water, self.power = make_service('water', 'Water'), make_service('electricity', 'Electricity')
+        self.order_ids = [
+            place_order(self.user, service, {
+                'quantity': '1', 'location': 'Baghdad', 'payment_method': 'cash',
+            }).id
+            for service in [self.water, self.power, self.water]
+        ]
+        # Someone else's order is neither listed nor side-loaded
+        place_order(other, make_service('gas', 'Gas'), {
+            'quantity': '1', 'location': 'Basra', 'payment_method': 'cash',
+        })
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, path, accept=COMPACT_MEDIA_TYPE):
+        return self.client.get(path, HTTP_ACCEPT=accept)
+
+    def test_related_objects_are_side_loaded_once(self):
+        response = self.get('/api/orders/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith(COMPACT_MEDIA_TYPE))
+        document = response.json()
+        self.assertEqual(set(document), {'data', 'included'})
+        self.assertEqual(
+            sorted((row['id'], row['user_id'], row['service_id']) for row in document['data']),
+            [(order_id, self.user.id, service.id) for order_id, service in
+             zip(self.order_ids, [self.water, self.power, self.water])],
+        )
+        self.assertNotIn('service', document['data'][0])
+        users, services = document['included']['users'], document['included']['services']
+        self.assertEqual([user['username'] for user in users], ['buyer'])
+        self.assertEqual([service['id'] for service in services], [self.water.id, self.power.id])
+        self.assertEqual(services[0]['name_en'], 'Water')
+
+    def test_only_selected_relations_are_side_loaded(self):
+        document = self.get('/api/orders/?fields=id,service_id').json()
+        self.assertEqual(set(document['data'][0]), {'id', 'service_id'})
+        self.assertEqual(set(document['included']), {'services'})
+        self.assertEqual(self.get('/api/orders/?fields=id,status').json()['included'], {})
+
+    def test_change_feed(self):
+        # Sequence numbers are not reset between tests
+        since = OrderEvent.objects.earliest('id').id - 1
+        document = self.get(f'/api/orders/changes/?since={since}').json()
+        self.assertEqual(
+            set(document), {'resync_required', 'cursor', 'has_more', 'events', 'included'}
+        )
+        self.assertEqual([event['order_id'] for event in document['events']], self.order_ids)
+        self.assertEqual(
+            [service['id'] for service in document['included']['services']],
+            [self.water.id, self.power.id],
+        )
+        self.assertNotIn('users', document['included'])
+
+        plain = self.get(f'/api/orders/changes/?since={since}', 'application/json').json()
+        self.assertNotIn('included', plain)
+        self.assertEqual(plain['events'], document['events'])
+
+    def test_content_negotiation(self):
+        nested = self.get('/api/orders/', 'application/json')
+        self.assertEqual(nested['Content-Type'], 'application/json')
+        self.assertEqual(nested.json()[0]['service']['id'], self.water.id)
+        self.assertIsInstance(self.get('/api/orders/', '*/*').json(), list)
+        # DRF ignores q-values: plain JSON wins whenever it is acceptable at all
+        both = self.get('/api/orders/', f'application/json;q=0.5, {COMPACT_MEDIA_TYPE}')
+        self.assertIsInstance(both.json(), list)
+        self.assertIn('included', self.get('/api/orders/?format=compact', '*/*').json())
+        # Only the list and the change feed have a compact form
+        response = self.get(f'/api/orders/{self.order_ids[0]}/')
+        self.assertEqual(response.status_code, 406)
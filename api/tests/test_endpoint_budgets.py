@@ -0,0 +1,303 @@
+"""
+Query-count and latency budgets for every API route.
+
+Each case requests one route as a customer with 1, 100 and 10,000 orders
+and records the data statements it ran (on every database, also in
+``sharding.fan_out()`` worker threads) and its wall time. A case fails when
+
+- its query count differs between fixture sizes (an N+1 query), or
+- it runs more queries than its stored budget, or
+- it takes longer than ``LATENCY_FACTOR`` times its stored time plus
+  ``LATENCY_SLACK_MS``, in the fastest of up to ``LATENCY_RETRIES + 1`` runs.
+
+Budgets live in ``endpoint_budgets.json``, per shard configuration. After an
+intentional change, regenerate them on a quiet machine with::
+
+    SAVE_ENDPOINT_BUDGETS=1 python manage.py test api.tests.test_endpoint_budgets
+
+A shard configuration without stored budgets is only checked for growth.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from unittest import mock
+
+from django.db import connections, transaction
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.urls import URLPattern, URLResolver
+from rest_framework.test import APIClient
+
+from api import analytics, catalog, compact, eta, payload_cache, pings, sharding, urls
+from api.models import Order, OrderEvent, OrderIdTicket, OrderTracking, Service, User
+from api.tests.utils import in_fan_out_workers, statements
+
+BUDGETS_PATH = Path(__file__).with_name('endpoint_budgets.json')
+SIZES = (1, 100, 10_000)
+LATENCY_FACTOR = 3.0
+LATENCY_SLACK_MS = 25.0
+LATENCY_RETRIES = 2
+PASSWORD = 'secret-pass'
+
+Customer = namedtuple('Customer', 'user order_id service_id')
+
+
+class Case(namedtuple('Case', 'route method path data anonymous headers settings')):
+    """One request to a named route; ``path`` and ``data`` may use the customer."""
+
+    @property
+    def name(self):
+        suffix = f" [{self.headers['HTTP_ACCEPT']}]" if self.headers else ''
+        return f'{self.method} {self.route}{suffix}'
+
+
+def case(route, method, path, data=None, anonymous=False, headers=None, settings=None):
+    return Case(route, method, path, data, anonymous, headers, settings)
+
+
+CASES = [
+    case('api-root', 'GET', '/api/'),
+    case('signup', 'POST', '/api/auth/signup/', lambda c: {
+        'username': 'newcomer', 'mobile_number': '07900000000',
+        'password': PASSWORD, 'password_confirm': PASSWORD,
+    }, anonymous=True),
+    case('signin', 'POST', '/api/auth/signin/', lambda c: {
+        'mobile_number': c.user.mobile_number, 'password': PASSWORD,
+    }, anonymous=True),
+    case('signout', 'POST', '/api/auth/signout/'),
+    case('csrf_token', 'GET', '/api/auth/csrf/', anonymous=True),
+    case('batch', 'POST', '/api/batch/', lambda c: {'requests': [
+        {'method': 'GET', 'path': '/profile/'},
+        {'method': 'GET', 'path': f'/orders/{c.order_id}/track/'},
+    ]}),
+    case('courier_pings', 'POST', '/api/courier/pings/', lambda c: {'pings': [
+        {'order_id': c.order_id, 'latitude': 33.3152, 'longitude': 44.3661},
+    ]}),
+    # Never queries orders; an empty extract keeps a developer's cache out of it
+    case('order_analytics', 'GET', '/api/analytics/', settings={
+        'ANALYTICS_CACHE_DIR': Path(tempfile.gettempdir()) / 'endpoint-budgets-no-analytics',
+    }),
+    case('metrics', 'GET', '/api/metrics/'),
+    case('debug_users', 'GET', '/api/debug/users/', settings={'DEBUG': True}),
+    case('profile', 'GET', '/api/profile/'),
+    case('update_profile', 'PATCH', '/api/profile/update/', lambda c: {'first_name': 'Noor'}),
+    case('change_password', 'POST', '/api/profile/change-password/', lambda c: {
+        'old_password': PASSWORD, 'new_password': 'another-pass',
+    }),
+    case('service-list', 'GET', '/api/services/', anonymous=True),
+    case('service-detail', 'GET', '/api/services/{c.service_id}/', anonymous=True),
+    case('service-calculate-cost', 'GET',
+         '/api/services/calculate_cost/?service_id={c.service_id}&quantity=12.5', anonymous=True),
+    case('order-list', 'GET', '/api/orders/'),
+    case('order-list', 'GET', '/api/orders/', headers={'HTTP_ACCEPT': compact.COMPACT_MEDIA_TYPE}),
+    case('order-list', 'POST', '/api/orders/', lambda c: {
+        'service_id': c.service_id, 'quantity': '2.00', 'service_cost': '300.00',
+        'total_cost': '300.00', 'location': 'Baghdad', 'payment_method': 'cash',
+    }),
+    case('order-detail', 'GET', '/api/orders/{c.order_id}/'),
+    case('order-detail', 'PATCH', '/api/orders/{c.order_id}/', lambda c: {'notes': 'Ring twice'}),
+    case('order-detail', 'DELETE', '/api/orders/{c.order_id}/'),
+    case('order-changes', 'GET', '/api/orders/changes/?since=0'),
+    case('order-track', 'GET', '/api/orders/{c.order_id}/track/'),
+    case('order-bulk-status', 'POST', '/api/orders/bulk_status/', lambda c: {
+        'transitions': [{'id': c.order_id, 'status': 'confirmed'}],
+    }),
+    case('order-checkout', 'POST', '/api/orders/checkout/', lambda c: {
+        'service_id': c.service_id, 'quantity': '12.5', 'location': 'Baghdad',
+        'payment_method': 'cash', 'delivery_cost': '2000',
+    }),
+]
+
+
+def route_names(patterns):
+    """Names of every route under ``patterns``."""
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from route_names(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield pattern.name
+
+
+def profile():
+    return f'shards={len(sharding.shards())}'
+
+
+def load_budgets():
+    if BUDGETS_PATH.exists():
+        return json.loads(BUDGETS_PATH.read_text())
+    return {}
+
+
+@contextmanager
+def rolled_back(workers=True):
+    """Undo whatever the request wrote on every database, also from ``fan_out()`` worker threads."""
+    def in_worker(func, alias):
+        with rolled_back(workers=False):
+            return func(alias)
+
+    with ExitStack() as stack:
+        if workers:
+            stack.enter_context(in_fan_out_workers(in_worker))
+        for alias in connections:
+            stack.enter_context(transaction.atomic(using=alias))
+        yield
+        for alias in connections:
+            transaction.set_rollback(True, using=alias)
+
+
+def make_customer(size, service):
+    user = User.objects.create_user(
+        username=f'customer{size}', mobile_number=f'077{size:08d}', password=PASSWORD,
+        is_staff=True,
+    )
+    alias = sharding.shard_for_user(user)
+    order_ids = tracking_ids = [None] * size
+    if sharding.enabled():
+        # bulk_create skips ShardedModel.save(), so take the IDs here
+        order_ids = OrderIdTicket.issue(alias, size)
+        tracking_ids = OrderIdTicket.issue(alias, size)
+    orders = Order.objects.using(alias).bulk_create([
+        Order(
+            id=order_id, user=user, service=service, quantity=10,
+            service_cost_minor=150000, delivery_cost_minor=0, total_cost_minor=150000,
+            location='Baghdad', payment_method='cash',
+        )
+        for order_id in order_ids
+    ], batch_size=1000)
+    OrderTracking.objects.using(alias).bulk_create([
+        OrderTracking(id=tracking_id, order_id=order.id, remaining_delivery_time=60)
+        for tracking_id, order in zip(tracking_ids, orders)
+    ], batch_size=1000)
+    OrderEvent.objects.bulk_create([
+        OrderEvent(user=user, order_id=order.id, event_type='created', data={})
+        for order in orders
+    ], batch_size=1000)
+    return Customer(user, orders[0].id, service.id)
+
+
+class RouteCoverageTests(SimpleTestCase):
+
+    def test_every_route_has_a_case(self):
+        covered = {case.route for case in CASES}
+        self.assertEqual(set(route_names(urls.urlpatterns)) - covered, set())
+
+
+class StatementCaptureTests(TransactionTestCase):
+    # Worker threads use their own connections to every shard
+    databases = '__all__'
+
+    def test_fan_out_workers_are_captured_and_rolled_back(self):
+        with statements() as run, rolled_back():
+            sharding.fan_out(lambda alias: OrderIdTicket.objects.using(alias).create())
+        self.assertEqual(run, [('INSERT', 'api_orderidticket')] * len(sharding.shards()))
+        for alias in sharding.shards():
+            self.assertFalse(OrderIdTicket.objects.using(alias).exists())
+
+    def test_statements_on_other_threads_fail(self):
+        def query():
+            try:
+                Service.objects.exists()
+            finally:
+                connections.close_all()
+
+        with self.assertRaisesRegex(AssertionError, 'not captured'):
+            with statements():
+                thread = threading.Thread(target=query)
+                thread.start()
+                thread.join()
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class EndpointBudgetTests(TransactionTestCase):
+    # The fixtures are committed: with order shards, some routes read them
+    # from worker threads, which can't see another connection's transaction.
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Sign-ins and sign-ups are logged; keep them out of the test output
+        cls.enterClassContext(mock.patch.object(logging.getLogger('api.auth'), 'disabled', True))
+        # Pings stay buffered; a background flush would write outside the measured request
+        cls.enterClassContext(mock.patch.object(pings, '_buffer', pings.PingBuffer(flush_interval=0)))
+
+    def setUp(self):
+        service = Service.objects.create(
+            service_type='water', name_ar='ماء', name_en='Water',
+            price_per_unit_minor=15000, unit_name='Liter', unit_name_ar='لتر',
+        )
+        self.customers = {size: make_customer(size, service) for size in SIZES}
+
+    def run_case(self, case, customer):
+        """``(status, statements, milliseconds)`` for one request, rolled back."""
+        client = APIClient()
+        if not case.anonymous:
+            client.force_login(customer.user)
+        path = case.path.format(c=customer)
+        data = case.data(customer) if case.data else None
+        # Measure steady state: in-process caches loaded, except the one
+        # holding rendered payloads, so serializers always run.
+        catalog.get_service(customer.service_id)
+        eta.estimate(customer.service_id)
+        payload_cache.get_cache().clear()
+        with ExitStack() as stack:
+            if case.settings:
+                stack.enter_context(override_settings(**case.settings))
+            # Outside rolled_back(), so worker threads are captured from their first statement
+            run = stack.enter_context(statements())
+            stack.enter_context(rolled_back())
+            start = time.perf_counter()
+            response = getattr(client, case.method.lower())(path, data, format='json', **(case.headers or {}))
+            elapsed = (time.perf_counter() - start) * 1000
+        if case.route == 'batch':
+            self.assertEqual([item['status'] for item in response.data['responses']], [200, 200])
+        return response.status_code, run, elapsed
+
+    def test_query_counts_and_latency(self):
+        budgets = load_budgets()
+        stored = budgets.get(profile())
+        results = {}
+        for case in CASES:
+            results[case.name] = {}
+            with self.subTest(case.name):
+                if case.route == 'order_analytics' and analytics.np is None:
+                    self.skipTest('NumPy is not installed')
+                first = None
+                for size, customer in self.customers.items():
+                    status, run, elapsed = self.run_case(case, customer)
+                    self.assertLess(status, 400, f'{case.name} with {size} orders')
+                    results[case.name][str(size)] = {'queries': len(run), 'ms': round(elapsed, 1)}
+                    if first is None:
+                        first = run
+                    self.assertEqual(
+                        len(run), len(first),
+                        f'{case.name}: queries grow with the number of orders '
+                        f'({len(first)} with {SIZES[0]}, {len(run)} with {size}): {run}',
+                    )
+                    if stored is None or os.environ.get('SAVE_ENDPOINT_BUDGETS'):
+                        continue
+                    budget = stored.get(case.name, {}).get(str(size))
+                    self.assertIsNotNone(budget, f'{case.name}: no budget stored; regenerate them')
+                    self.assertLessEqual(
+                        len(run), budget['queries'], f'{case.name} with {size} orders: {run}'
+                    )
+                    limit = budget['ms'] * LATENCY_FACTOR + LATENCY_SLACK_MS
+                    for _ in range(LATENCY_RETRIES):
+                        if elapsed <= limit:
+                            break
+                        # Timing noise passes; a real slowdown doesn't
+                        elapsed = min(elapsed, self.run_case(case, customer)[2])
+                    self.assertLessEqual(
+                        elapsed, limit,
+                        f'{case.name} with {size} orders took {elapsed:.1f} ms '
+                        f'(budget {budget["ms"]} ms)',
+                    )
+        complete = all(len(sizes) == len(SIZES) for sizes in results.values())
+        if os.environ.get('SAVE_ENDPOINT_BUDGETS') and complete:
+            budgets[profile()] = results
+            BUDGETS_PATH.write_text(json.dumps(budgets, indent=2, sort_keys=True) + '\n')
@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from api import eta, sharding
+from api.models import DeliveryEstimate, Order, Service, User
+from api.orders import place_order
+
+
+def make_service():
+    return Service.objects.create(
+        service_type='water', name_ar='ماء', name_en='Water',
+        price_per_unit_minor=15000, unit_name='Liter', unit_name_ar='لتر',
+    )
+
+
+class EstimateTests(TestCase):
+
+    # The load levels count orders on every order shard
+    databases = '__all__'
+
+    def setUp(self):
+        self.service = make_service()
+        self.at = timezone.make_aware(datetime(2026, 1, 5, 9, 30))
+        eta._cache['loaded_at'] = 0.0
+        self.addCleanup(eta._cache.update, {'loaded_at': 0.0})
+
+    def store(self, hour, level, durations):
+        estimate = DeliveryEstimate(service=self.service, hour=hour, load_level=level)
+        eta._apply(estimate, durations)
+        estimate.save()
+
+    def test_quantile(self):
+        histogram = [0, 2, 0, 3, 5]
+        self.assertEqual(eta.quantile(histogram, 0.2), 1)
+        self.assertEqual(eta.quantile(histogram, 0.5), 3)
+        self.assertEqual(eta.quantile(histogram, 0.8), 4)
+        self.assertEqual(eta.quantile([0, 0, 0], 0.5), 0)
+
+    def test_cells_below_the_minimum_sample_size_fall_back(self):
+        any_level, any_hour = (9, eta.ANY), (eta.ANY, eta.ANY)
+        self.assertIsNone(eta.estimate(self.service.id, at=self.at))
+
+        self.store(*any_hour, [70] * eta.MIN_SAMPLES)
+        self.store(9, 0, [10] * (eta.MIN_SAMPLES - 1))
+        eta._cache['loaded_at'] = 0.0
+        self.assertEqual(eta.estimate(self.service.id, at=self.at), 70)
+
+        self.store(*any_level, [20] * (eta.MIN_SAMPLES - 10) + [40] * 10)
+        eta._cache['loaded_at'] = 0.0
+        self.assertEqual(eta.estimate(self.service.id, at=self.at), 40)
+        with override_settings(ETA_QUANTILE='p50'):
+            eta._cache['loaded_at'] = 0.0
+            self.assertEqual(eta.estimate(self.service.id, at=self.at), 20)
+        # Other hours only have the service-wide cell
+        self.assertEqual(eta.estimate(self.service.id, at=self.at + timedelta(hours=3)), 70)
+
+
+class RecordDeliveriesTests(TransactionTestCase):
+
+    # Committed rows: with order shards the orders are read from worker threads
+    databases = '__all__'
+
+    def setUp(self):
+        self.service = make_service()
+        self.user = User.objects.create_user(username='buyer', mobile_number='07700000001')
+        self.orders = Order.objects.using(sharding.shard_for_user(self.user))
+        self.placed = timezone.make_aware(datetime(2026, 1, 5, 9, 5))
+
+    def order(self, placed, delivered=None):
+        order = place_order(self.user, self.service, {
+            'quantity': '1', 'location': 'Baghdad', 'payment_method': 'cash',
+        })
+        self.orders.filter(id=order.id).update(
+            created_at=placed,
+            status='delivered' if delivered else 'in_progress',
+            delivered_at=delivered,
+        )
+        return order.id
+
+    def test_record_deliveries(self):
+        delivered = [
+            self.order(self.placed, self.placed + timedelta(minutes=30)),
+            self.order(self.placed + timedelta(minutes=10), self.placed + timedelta(minutes=55)),
+        ]
+        waiting = self.order(self.placed)
+        eta.record_deliveries(order_ids=[*delivered, waiting])
+
+        hour = timezone.localtime(self.placed).hour
+        rows = {
+            (row.hour, row.load_level): row for row in DeliveryEstimate.objects.filter(service=self.service)
+        }
+        self.assertEqual(set(rows), {(hour, 0), (hour, eta.ANY), (eta.ANY, eta.ANY)})
+        for row in rows.values():
+            self.assertEqual(row.sample_count, 2)
+            self.assertEqual((row.p50, row.p95), (30, 45))
+            self.assertEqual((row.histogram[30], row.histogram[45]), (1, 1))
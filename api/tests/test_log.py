@@ -0,0 +1,56 @@
+import io
+import logging
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from api import log
+
+
+class QueueListenerHandlerTests(SimpleTestCase):
+
+    def record(self, message='hello'):
+        return logging.LogRecord('api.test', logging.INFO, __file__, 1, message, (), None)
+
+    def test_listener_starts_once_across_threads(self):
+        handler = log.QueueListenerHandler(stream=io.StringIO())
+        self.addCleanup(handler.close)
+        barrier = threading.Barrier(8)
+        started = []
+        start = logging.handlers.QueueListener.start
+
+        def record_start(listener):
+            started.append(listener)
+            start(listener)
+
+        def emit():
+            barrier.wait()
+            handler.handle(self.record())
+
+        with mock.patch.object(logging.handlers.QueueListener, 'start', record_start):
+            threads = [threading.Thread(target=emit) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        handler.flush()
+        self.assertEqual(len(started), 1)
+        self.assertEqual(handler.target.stream.getvalue().count('"msg": "hello"'), 8)
+
+    def test_dropped_records_are_reported(self):
+        handler = log.QueueListenerHandler(stream=io.StringIO(), maxsize=1)
+        self.addCleanup(handler.close)
+        before = log.stats()['dropped']
+        # No listener draining the queue: the second record finds it full
+        with mock.patch.object(handler, '_ensure_listener'):
+            handler.handle(self.record())
+            handler.handle(self.record())
+        self.assertEqual(handler.dropped, 1)
+        self.assertEqual(log.stats()['dropped'] - before, 1)
+
+    def test_level_number(self):
+        self.assertEqual(log.level_number('warning'), logging.WARNING)
+        self.assertEqual(log.level_number(15), 15)
+        with self.assertRaises(ValueError):
+            log.level_number('LOUD')
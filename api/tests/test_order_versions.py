@@ -0,0 +1,130 @@
+import threading
+from decimal import Decimal
+from unittest import mock
+
+from django.db import OperationalError, connections
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase
+from rest_framework.test import APIClient
+
+from api.models import Order, Service, User, VersionConflict
+from api.views import OrderViewSet
+
+
+def make_order():
+    user = User.objects.create_user(
+        username='buyer', mobile_number='07700000001', password='secret-pass'
+    )
+    service = Service.objects.create(
+        service_type='water', name_ar='ماء', name_en='Water',
+        price_per_unit_minor=50, unit_name='Liter', unit_name_ar='لتر',
+    )
+    return Order.objects.create(
+        user=user, service=service, quantity=Decimal('0.00'), service_cost_minor=0,
+        total_cost_minor=0, location='Baghdad', payment_method='cash',
+    )
+
+
+class ConcurrentOrderUpdateTests(TransactionTestCase):
+    """Read-modify-write cycles racing on one order must not lose updates."""
+
+    databases = '__all__'
+    THREADS = 8
+    UPDATES_PER_THREAD = 10
+
+    def test_no_lost_updates(self):
+        order = make_order()
+        orders = Order.objects.using(order._state.db)
+        start = threading.Barrier(self.THREADS)
+        conflicts = []
+        lock = threading.Lock()
+
+        def editor():
+            seen = 0
+            try:
+                start.wait()
+                done = 0
+                while done < self.UPDATES_PER_THREAD:
+                    try:
+                        current = orders.get(pk=order.pk)
+                        current.quantity += 1
+                        current.save()
+                        done += 1
+                    except VersionConflict:
+                        seen += 1
+                    except OperationalError as exc:
+                        # Shared-cache SQLite reports a busy table at once
+                        # instead of waiting; the statement did not run.
+                        if 'locked' not in str(exc):
+                            raise
+            finally:
+                connections.close_all()
+            with lock:
+                conflicts.append(seen)
+
+        threads = [threading.Thread(target=editor) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        order.refresh_from_db()
+        total = self.THREADS * self.UPDATES_PER_THREAD
+        self.assertEqual(len(conflicts), self.THREADS)
+        # Every successful save is in the row: none overwrote another.
+        self.assertEqual(order.quantity, Decimal(total))
+        self.assertEqual(order.version, 1 + total)
+
+    def test_stale_instance_is_rejected(self):
+        order = make_order()
+        first = Order.objects.using(order._state.db).get(pk=order.pk)
+        second = Order.objects.using(order._state.db).get(pk=order.pk)
+        first.notes = 'from dispatch'
+        first.save()
+        second.notes = 'from support'
+        with self.assertRaises(VersionConflict):
+            second.save()
+        order.refresh_from_db()
+        self.assertEqual((order.notes, order.version), ('from dispatch', 2))
+
+
+class OrderIfMatchTests(TestCase):
+    # Orders may be stored on any order shard
+    databases = '__all__'
+
+    def setUp(self):
+        self.order = make_order()
+        self.client = APIClient()
+        self.client.force_authenticate(self.order.user)
+        self.url = f'/api/orders/{self.order.pk}/'
+
+    def test_retrieve_and_update_return_the_version_as_etag(self):
+        self.assertEqual(self.client.get(self.url)['ETag'], '"1"')
+        response = self.client.patch(self.url, {'notes': 'Ring twice'}, format='json', HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], '"2"')
+        self.assertEqual(response.data['version'], 2)
+
+    def test_stale_if_match_is_rejected(self):
+        self.client.patch(self.url, {'notes': 'first'}, format='json')
+        response = self.client.patch(self.url, {'notes': 'second'}, format='json', HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(response.data['version'], 2)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.notes, 'first')
+        self.assertEqual(self.client.delete(self.url, HTTP_IF_MATCH='"1"').status_code, 412)
+
+    def test_change_between_load_and_save_is_a_conflict(self):
+        load = OrderViewSet.get_object
+
+        def load_then_concurrent_edit(view):
+            order = load(view)
+            Order.objects.filter(pk=order.pk).update(version=F('version') + 1, notes='other')
+            return order
+
+        with mock.patch.object(OrderViewSet, 'get_object', load_then_concurrent_edit):
+            response = self.client.patch(self.url, {'notes': 'mine'}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['ETag'], '"2"')
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.notes, 'other')
@@ -0,0 +1,120 @@
+from datetime import timedelta
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import SimpleTestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api import payload_cache, pings, sharding
+from api.models import Order, Service, User
+from api.orders import bulk_transition, place_order
+from api.sparse import FieldSpec
+
+
+class PayloadCacheTests(SimpleTestCase):
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = payload_cache.PayloadCache(max_entries=2)
+        for key in ['a', 'b', 'a', 'c', 'b']:
+            cache.get_or_render(key, lambda: key.upper())
+        self.assertEqual(list(cache._entries), ['c', 'b'])
+        stats = cache.stats()
+        self.assertEqual(
+            {name: stats[name] for name in ['local_hits', 'misses', 'evictions', 'size']},
+            {'local_hits': 1, 'misses': 4, 'evictions': 2, 'size': 2},
+        )
+        self.assertEqual(stats['hit_ratio'], 0.2)
+        cache.clear()
+        self.assertEqual((cache.stats()['size'], cache.stats()['hit_ratio']), (0, None))
+
+    def test_expired_entries_are_rendered_again(self):
+        cache = payload_cache.PayloadCache(timeout=0)
+        self.assertEqual(cache.get_or_render('a', lambda: 1), 1)
+        self.assertEqual(cache.get_or_render('a', lambda: 2), 2)
+
+    def test_shared_tier(self):
+        shared = LocMemCache('payload-cache-tests', {})
+        self.addCleanup(shared.clear)
+        payload_cache.PayloadCache(shared=shared).get_or_render('a', lambda: {'id': 1})
+        other = payload_cache.PayloadCache(shared=shared)
+        self.assertEqual(other.get_or_render('a', lambda: {'id': 2}), {'id': 1})
+        self.assertEqual(other.get_or_render('a', lambda: {'id': 3}), {'id': 1})
+        stats = other.stats()
+        self.assertEqual((stats['shared_hits'], stats['local_hits'], stats['misses']), (1, 1, 0))
+
+    def test_keys_differ_by_version_and_field_spec(self):
+        now = timezone.now()
+        keys = {
+            payload_cache.key('order', 1, [now]),
+            payload_cache.key('order', 1, [now + timedelta(microseconds=1)]),
+            payload_cache.key('order', 1, [now], FieldSpec(['id', 'status'])),
+            payload_cache.key('order', 1, [now], FieldSpec(['id', 'status'], ['service'])),
+            payload_cache.key('order', 1, [now], FieldSpec(None, ['service'])),
+            payload_cache.key('tracking', 1, [now]),
+        }
+        self.assertEqual(len(keys), 6)
+        self.assertEqual(
+            payload_cache.key('order', 1, [now], FieldSpec(['status', 'id'])),
+            payload_cache.key('order', 1, [now], FieldSpec(['id', 'status'])),
+        )
+
+
+class CachedOrderPayloadTests(TransactionTestCase):
+    """Every write that changes a payload changes its key."""
+
+    # Committed rows: pings and bulk transitions write from worker threads
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='buyer', mobile_number='07700000001', password='secret-pass', is_staff=True
+        )
+        service = Service.objects.create(
+            service_type='water', name_ar='ماء', name_en='Water',
+            price_per_unit_minor=15000, unit_name='Liter', unit_name_ar='لتر',
+        )
+        self.order_id = place_order(self.user, service, {
+            'quantity': '1', 'location': 'Baghdad', 'payment_method': 'cash',
+        }).id
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.cache = payload_cache.get_cache()
+        self.cache.clear()
+        self.addCleanup(self.cache.clear)
+
+    def get(self, suffix=''):
+        response = self.client.get(f'/api/orders/{self.order_id}/{suffix}')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_order_changes_are_served_at_once(self):
+        self.assertEqual(self.get()['notes'], '')
+        self.assertEqual(self.get()['notes'], '')
+        self.assertEqual(self.cache.stats()['local_hits'], 1)
+
+        self.client.patch(f'/api/orders/{self.order_id}/', {'notes': 'Gate 2'}, format='json')
+        self.assertEqual(self.get()['notes'], 'Gate 2')
+        self.assertEqual(self.get('track/')['order']['notes'], 'Gate 2')
+
+        bulk_transition([(self.order_id, 'confirmed')])
+        self.assertEqual(self.get()['status'], 'confirmed')
+        self.assertEqual(self.get('track/')['order']['status'], 'confirmed')
+
+    def test_ping_flushes_are_served_at_once(self):
+        Order.objects.using(sharding.shard_for_user(self.user)).filter(id=self.order_id).update(
+            status='in_progress'
+        )
+        self.assertIsNone(self.get('track/')['courier_latitude'])
+        pings.write(sharding.shard_for_user(self.user), {
+            self.order_id: pings.Ping(33.3152, 44.3661, timezone.now()),
+        })
+        self.assertEqual(self.get('track/')['courier_latitude'], 33.3152)
+
+    def test_field_specs_are_cached_separately(self):
+        self.assertEqual(set(self.get('?fields=id,status')), {'id', 'status'})
+        self.assertIsInstance(self.get('?fields=id,service&expand=service')['service'], dict)
+        self.assertIsInstance(self.get('?fields=id,service')['service'], int)
+        full = self.get()
+        self.assertIn('location', full)
+        self.assertIsInstance(full['service'], dict)
+        self.assertEqual(self.cache.stats()['misses'], 4)
@@ -0,0 +1,185 @@
+import time
+from datetime import timedelta
+
+from django.test import TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api import pings, sharding
+from api.models import Order, OrderTracking, Service, User
+from api.orders import place_order
+from api.tests.utils import statements
+
+
+class PingBufferTests(TransactionTestCase):
+    """Pings are coalesced per order and written in batches."""
+
+    # Committed rows: with order shards, flushes read them from worker threads
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='buyer', mobile_number='07700000001', password='secret-pass'
+        )
+        self.service = Service.objects.create(
+            service_type='water', name_ar='ماء', name_en='Water',
+            price_per_unit_minor=15000, unit_name='Liter', unit_name_ar='لتر',
+        )
+        self.shard = sharding.shard_for_user(self.user)
+        self.buffer = pings.PingBuffer(max_pending=3, flush_size=3, flush_interval=0)
+
+    def order(self, minutes_ago=0, status='in_progress'):
+        order = place_order(self.user, self.service, {
+            'quantity': '10', 'location': 'Baghdad', 'payment_method': 'cash',
+            'estimated_delivery_time': 60,
+        })
+        Order.objects.using(self.shard).filter(id=order.id).update(
+            status=status, created_at=timezone.now() - timedelta(minutes=minutes_ago)
+        )
+        return order.id
+
+    def tracking(self, order_id):
+        return OrderTracking.objects.using(self.shard).get(order_id=order_id)
+
+    def test_keeps_latest_ping_per_order(self):
+        order_id = self.order()
+        now = timezone.now()
+        self.assertTrue(self.buffer.add(order_id, 33.1, 44.1, now - timedelta(seconds=10)))
+        self.assertTrue(self.buffer.add(order_id, 33.3, 44.3, now))
+        self.assertFalse(self.buffer.add(order_id, 33.2, 44.2, now - timedelta(seconds=5)))
+        self.assertEqual(self.buffer.flush(), 1)
+        tracking = self.tracking(order_id)
+        self.assertEqual((tracking.courier_latitude, tracking.courier_longitude), (33.3, 44.3))
+        self.assertEqual(tracking.courier_pinged_at, now)
+        stats = self.buffer.stats()
+        self.assertEqual((stats['received'], stats['coalesced'], stats['dropped_stale']), (3, 1, 1))
+        self.assertEqual((stats['flushes'], stats['written'], stats['pending']), (1, 1, 0))
+        self.assertIsNotNone(stats['last_flush_ms'])
+
+    def test_flush_recomputes_remaining_time(self):
+        order_id = self.order(minutes_ago=25)
+        self.buffer.add(order_id, 33.3, 44.3)
+        self.buffer.flush()
+        self.assertEqual(self.tracking(order_id).remaining_delivery_time, 35)
+        late_id = self.order(minutes_ago=90)
+        self.buffer.add(late_id, 33.3, 44.3)
+        self.buffer.flush()
+        self.assertEqual(self.tracking(late_id).remaining_delivery_time, 0)
+
+    def test_one_select_and_one_update_per_batch(self):
+        batch = {self.order(): pings.Ping(33.3, 44.3, timezone.now()) for _ in range(3)}
+        with statements() as run:
+            found, written, stale, inactive = pings.write(self.shard, batch)
+        self.assertEqual((len(found), written, stale, inactive), (3, 3, 0, 0))
+        self.assertCountEqual(run, [
+            ('SELECT', 'api_order'), ('UPDATE', 'api_ordertracking'), ('INSERT', 'api_orderevent'),
+        ])
+
+    def test_flushed_pings_show_in_the_change_feed(self):
+        order_id, delivered = self.order(), self.order(status='delivered')
+        client = APIClient()
+        client.force_authenticate(self.user)
+        cursor = client.get('/api/orders/changes/', {'since': 0}).data['cursor']
+        now = timezone.now()
+        self.buffer.add(order_id, 33.3, 44.3, now)
+        self.buffer.add(delivered, 33.3, 44.3, now)
+        self.buffer.flush()
+        events = client.get('/api/orders/changes/', {'since': cursor}).data['events']
+        self.assertEqual([(event['order_id'], event['event_type']) for event in events], [
+            (order_id, 'tracking'),
+        ])
+        self.assertEqual(events[0]['data']['courier_latitude'], 33.3)
+        self.assertEqual(events[0]['data']['remaining_delivery_time'], 60)
+
+    def test_drops_when_full_and_flushes_at_threshold(self):
+        first, second, third = self.order(), self.order(), self.order()
+        buffer = pings.PingBuffer(max_pending=2, flush_interval=3600)
+        # A flush that can't keep up: the buffer fills and drops new orders
+        with buffer._flush_lock:
+            self.assertTrue(buffer.add(first, 33.3, 44.3))
+            self.assertTrue(buffer.add(second, 33.3, 44.3))
+            self.assertFalse(buffer.add(third, 33.3, 44.3))
+            self.assertTrue(buffer.add(first, 33.4, 44.4))
+        buffer.close()
+        stats = buffer.stats()
+        self.assertEqual((stats['dropped_full'], stats['written']), (1, 2))
+
+        for order_id in (first, second, third):
+            self.assertTrue(self.buffer.add(order_id, 33.3, 44.3))
+        stats = self.buffer.stats()
+        self.assertEqual((stats['size_flushes'], stats['written'], stats['pending']), (1, 3, 0))
+
+    def test_finished_unknown_and_old_pings_are_dropped(self):
+        delivered = self.order(status='delivered')
+        self.buffer.add(delivered, 33.3, 44.3)
+        self.buffer.add(delivered + 10**6, 33.3, 44.3)
+        self.assertFalse(self.buffer.add(self.order(), 33.3, 44.3, timezone.now() - timedelta(hours=1)))
+        self.assertEqual(self.buffer.flush(), 0)
+        stats = self.buffer.stats()
+        self.assertEqual(
+            (stats['dropped_inactive'], stats['dropped_unknown'], stats['dropped_stale']), (1, 1, 1)
+        )
+        self.assertIsNone(self.tracking(delivered).courier_pinged_at)
+
+    def test_newer_fix_written_elsewhere_wins(self):
+        order_id = self.order()
+        other = pings.PingBuffer(flush_interval=0)
+        now = timezone.now()
+        other.add(order_id, 33.3, 44.3, now)
+        other.flush()
+        self.buffer.add(order_id, 33.1, 44.1, now - timedelta(seconds=5))
+        self.buffer.flush()
+        self.assertEqual(self.tracking(order_id).courier_latitude, 33.3)
+        self.assertEqual(self.buffer.stats()['dropped_stale'], 1)
+
+    def test_background_flush(self):
+        order_id = self.order()
+        buffer = pings.PingBuffer(flush_interval=0.05)
+        buffer.add(order_id, 33.3, 44.3)
+        deadline = time.monotonic() + 5
+        while buffer.stats()['written'] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        buffer.close()
+        self.assertEqual(self.tracking(order_id).courier_latitude, 33.3)
+
+
+class CourierPingEndpointTests(TransactionTestCase):
+
+    databases = '__all__'
+
+    def setUp(self):
+        self.staff = User.objects.create_user(
+            username='dispatch', mobile_number='07700000002', password='secret-pass', is_staff=True
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+        self.buffer = pings.PingBuffer(flush_interval=0)
+        pings._buffer, self.saved = self.buffer, pings._buffer
+
+    def tearDown(self):
+        pings._buffer = self.saved
+
+    def test_pings_are_buffered(self):
+        response = self.client.post('/api/courier/pings/', {'pings': [
+            {'order_id': 7, 'latitude': 33.3, 'longitude': 44.3},
+            {'order_id': 7, 'latitude': 33.4, 'longitude': 44.4,
+             'recorded_at': (timezone.now() - timedelta(hours=1)).isoformat()},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data, {'accepted': 1, 'dropped': 1})
+        metrics = self.client.get('/api/metrics/').data['courier_pings']
+        self.assertEqual((metrics['received'], metrics['pending']), (2, 1))
+
+    def test_validation_and_permissions(self):
+        response = self.client.post('/api/courier/pings/', {'pings': [
+            {'order_id': 7, 'latitude': 91, 'longitude': 44.3},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        customer = User.objects.create_user(
+            username='buyer', mobile_number='07700000001', password='secret-pass'
+        )
+        self.client.force_authenticate(customer)
+        response = self.client.post('/api/courier/pings/', {'pings': [
+            {'order_id': 7, 'latitude': 33.3, 'longitude': 44.3},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 403)
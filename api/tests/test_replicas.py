@@ -0,0 +1,113 @@
+import time
+import unittest
+from unittest import mock
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from api import db_routers
+from api.db_routers import ReplicaRouter, replica_reads_allowed
+from api.middleware import PIN_COOKIE, ReplicaRoutingMiddleware, is_pinned
+from api.models import Service, User
+
+
+class ReplicaRouterTests(SimpleTestCase):
+
+    def request(self, pin=None):
+        request = RequestFactory().get('/api/services/')
+        if pin is not None:
+            request.COOKIES[PIN_COOKIE] = pin
+        return request
+
+    def test_pin_cookie(self):
+        self.assertFalse(is_pinned(self.request()))
+        self.assertTrue(is_pinned(self.request(str(time.time() + 5))))
+        self.assertFalse(is_pinned(self.request(str(time.time() - 5))))
+        # Malformed values read as unpinned instead of failing the request
+        self.assertFalse(is_pinned(self.request('soon')))
+        self.assertFalse(is_pinned(self.request('')))
+
+    @override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+    def test_reads_rotate_only_while_allowed(self):
+        router = ReplicaRouter()
+        with mock.patch.object(db_routers, '_replica_cycle', None):
+            self.assertEqual(router.db_for_read(Service), 'default')
+            token = replica_reads_allowed.set(True)
+            try:
+                reads = [router.db_for_read(Service) for _ in range(3)]
+                with db_routers.single_replica():
+                    sticky = {router.db_for_read(Service) for _ in range(3)}
+            finally:
+                replica_reads_allowed.reset(token)
+        self.assertEqual(reads, ['replica1', 'replica2', 'replica1'])
+        self.assertEqual(len(sticky), 1)
+        self.assertEqual(router.db_for_write(Service), 'default')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        token = replica_reads_allowed.set(True)
+        try:
+            self.assertIsNone(ReplicaRouter().db_for_read(Service))
+        finally:
+            replica_reads_allowed.reset(token)
+
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class PinCookieTests(SimpleTestCase):
+
+    def pins(self, method, **flags):
+        def view(request):
+            for name, value in flags.items():
+                setattr(request, name, value)
+            return HttpResponse()
+
+        request = RequestFactory().generic(method, '/api/orders/')
+        return PIN_COOKIE in ReplicaRoutingMiddleware(view)(request).cookies
+
+    def test_requests_that_write_pin_the_client(self):
+        self.assertFalse(self.pins('GET'))
+        self.assertTrue(self.pins('POST'))
+        self.assertTrue(self.pins('GET', db_wrote=True))
+        self.assertFalse(self.pins('POST', db_read_only=True))
+        self.assertTrue(self.pins('POST', db_read_only=True, db_wrote=True))
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertFalse(self.pins('GET', db_wrote=True))
+@unittest.skipUnless(settings.DATABASE_REPLICAS, 'needs DB_REPLICAS')
+@override_settings(REPORT_DB_QUERY_COUNTS=True)
+class ReplicaReadTests(TransactionTestCase):
+    """Run with DB_REPLICAS=2: in tests the replicas mirror 'default'."""
+
+    # Committed rows, so the replica connections see them
+    databases = '__all__'
+
+    def setUp(self):
+        Service.objects.create(
+            service_type='water', name_ar='ماء', name_en='Water',
+            price_per_unit_minor=15000, unit_name='Liter', unit_name_ar='لتر',
+        )
+        self.client = APIClient()
+
+    def aliases(self, response):
+        return {item.split('=')[0] for item in response['X-DB-Queries'].split(',')}
+
+    def test_writer_is_pinned_to_the_primary(self):
+        response = self.client.get('/api/services/')
+        self.assertEqual(len(response.data), 1)
+        self.assertLessEqual(self.aliases(response), set(settings.DATABASE_REPLICAS))
+
+        user = User.objects.create_user(
+            username='buyer', mobile_number='07700000001', password='secret-pass'
+        )
+        self.client.force_authenticate(user)
+        response = self.client.post('/api/auth/signout/')
+        self.assertIn(PIN_COOKIE, response.cookies)
+        response = self.client.get('/api/services/')
+        self.assertEqual(self.aliases(response), {'default'})
+
+        self.client.cookies[PIN_COOKIE] = 'not-a-time'
+        response = self.client.get('/api/services/')
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(self.aliases(response), set(settings.DATABASE_REPLICAS))
@@ -0,0 +1,139 @@
+import unittest
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from api import sharding
+from api.db_routers import ShardRouter
+from api.models import Order, OrderEvent, OrderTracking, Service, User
+from api.orders import place_order
+
+SHARDS = ['default', 'shard1', 'shard2']
+
+
+@override_settings(ORDER_SHARDS=SHARDS)
+class ShardRoutingTests(SimpleTestCase):
+    """Placement and routing decisions; no database is touched, so these run without DB_SHARDS."""
+
+    def setUp(self):
+        self.router = ShardRouter()
+        self.user = User(pk=7, username='buyer', order_shard='shard2')
+
+    def test_placement(self):
+        self.assertEqual(sharding.placement('buyer'), sharding.placement('buyer'))
+        self.assertEqual({sharding.placement(f'user{index}') for index in range(50)}, set(SHARDS))
+        self.assertEqual(sharding.shard_for_user(self.user), 'shard2')
+        self.assertEqual(sharding.shard_for_user(User(pk=8, order_shard='')), 'default')
+        with override_settings(ORDER_SHARDS=['default']):
+            self.assertEqual(sharding.shard_for_user(self.user), 'default')
+
+    def test_new_rows_go_with_their_user_or_order(self):
+        order = Order(user=self.user)
+        self.assertEqual(self.router.db_for_write(Order, instance=order), 'shard2')
+        order._state.db = 'shard1'
+        self.assertEqual(self.router.db_for_write(Order, instance=order), 'shard1')
+        tracking = OrderTracking(order=order)
+        self.assertEqual(self.router.db_for_write(OrderTracking, instance=tracking), 'shard1')
+        # Users and services stay on 'default', also when read through an order
+        self.assertEqual(self.router.db_for_write(User, instance=self.user), 'default')
+        self.assertEqual(self.router.db_for_read(User, instance=order), 'default')
+
+    def test_queries_without_an_instance_use_the_current_shard(self):
+        self.assertIsNone(self.router.db_for_read(Order))
+        with sharding.use_shard('shard1'):
+            self.assertEqual(self.router.db_for_read(Order), 'shard1')
+            self.assertEqual(self.router.db_for_write(OrderTracking), 'shard1')
+            # user.orders follows the user, not the request's shard
+            self.assertEqual(self.router.db_for_read(Order, instance=self.user), 'shard2')
+
+    def test_ids_and_migrations(self):
+        self.assertEqual(sharding.global_id('shard2', 5) >> sharding.ID_SHARD_SHIFT, 3)
+        self.assertEqual(sharding.global_id('shard2', 5) & ((1 << sharding.ID_SHARD_SHIFT) - 1), 5)
+        self.assertTrue(self.router.allow_migrate('shard1', 'api', 'order'))
+        self.assertFalse(self.router.allow_migrate('shard1', 'api', 'service'))
+        self.assertIsNone(self.router.allow_migrate('default', 'api', 'service'))
+        with override_settings(ORDER_SHARDS=['default']):
+            self.assertIsNone(self.router.db_for_write(Order, instance=Order(user=self.user)))
+
+
+@unittest.skipUnless(sharding.enabled(), 'needs DB_SHARDS')
+class ShardingTests(TransactionTestCase):
+    """Run with DB_SHARDS=2."""
+
+    # Committed rows: moves and lookups read every shard from worker threads
+    databases = '__all__'
+
+    def setUp(self):
+        self.service = Service.objects.create(
+            service_type='water', name_ar='ماء', name_en='Water',
+            price_per_unit_minor=15000, unit_name='Liter', unit_name_ar='لتر',
+        )
+        self.user = User.objects.create_user(username='buyer', mobile_number='07700000001')
+        self.source = sharding.shard_for_user(self.user)
+        self.target = next(alias for alias in sharding.shards() if alias != self.source)
+
+    def order(self):
+        return place_order(self.user, self.service, {
+            'quantity': '1', 'location': 'Baghdad', 'payment_method': 'cash',
+        }).id
+
+    def stored(self, model, alias, **filters):
+        return set(model.objects.using(alias).filter(**filters).values_list('id', flat=True))
+
+    def test_placement(self):
+        self.assertEqual(self.user.order_shard, sharding.placement('buyer'))
+        self.assertEqual(sharding.placement('buyer'), sharding.placement('buyer'))
+        placed = {sharding.placement(f'user{index}') for index in range(50)}
+        self.assertEqual(placed, set(sharding.shards()))
+
+    def test_create_routes_to_the_users_shard(self):
+        order = Order.objects.create(
+            user=self.user, service=self.service, quantity='1', service_cost_minor=15000,
+            total_cost_minor=15000, location='Baghdad', payment_method='cash',
+        )
+        tracking = OrderTracking.objects.create(order=order, remaining_delivery_time=60)
+        self.assertEqual((order._state.db, tracking._state.db), (self.source, self.source))
+        self.assertEqual(self.stored(Order, self.source), {order.id})
+        self.assertEqual(self.stored(OrderTracking, self.source, order_id=order.id), {tracking.id})
+        # IDs carry the position of the shard that issued them
+        position = sharding.shards().index(self.source) + 1
+        self.assertEqual(order.id >> sharding.ID_SHARD_SHIFT, position)
+        self.assertEqual(sharding.locate(Order, order.id), self.source)
+
+    def test_move_user(self):
+        ids = {self.order(), self.order()}
+        tracking = self.stored(OrderTracking, self.source, order_id__in=ids)
+        self.assertEqual(sharding.move_user(self.user, self.target), 2)
+
+        self.user.refresh_from_db()
+        self.assertEqual(sharding.shard_for_user(self.user), self.target)
+        self.assertEqual(self.stored(Order, self.target, user_id=self.user.pk), ids)
+        self.assertEqual(self.stored(OrderTracking, self.target, order_id__in=ids), tracking)
+        self.assertFalse(self.stored(Order, self.source, user_id=self.user.pk))
+        self.assertFalse(self.stored(OrderTracking, self.source, order_id__in=ids))
+        # The change feed lives on 'default' and still lists the moved orders
+        events = OrderEvent.objects.filter(user=self.user, event_type='created')
+        self.assertEqual(set(events.values_list('order_id', flat=True)), ids)
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        new = self.order()
+        self.assertEqual(self.stored(Order, self.target, id=new), {new})
+        listed = client.get('/api/orders/').data
+        self.assertEqual({order['id'] for order in listed}, ids | {new})
+
+    def test_stray_orders_are_swept_to_the_users_shard(self):
+        sharding.move_user(self.user, self.target)
+        # Written to the old shard by a request that started before the move
+        stray = Order.objects.using(self.source).create(
+            user=self.user, service=self.service, quantity='1', service_cost_minor=15000,
+            total_cost_minor=15000, location='Baghdad', payment_method='cash',
+        )
+        OrderTracking.objects.using(self.source).create(order=stray, remaining_delivery_time=60)
+
+        call_command('reshard', user=self.user.pk, to=self.target, stdout=StringIO())
+        self.assertEqual(self.stored(Order, self.target, user_id=self.user.pk), {stray.id})
+        self.assertEqual(len(self.stored(OrderTracking, self.target, order_id=stray.id)), 1)
+        self.assertFalse(self.stored(Order, self.source, user_id=self.user.pk))
@@ -0,0 +1,142 @@
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from rest_framework import serializers
+from rest_framework.test import APIClient
+
+from api.models import Order, Service, User
+from api.orders import place_order
+from api.serializers import OrderSerializer, OrderTrackingSerializer
+from api.sparse import FieldSpec, narrow_queryset
+
+SHARDS = ['default', 'shard1', 'shard2']
+
+
+class FieldSpecTests(SimpleTestCase):
+
+    def fields(self, serializer_class, fields=None, expand=()):
+        return serializer_class(field_spec=FieldSpec(fields, expand)).fields
+
+    def test_fields_and_expansions(self):
+        fields = self.fields(OrderSerializer, ['id', 'status', 'service'])
+        self.assertEqual(list(fields), ['id', 'service', 'service_id', 'status'])
+        self.assertIsInstance(fields['service'], serializers.PrimaryKeyRelatedField)
+
+        fields = self.fields(
+            OrderTrackingSerializer, ['order.service.name_en', 'order.user'], ['order.user']
+        )
+        order = fields['order']
+        self.assertEqual(list(fields), ['order'])
+        self.assertEqual(set(order.fields), {'service', 'service_id', 'user'})
+        self.assertEqual(list(order.fields['service'].fields), ['name_en'])
+        self.assertIn('mobile_number', order.fields['user'].fields)
+
+    def test_unknown_names_are_rejected(self):
+        cases = [
+            ({'fields': ['id', 'bogus']}, {'fields': ['Unknown field: bogus']}),
+            # Write-only fields are never rendered
+            ({'fields': ['service_id']}, {'fields': ['Unknown field: service_id']}),
+            ({'fields': ['status.code']}, {'fields': ['Unknown field: status.code']}),
+            ({'expand': ['status', 'service']}, {'expand': ['Unknown field: status']}),
+            ({'fields': ['service.bogus', 'user.id']}, {'fields': ['Unknown field: service.bogus']}),
+            ({'expand': ['service.user']}, {'expand': ['Unknown field: service.user']}),
+        ]
+        for spec, errors in cases:
+            with self.subTest(spec=spec):
+                with self.assertRaises(serializers.ValidationError) as raised:
+                    serializer = OrderSerializer(field_spec=FieldSpec(**spec))
+                    for field in serializer.fields.values():
+                        # Nested levels are checked when they are built
+                        getattr(field, 'fields', None)
+                self.assertEqual(raised.exception.detail, errors)
+
+
+class NarrowQuerysetTests(SimpleTestCase):
+
+    def narrow(self, fields=None, expand=()):
+        spec = FieldSpec(fields, expand) if fields or expand else None
+        return narrow_queryset(Order.objects.all(), OrderSerializer, spec)
+
+    def only(self, queryset):
+        names, defer = queryset.query.deferred_loading
+        self.assertFalse(defer)
+        return set(names)
+
+    def test_only_requested_columns_are_loaded(self):
+        queryset = self.narrow(['id', 'status', 'total_cost'])
+        self.assertEqual(self.only(queryset), {'id', 'status', 'total_cost_minor'})
+        self.assertFalse(queryset.query.select_related)
+        self.assertEqual(queryset._prefetch_related_lookups, ())
+
+        # An unexpanded relation is just its key column
+        self.assertEqual(self.only(self.narrow(['id', 'service'])), {'id', 'service'})
+
+    @override_settings(ORDER_SHARDS=['default'])
+    def test_relations_are_joined_within_a_database(self):
+        queryset = self.narrow(['id', 'service.name_en'])
+        self.assertEqual(self.only(queryset), {'id', 'service', 'service__id', 'service__name_en'})
+        self.assertEqual(queryset.query.select_related, {'service': {}})
+
+        # The full response: every column, with the nested relations joined
+        queryset = self.narrow()
+        self.assertEqual(queryset.query.deferred_loading, (frozenset(), True))
+        self.assertEqual(queryset.query.select_related, {'service': {}, 'user': {}})
+
+    @override_settings(ORDER_SHARDS=SHARDS)
+    def test_relations_across_databases_are_prefetched(self):
+        queryset = self.narrow(['id', 'service.name_en'])
+        self.assertEqual(self.only(queryset), {'id', 'service'})
+        self.assertFalse(queryset.query.select_related)
+        self.assertEqual(queryset._prefetch_related_lookups, ('service',))
+
+
+class SparseEndpointTests(TransactionTestCase):
+
+    # Committed rows: with order shards the order list is read from worker threads
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', mobile_number='07700000001')
+        service = Service.objects.create(
+            service_type='water', name_ar='ماء', name_en='Water',
+            price_per_unit_minor=15000, unit_name='Liter', unit_name_ar='لتر',
+        )
+        self.order_id = place_order(self.user, service, {
+            'quantity': '1', 'location': 'Baghdad', 'payment_method': 'cash',
+        }).id
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, path, status=200):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, status, response.data)
+        return response.data
+
+    def test_sparse_responses(self):
+        self.assertEqual(
+            self.get('/api/orders/?fields=id,status,service'),
+            [{'id': self.order_id, 'status': 'pending', 'service': Service.objects.get().id}],
+        )
+        self.assertEqual(
+            self.get(f'/api/orders/{self.order_id}/?fields=id,service.name_en'),
+            {'id': self.order_id, 'service': {'name_en': 'Water'}},
+        )
+        tracking = self.get(f'/api/orders/{self.order_id}/track/?expand=order')
+        self.assertEqual(tracking['order']['user'], self.user.id)
+        self.assertEqual(self.get('/api/profile/?fields=username'), {'username': 'buyer'})
+        # An empty selection is the full response
+        self.assertIn('location', self.get(f'/api/orders/{self.order_id}/?fields='))
+
+    def test_unknown_fields_are_a_bad_request(self):
+        self.assertEqual(
+            self.get('/api/orders/?fields=id,bogus', 400), {'fields': ['Unknown field: bogus']}
+        )
+        self.assertEqual(
+            self.get(f'/api/orders/{self.order_id}/?expand=notes', 400),
+            {'expand': ['Unknown field: notes']},
+        )
+        self.assertEqual(
+            self.get(f'/api/orders/{self.order_id}/track/?fields=order.bogus', 400),
+            {'fields': ['Unknown field: order.bogus']},
+        )
+        self.assertEqual(
+            self.get('/api/profile/?fields=password', 400), {'fields': ['Unknown field: password']}
+        )
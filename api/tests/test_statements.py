@@ -0,0 +1,107 @@
+import io
+import json
+import shutil
+import tempfile
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from api import sharding
+from api.models import Order, Service, User
+from api.orders import place_order
+
+
+class MonthlyStatementTests(TestCase):
+
+    # Orders may be stored on any order shard
+    databases = '__all__'
+
+    def setUp(self):
+        self.water = Service.objects.create(
+            service_type='water', name_ar='ماء', name_en='Water',
+            price_per_unit_minor=15000, unit_name='Liter', unit_name_ar='لتر',
+        )
+        self.gas = Service.objects.create(
+            service_type='gas', name_ar='غاز', name_en='Gas',
+            price_per_unit_minor=75000, unit_name='m³', unit_name_ar='م³',
+        )
+        self.users = [
+            User.objects.create_user(username=f'customer{n}', mobile_number=f'0770000000{n}')
+            for n in range(5)
+        ]
+        self.output = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.output)
+
+    def order(self, user, service, quantity, day, status='delivered'):
+        order = place_order(user, service, {
+            'quantity': quantity, 'location': 'Baghdad', 'payment_method': 'cash',
+        })
+        Order.objects.using(sharding.shard_for_user(user)).filter(id=order.id).update(
+            status=status, created_at=datetime(2026, 9, day, 12, tzinfo=dt_timezone.utc)
+        )
+        return order.id
+
+    def generate(self, *args):
+        out = io.StringIO()
+        call_command(
+            'generate_statements', '--month', '2026-09', '--output', str(self.output),
+            '--range-size', '2', *args, stdout=out,
+        )
+        return out.getvalue()
+
+    def statements(self):
+        files = sorted((self.output / '2026-09').glob('statements-*.jsonl'))
+        return [json.loads(line) for path in files for line in path.read_text().splitlines()]
+
+    def test_statement_per_user_with_totals_per_service(self):
+        first, second = self.users[0], self.users[3]
+        late = self.order(first, self.water, '10', day=20)
+        early = self.order(first, self.water, '2.5', day=3)
+        gas = self.order(first, self.gas, '1', day=4)
+        cancelled = self.order(first, self.gas, '4', day=5, status='cancelled')
+        self.order(second, self.gas, '2', day=9)
+        # Outside the month
+        outside = self.order(second, self.water, '1', day=1)
+        Order.objects.using(sharding.shard_for_user(second)).filter(id=outside).update(
+            created_at=datetime(2026, 10, 1, tzinfo=dt_timezone.utc)
+        )
+
+        self.assertIn('Wrote 5 statements with 5 orders', self.generate())
+        statements = self.statements()
+        self.assertEqual([s['user_id'] for s in statements], [user.id for user in self.users])
+        mine = statements[0]
+        self.assertEqual([line['id'] for line in mine['orders']], [early, gas, cancelled, late])
+        self.assertEqual(mine['services'], [
+            {'service_id': self.water.id, 'service': 'Water', 'orders': 2,
+             'quantity': '12.50', 'total_cost': '1875.00'},
+            {'service_id': self.gas.id, 'service': 'Gas', 'orders': 1,
+             'quantity': '1.00', 'total_cost': '750.00'},
+        ])
+        self.assertEqual(mine['total_cost'], '2625.00')
+        self.assertEqual(statements[3]['total_cost'], '1500.00')
+        self.assertEqual(statements[1]['orders'], [])
+        self.assertEqual(statements[1]['total_cost'], '0.00')
+
+    def test_resumes_from_checkpoint(self):
+        self.order(self.users[4], self.water, '1', day=2)
+        self.generate()
+        directory = self.output / '2026-09'
+        files = sorted(directory.glob('statements-*.jsonl'))
+        self.assertEqual(len(files), 3)
+        # An interrupted run: the last range never finished
+        checkpoint = json.loads((directory / 'checkpoint.json').read_text())
+        checkpoint['done'] = checkpoint['done'][:2]
+        (directory / 'checkpoint.json').write_text(json.dumps(checkpoint))
+        files[-1].unlink()
+        files[0].write_text('kept\n')
+
+        output = self.generate()
+        self.assertIn('Resuming: 2 of 3 ranges already written', output)
+        self.assertIn('Wrote 1 statements with 1 orders', output)
+        self.assertEqual(files[0].read_text(), 'kept\n')
+        self.assertEqual(json.loads(files[-1].read_text())['total_cost'], '150.00')
+
+        self.generate('--restart')
+        self.assertEqual(len(self.statements()), 5)
@@ -0,0 +1,117 @@
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from api import tasks
+from api.models import Task, User
+
+
+@tasks.task(priority=1, max_attempts=2)
+def create_user(username):
+    User.objects.create_user(username=username, mobile_number=username)
+
+
+@tasks.task()
+def create_user_and_fail(username):
+    create_user(username)
+    raise ValueError('Courier API unavailable')
+
+
+class TaskQueueTests(TestCase):
+
+    def users(self):
+        return list(User.objects.values_list('username', flat=True))
+
+    def test_claims_due_tasks_by_priority_once(self):
+        low = tasks.enqueue(create_user, {'username': 'low'}, priority=0)
+        high = create_user.delay(username='high')
+        later = create_user.delay(username='later')
+        Task.objects.filter(id=later.id).update(run_after=timezone.now() + timedelta(minutes=1))
+
+        claimed = tasks.claim(10)
+        self.assertEqual([job.id for job in claimed], [high.id, low.id])
+        self.assertEqual({job.claim_token for job in claimed}, {claimed[0].claim_token})
+        self.assertEqual({(job.status, job.attempts) for job in claimed}, {('running', 1)})
+        # The guarded UPDATE never hands a running task to another worker
+        self.assertEqual(tasks.claim(10), [])
+
+        self.assertTrue(all(tasks.run(job) for job in claimed))
+        self.assertEqual(self.users(), ['high', 'low'])
+        self.assertEqual(list(Task.objects.values_list('id', flat=True)), [later.id])
+
+    def test_failures_retry_with_backoff_then_fail(self):
+        tasks.enqueue(create_user_and_fail, {'username': 'a'}, max_attempts=2)
+
+        before = timezone.now()
+        job, = tasks.claim(1)
+        with self.assertLogs('api.tasks', 'WARNING'):
+            self.assertFalse(tasks.run(job))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.claim_token), ('queued', 1, ''))
+        self.assertIn('Courier API unavailable', job.last_error)
+        delay = (job.run_after - before).total_seconds()
+        self.assertGreaterEqual(delay, tasks.RETRY_BASE_SECONDS * 0.5)
+        self.assertLessEqual(delay, tasks.RETRY_BASE_SECONDS + 1)
+        # The failed attempt's writes were rolled back with it
+        self.assertEqual(self.users(), [])
+
+        Task.objects.filter(id=job.id).update(run_after=timezone.now())
+        job, = tasks.claim(1)
+        with self.assertLogs('api.tasks', 'WARNING'):
+            self.assertFalse(tasks.run(job))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        self.assertEqual(tasks.claim(1), [])
+
+    def test_retry_delay_grows_up_to_the_cap(self):
+        with mock.patch.object(tasks.random, 'uniform', return_value=1.0):
+            delays = [tasks.retry_delay(attempts).total_seconds() for attempts in (1, 2, 3, 20)]
+        self.assertEqual(delays, [5, 10, 20, tasks.RETRY_MAX_SECONDS])
+
+    def test_task_of_a_dead_worker_runs_again_once(self):
+        create_user.delay(username='courier')
+        dead, = tasks.claim(1)
+        # The worker died mid-task: the row stays 'running' until it goes stale
+        self.assertEqual(tasks.requeue_stale(timedelta(minutes=10)), 0)
+        Task.objects.filter(id=dead.id).update(locked_at=timezone.now() - timedelta(minutes=11))
+        self.assertEqual(tasks.requeue_stale(timedelta(minutes=10)), 1)
+
+        retry, = tasks.claim(1)
+        self.assertEqual(retry.attempts, 2)
+        # A slow, not dead, first worker finishing late no longer owns the row
+        with self.assertLogs('api.tasks', 'WARNING') as logs:
+            self.assertFalse(tasks.run(dead))
+        self.assertIn('requeued while running', logs.output[0])
+        self.assertEqual(self.users(), [])
+        self.assertTrue(tasks.run(retry))
+        self.assertEqual(self.users(), ['courier'])
+        self.assertFalse(Task.objects.exists())
+
+    def test_stale_task_out_of_attempts_fails(self):
+        create_user.delay(username='courier')
+        job, = tasks.claim(1)
+        Task.objects.filter(id=job.id).update(
+            attempts=2, locked_at=timezone.now() - timedelta(hours=1)
+        )
+        tasks.requeue_stale(timedelta(minutes=10))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.last_error), ('failed', 'Worker timed out'))
+
+    def test_work_and_run_workers(self):
+        for username in ['a', 'b', 'c']:
+            create_user.delay(username=username)
+        self.assertEqual(tasks.work(threading.Event(), batch_size=2, once=True), 3)
+        self.assertEqual(sorted(self.users()), ['a', 'b', 'c'])
+
+        create_user.delay(username='d')
+        out = StringIO()
+        # Keep the test runner's own signal handlers
+        with mock.patch('api.management.commands.run_workers.signal.signal'):
+            call_command('run_workers', once=True, stdout=out)
+        self.assertIn('Processed 1 task(s)', out.getvalue())
+        self.assertFalse(Task.objects.exists())
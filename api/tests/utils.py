@@ -0,0 +1,85 @@
+import re
+import threading
+from contextlib import ExitStack, contextmanager
+from unittest import mock
+
+from django.db import connections
+from django.db.backends.utils import CursorWrapper
+from django.test.utils import CaptureQueriesContext
+
+from api import sharding
+
+TRANSACTION_CONTROL = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK', 'BEGIN', 'COMMIT')
+# Django logs executemany() as "<n> times: <sql>"
+EXECUTEMANY_PREFIX = re.compile(r'^\d+ times: ')
+
+
+@contextmanager
+def in_fan_out_workers(wrapper):
+    """
+    Call ``wrapper(func, alias)`` instead of ``func(alias)`` in the worker
+    threads of ``sharding.fan_out()``.
+
+    Connections are per thread, so whatever a test does to the calling
+    thread's connections has to be repeated in each worker. With a single
+    shard ``fan_out()`` runs in the calling thread and ``wrapper`` is skipped.
+    """
+    on_shard = sharding._on_shard
+
+    def wrapped(func, alias, close):
+        if not close:
+            return on_shard(func, alias, close)
+        return on_shard(lambda alias: wrapper(func, alias), alias, close)
+
+    with mock.patch.object(sharding, '_on_shard', wrapped):
+        yield
+
+
+@contextmanager
+def statements():
+    """
+    Collect ``(verb, table)`` for the data statements run on every database.
+
+    The statements are grouped by database and thread, not in the order
+    they ran, and include those run by ``sharding.fan_out()`` workers. A
+    statement run with ``executemany()`` is collected once. Statements run
+    on any other thread meanwhile fail the block with ``AssertionError``.
+    """
+    collected = []
+    captures = []
+    threads = {threading.get_ident()}
+    strays = []
+    execute = CursorWrapper._execute_with_wrappers
+
+    def checked(cursor, sql, params, many, executor):
+        if threading.get_ident() not in threads:
+            strays.append(sql)
+        return execute(cursor, sql, params, many, executor)
+
+    def capture(stack):
+        captures.extend(
+            stack.enter_context(CaptureQueriesContext(connections[alias]))
+            for alias in connections
+        )
+
+    def in_worker(func, alias):
+        threads.add(threading.get_ident())
+        with ExitStack() as stack:
+            capture(stack)
+            return func(alias)
+
+    with ExitStack() as stack:
+        stack.enter_context(mock.patch.object(CursorWrapper, '_execute_with_wrappers', checked))
+        stack.enter_context(in_fan_out_workers(in_worker))
+        capture(stack)
+        yield collected
+    if strays:
+        raise AssertionError(f'Statements ran on a thread that was not captured: {strays}')
+    for context in captures:
+        for query in context.captured_queries:
+            sql = EXECUTEMANY_PREFIX.sub('', query['sql'])
+            if sql.startswith(TRANSACTION_CONTROL):
+                continue
+            verb = sql.split()[0]
+            table = sql.split('"')[1] if '"' in sql else ''
+            collected.append((verb, table))
@@ -13,6 +13,18 @@ urlpatterns = [
     path('auth/signout/', views.signout, name='signout'),
     path('auth/csrf/', views.csrf_token, name='csrf_token'),
     
+    # Several requests in one round trip
+    path('batch/', views.batch, name='batch'),
+    
+    # Courier location pings (staff only)
+    path('courier/pings/', views.courier_pings, name='courier_pings'),
+    
+    # Order aggregates (staff only)
+    path('analytics/', views.order_analytics, name='order_analytics'),
+    
+    # Per-process counters (staff only)
+    path('metrics/', views.metrics, name='metrics'),
+    
     # Debug (Development Only)
     path('debug/users/', views.debug_users, name='debug_users'),
     
@@ -1,50 +1,65 @@
-from decimal import Decimal, InvalidOperation
+import logging
+from decimal import InvalidOperation
 
 from django.conf import settings
-from django.contrib.auth import login, logout
-from rest_framework import status, viewsets
+from django.contrib.auth import authenticate, login, logout
+from django.db.models import Max, Min
+from rest_framework import serializers, status, viewsets
 from rest_framework.decorators import action, api_view, permission_classes
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 
-from .models import Order, OrderTracking, Service, User
+from . import batch as batch_requests
+from . import admission, analytics, capacity, catalog, compact, counts, log, money, payload_cache, pings, sharding
+from .models import Order, OrderEvent, OrderTracking, Service, User, VersionConflict
+from .orders import bulk_transition, order_created_data, place_order, quote, record_event, save_edit, snapshot
+from .sparse import FieldSpec, narrow_queryset
 from .serializers import (
     UserSerializer, SignUpSerializer, SignInSerializer,
     ServiceSerializer, OrderSerializer, OrderTrackingSerializer,
-    CheckoutSerializer
+    CheckoutSerializer, BulkOrderStatusSerializer, OrderEventSerializer,
+    CompactOrderSerializer, BatchSerializer, CourierPingBatchSerializer
 )
 
-TWO_PLACES = Decimal('0.01')
 DEFAULT_CURRENCY = getattr(settings, 'DEFAULT_CURRENCY', 'IQD')
+# Users per page of api/debug/users/
+DEBUG_USERS_PAGE_SIZE = 100
+DEBUG_USERS_MAX_PAGE_SIZE = 1000
+
+auth_logger = logging.getLogger('api.auth')
+
+
+def etag(version):
+    return f'"{version}"'
+
+
+def if_match(request, version):
+    """Whether the request's If-Match header (if any) names ``version``."""
+    header = request.headers.get('If-Match')
+    if header is None or header.strip() == '*':
+        return True
+    tags = {tag.strip().removeprefix('W/').strip('"') for tag in header.split(',')}
+    return str(version) in tags
 
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def signup(request):
     """User signup endpoint"""
-    from django.contrib.auth import authenticate
-    
-    print(f"[DEBUG] Signup request data: {request.data}")
+    auth_logger.debug('signup request', extra={'data': request.data})
     serializer = SignUpSerializer(data=request.data)
     if serializer.is_valid():
         user = serializer.save()
-        # Authenticate the user to set the backend attribute
-        authenticated_user = authenticate(
-            request,
-            mobile_number=user.mobile_number,
-            password=request.data.get('password')
-        )
-        if authenticated_user:
-            login(request, authenticated_user)
-        else:
-            # Fallback: manually set backend and login
-            user.backend = 'api.backends.MobileNumberBackend'
-            login(request, user)
+        # The password was just hashed by create_user; log in directly
+        # instead of hashing it a second time through authenticate().
+        user.backend = 'api.backends.MobileNumberBackend'
+        login(request, user)
+        auth_logger.info('signup succeeded', extra={'user_id': user.pk})
         return Response({
             'message': 'User created successfully',
             'user': UserSerializer(user).data
         }, status=status.HTTP_201_CREATED)
-    print(f"[DEBUG] Signup validation errors: {serializer.errors}")
+    auth_logger.info('signup rejected', extra={'errors': serializer.errors})
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -52,9 +67,7 @@ def signup(request):
 @permission_classes([AllowAny])
 def signin(request):
     """User signin endpoint"""
-    from django.contrib.auth import authenticate
-    
-    print(f"[DEBUG] Signin request data: {request.data}")
+    auth_logger.debug('signin request', extra={'data': request.data})
     mobile_number = request.data.get('mobile_number')
     password = request.data.get('password')
     
@@ -69,25 +82,27 @@ def signin(request):
     if user is not None:
         if user.is_active:
             login(request, user)
+            auth_logger.info('signin succeeded', extra={'user_id': user.pk})
             return Response({
                 'message': 'Login successful',
                 'user': UserSerializer(user).data
             }, status=status.HTTP_200_OK)
         else:
+            auth_logger.info('signin rejected', extra={'reason': 'inactive', 'user_id': user.pk})
             return Response({
                 'error': 'This account has been disabled'
             }, status=status.HTTP_400_BAD_REQUEST)
     else:
-        # Check if user exists to give better error message
-        try:
-            User.objects.get(mobile_number=mobile_number)
-            return Response({
-                'error': 'Incorrect password. Please try again.'
-            }, status=status.HTTP_400_BAD_REQUEST)
-        except User.DoesNotExist:
+        # The backend records why it failed, so no second lookup is needed
+        reason = getattr(request, 'auth_failure', 'incorrect_password')
+        auth_logger.info('signin rejected', extra={'reason': reason})
+        if reason == 'unknown_user':
             return Response({
                 'error': f'No account found with mobile number {mobile_number}. Please sign up first.'
             }, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'error': 'Incorrect password. Please try again.'
+        }, status=status.HTTP_400_BAD_REQUEST)
 
 
 @api_view(['POST'])
@@ -111,32 +126,110 @@ def csrf_token(request):
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def debug_users(request):
-    """Development only - list all users (DO NOT USE IN PRODUCTION!)"""
+    """Development only - list users, a page at a time (DO NOT USE IN PRODUCTION!)"""
     if not settings.DEBUG:
         return Response({'error': 'This endpoint is only available in debug mode'}, status=403)
     
-    users = User.objects.all()
-    user_list = [
-        {
-            'id': user.id,
-            'username': user.username,
-            'mobile_number': user.mobile_number,
-            'email': user.email,
-        }
-        for user in users
-    ]
+    try:
+        after = int(request.query_params.get('after', 0))
+        limit = int(request.query_params.get('limit', DEBUG_USERS_PAGE_SIZE))
+    except ValueError:
+        return Response({
+            'error': 'after and limit must be integers'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    limit = max(1, min(limit, DEBUG_USERS_MAX_PAGE_SIZE))
+    
+    # Keyset page: the next users by id, however deep the page
+    user_list = list(
+        User.objects.filter(id__gt=after).order_by('id')
+        .values('id', 'username', 'mobile_number', 'email')[:limit + 1]
+    )
+    has_more = len(user_list) > limit
+    user_list = user_list[:limit]
+    total = counts.estimate(User.objects.all())
     return Response({
-        'total_users': users.count(),
+        'total_users': total.count,
+        'total_is_exact': total.kind == counts.EXACT,
         'users': user_list,
+        'cursor': user_list[-1]['id'] if user_list else after,
+        'has_more': has_more,
         'warning': 'This endpoint should NEVER be used in production!'
     })
 
 
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def batch(request):
+    """Run several API requests in one round trip (see api.batch)"""
+    serializer = BatchSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    responses, read_only = batch_requests.run(
+        request._request, serializer.validated_data['requests']
+    )
+    # A batch of reads should not pin the client to the primary database
+    request._request.db_read_only = read_only
+    return Response({'responses': responses})
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def courier_pings(request):
+    """Staff only - buffer courier location pings; they are written in batches (see api.pings)"""
+    serializer = CourierPingBatchSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    buffer = pings.get_buffer()
+    received = serializer.validated_data['pings']
+    accepted = sum(buffer.add(**ping) for ping in received)
+    return Response({
+        'accepted': accepted,
+        'dropped': len(received) - accepted,
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def order_analytics(request):
+    """Staff only - order demand, quantity and delivery-time aggregates (see api.analytics)"""
+    try:
+        days = int(request.query_params.get('days', 30))
+        service_id = request.query_params.get('service_id')
+        service_id = int(service_id) if service_id else None
+    except ValueError:
+        return Response({
+            'error': 'days and service_id must be integers'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if days < 0:
+        return Response({
+            'error': 'days must be 0 (all orders) or more'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        return Response(analytics.summary(days=days or None, service_id=service_id))
+    except analytics.AnalyticsUnavailable as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def metrics(request):
+    """Staff only - counters of this server process"""
+    return Response({
+        'admission': admission.stats(),
+        'payload_cache': payload_cache.get_cache().stats(),
+        'courier_pings': pings.get_buffer().stats(),
+        'logging': log.stats(),
+    })
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_profile(request):
     """Get user profile"""
-    serializer = UserSerializer(request.user)
+    serializer = UserSerializer(request.user, field_spec=FieldSpec.from_request(request))
     return Response(serializer.data)
 
 
@@ -194,14 +287,13 @@ class ServiceViewSet(viewsets.ReadOnlyModelViewSet):
             }, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            service = Service.objects.get(id=service_id)
-            quantity_decimal = Decimal(quantity).quantize(TWO_PLACES)
-            cost = (service.price_per_unit * quantity_decimal).quantize(TWO_PLACES)
+            service = catalog.get_service(service_id)
+            quantity_decimal, cost = quote(service.price_per_unit_minor, quantity)[:2]
             
             return Response({
                 'service': ServiceSerializer(service).data,
                 'quantity': quantity_decimal,
-                'cost': cost,
+                'cost': money.to_decimal(cost),
                 'currency': DEFAULT_CURRENCY,
             })
         except Service.DoesNotExist:
@@ -219,26 +311,259 @@ class OrderViewSet(viewsets.ModelViewSet):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
     
+    CHANGES_PAGE_SIZE = 200
+    CHANGES_MAX_PAGE_SIZE = 1000
+    # Actions that can answer with the side-loaded format (see api.compact)
+    COMPACT_ACTIONS = ('list', 'changes')
+    
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # Order queries in this request go to the user's shard
+        self._shard_token = sharding.current_shard.set(sharding.shard_for_user(request.user))
+    
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_shard_token', None)
+        if token is not None:
+            sharding.current_shard.reset(token)
+            self._shard_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+    
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        if self.action in self.COMPACT_ACTIONS:
+            renderers.append(compact.CompactJSONRenderer())
+        return renderers
+    
     def get_queryset(self):
         """Return orders for the authenticated user"""
-        return Order.objects.filter(user=self.request.user)
+        queryset = Order.objects.filter(user=self.request.user)
+        if self.action in ('list', 'retrieve'):
+            serializer_class = (
+                CompactOrderSerializer if compact.requested(self.request) else OrderSerializer
+            )
+            queryset = narrow_queryset(queryset, serializer_class, self.get_field_spec())
+        return queryset
+    
+    def get_field_spec(self):
+        return FieldSpec.from_request(self.request)
+    
+    def get_serializer(self, *args, **kwargs):
+        if self.action in ('list', 'retrieve'):
+            kwargs.setdefault('field_spec', self.get_field_spec())
+        return super().get_serializer(*args, **kwargs)
+    
+    def list(self, request, *args, **kwargs):
+        if not compact.requested(request):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(compact.order_document(queryset, self.get_field_spec()))
+    
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            version = (
+                Order.objects.filter(user=request.user, pk=kwargs['pk'])
+                .values_list('id', 'updated_at', 'version').first()
+            )
+        except (ValueError, TypeError):
+            version = None
+        if version is None:
+            return super().retrieve(request, *args, **kwargs)
+        order_id, updated_at, order_version = version
+        data = payload_cache.get_or_render(
+            'order', order_id, [updated_at], self.get_field_spec(),
+            lambda: dict(self.get_serializer(self.get_object()).data),
+        )
+        return Response(data, headers={'ETag': etag(order_version)})
+    
+    def update(self, request, *args, **kwargs):
+        """
+        Save only over the version the client has: ``If-Match`` with an
+        older version is answered with 412, and a change that lands between
+        loading and saving the order with 409.
+        """
+        partial = kwargs.pop('partial', False)
+        instance = self.get_object()
+        if not if_match(request, instance.version):
+            return self._version_error(
+                instance.version, 'Order has changed since the version in If-Match',
+                status.HTTP_412_PRECONDITION_FAILED,
+            )
+        serializer = self.get_serializer(instance, data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        try:
+            self.perform_update(serializer)
+        except VersionConflict:
+            current = Order.objects.filter(pk=instance.pk).values_list('version', flat=True).first()
+            return self._version_error(
+                current, 'Order was changed by another request, reload it and try again',
+                status.HTTP_409_CONFLICT,
+            )
+        return Response(serializer.data, headers={'ETag': etag(serializer.instance.version)})
+    
+    def destroy(self, request, *args, **kwargs):
+        instance = self.get_object()
+        if not if_match(request, instance.version):
+            return self._version_error(
+                instance.version, 'Order has changed since the version in If-Match',
+                status.HTTP_412_PRECONDITION_FAILED,
+            )
+        self.perform_destroy(instance)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    
+    def _version_error(self, version, message, status_code):
+        return Response(
+            {'error': message, 'version': version},
+            status=status_code,
+            headers={'ETag': etag(version)} if version is not None else None,
+        )
+    
+    def perform_create(self, serializer):
+        data = serializer.validated_data
+        try:
+            service = catalog.get_service(data['service_id'])
+        except Service.DoesNotExist:
+            raise serializers.ValidationError({'service_id': ['Service not found.']})
+        with sharding.atomic():
+            reserved_on = self._reserve_capacity(service, data['quantity'])
+            order = serializer.save(reserved_on=reserved_on)
+            record_event(order, 'created', order_created_data(order))
+    
+    def perform_update(self, serializer):
+        instance = serializer.instance
+        try:
+            save_edit(
+                instance, snapshot(instance),
+                serializer.validated_data.get('status', instance.status),
+                serializer.save, list(serializer.validated_data),
+            )
+        except capacity.CapacityExceeded as exc:
+            raise self._capacity_error(exc)
+    
+    def perform_destroy(self, instance):
+        with sharding.atomic():
+            if instance.status != 'cancelled':
+                capacity.release(instance.service_id, instance.reserved_on, instance.quantity)
+            record_event(instance, 'deleted')
+            instance.delete()
+    
+    def _reserve_capacity(self, service, quantity):
+        try:
+            return capacity.reserve(service, quantity)
+        except capacity.CapacityExceeded as exc:
+            raise self._capacity_error(exc)
+    
+    def _capacity_error(self, exc):
+        return serializers.ValidationError({
+            'quantity': [f'Only {exc.available} units are available for {exc.day}.']
+        })
+    
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """Incremental sync - order events after the client's cursor"""
+        try:
+            since = int(request.query_params.get('since', ''))
+            limit = int(request.query_params.get('limit', self.CHANGES_PAGE_SIZE))
+        except ValueError:
+            return Response({
+                'error': 'since must be an integer sequence number and limit an integer'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, self.CHANGES_MAX_PAGE_SIZE))
+        
+        # Older events may have been pruned; a client whose cursor falls
+        # before the retained window has to refetch the order list.
+        bounds = OrderEvent.objects.aggregate(oldest=Min('id'), latest=Max('id'))
+        latest = bounds['latest'] or 0
+        if since < 0 or since > latest or (
+            bounds['oldest'] is not None and since < bounds['oldest'] - 1
+        ):
+            return Response({
+                'resync_required': True,
+                'cursor': latest,
+                'has_more': False,
+                'events': [],
+            })
+        
+        # IDs are assigned at insert, before commit. The cursor never skips
+        # an event only because events still become visible in ID order:
+        # SQLite has a single writer, and a transaction holds the write lock
+        # from its insert until it commits. With concurrent writers (PostgreSQL,
+        # MySQL) a lower ID could commit after a reader moved past it; there
+        # only events below the oldest in-flight transaction may be served.
+        events = list(
+            OrderEvent.objects.filter(user=request.user, id__gt=since)[:limit + 1]
+        )
+        has_more = len(events) > limit
+        events = events[:limit]
+        payload = {
+            'resync_required': False,
+            'cursor': events[-1].id if events else latest,
+            'has_more': has_more,
+            'events': OrderEventSerializer(events, many=True).data,
+        }
+        if compact.requested(request):
+            payload['included'] = compact.included(service_ids=compact.event_service_ids(events))
+        return Response(payload)
     
     @action(detail=True, methods=['get'])
     def track(self, request, pk=None):
         """Track an order"""
+        spec = self.get_field_spec()
+        
+        def render():
+            # One joined query loading only the requested columns
+            tracking = narrow_queryset(
+                OrderTracking.objects.filter(order__user=request.user),
+                OrderTrackingSerializer,
+                spec,
+            ).get(order_id=pk)
+            return dict(OrderTrackingSerializer(tracking, field_spec=spec).data)
+        
+        try:
+            version = (
+                OrderTracking.objects.filter(order__user=request.user, order_id=pk)
+                .values_list('order_id', 'last_updated', 'order__updated_at').first()
+            )
+        except (ValueError, TypeError):
+            version = None
         try:
+            if version is not None:
+                # Served from the payload cache while the versions are unchanged
+                order_id, *stamps = version
+                return Response(payload_cache.get_or_render('tracking', order_id, stamps, spec, render))
             order = self.get_object()
             tracking, created = OrderTracking.objects.get_or_create(
                 order=order,
                 defaults={'remaining_delivery_time': order.estimated_delivery_time}
             )
-            serializer = OrderTrackingSerializer(tracking)
+            if created:
+                record_event(order, 'tracking', {
+                    'remaining_delivery_time': tracking.remaining_delivery_time
+                })
+                # A GET that wrote: pin the client to the primary all the same
+                request._request.db_wrote = True
+            serializer = OrderTrackingSerializer(tracking, field_spec=spec)
             return Response(serializer.data)
-        except Order.DoesNotExist:
+        except (Order.DoesNotExist, OrderTracking.DoesNotExist):
             return Response({
                 'error': 'Order not found'
             }, status=status.HTTP_404_NOT_FOUND)
     
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser])
+    def bulk_status(self, request):
+        """Staff only - move many orders to new statuses at once"""
+        serializer = BulkOrderStatusSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        results = bulk_transition(
+            (item['id'], item['status'])
+            for item in serializer.validated_data['transitions']
+        )
+        return Response({
+            'updated': sum(1 for item in results if item['result'] == 'updated'),
+            'results': results,
+        })
+    
     @action(detail=False, methods=['post'])
     def checkout(self, request):
         """Checkout endpoint - create order"""
@@ -247,30 +572,8 @@ class OrderViewSet(viewsets.ModelViewSet):
             data = serializer.validated_data
             
             try:
-                service = Service.objects.get(id=data['service_id'])
-                quantity = data['quantity'].quantize(TWO_PLACES)
-                service_cost = (service.price_per_unit * quantity).quantize(TWO_PLACES)
-                delivery_cost = Decimal(data.get('delivery_cost', Decimal('0'))).quantize(TWO_PLACES)
-                total_cost = (service_cost + delivery_cost).quantize(TWO_PLACES)
-                
-                order = Order.objects.create(
-                    user=request.user,
-                    service=service,
-                    quantity=quantity,
-                    service_cost=service_cost,
-                    delivery_cost=delivery_cost,
-                    total_cost=total_cost,
-                    location=data['location'],
-                    payment_method=data['payment_method'],
-                    notes=data.get('notes', ''),
-                    estimated_delivery_time=data.get('estimated_delivery_time', 60)
-                )
-                
-                # Create tracking entry
-                OrderTracking.objects.create(
-                    order=order,
-                    remaining_delivery_time=order.estimated_delivery_time
-                )
+                service = catalog.get_service(data['service_id'])
+                order = place_order(request.user, service, data)
                 
                 return Response({
                     'message': 'Order created successfully',
@@ -280,6 +583,11 @@ class OrderViewSet(viewsets.ModelViewSet):
                 return Response({
                     'error': 'Service not found'
                 }, status=status.HTTP_404_NOT_FOUND)
+            except capacity.CapacityExceeded as exc:
+                return Response({
+                    'error': 'Not enough delivery capacity left for this service today',
+                    'available': exc.available,
+                }, status=status.HTTP_409_CONFLICT)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -0,0 +1,116 @@
+"""
+Pre-fork warmup for WSGI/ASGI workers.
+
+Called from ``softproject_api/wsgi.py`` and ``asgi.py`` once the application
+is loaded. When the server imports the application before forking (gunicorn
+``--preload``, uWSGI without ``lazy-apps``) every worker inherits the warmed
+URL resolver, serializer field caches and ORM/database backend state instead
+of paying for them on its first requests.
+"""
+import inspect
+import logging
+import time
+
+from django.contrib import admin
+from django.db import DatabaseError, connections
+from django.template.loader import get_template
+from django.urls import NoReverseMatch, URLResolver, get_resolver, resolve, reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import BaseSerializer
+
+logger = logging.getLogger('api.warmup')
+
+# Keyword arguments tried when reversing routes that take parameters
+_SAMPLE_KWARGS = [{}, {'pk': '1'}]
+
+_ADMIN_TEMPLATES = [
+    'admin/index.html',
+    'admin/login.html',
+    'admin/change_list.html',
+    'admin/change_form.html',
+]
+
+
+def _iter_url_names(patterns, namespace=''):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            prefix = f'{namespace}{pattern.namespace}:' if pattern.namespace else namespace
+            yield from _iter_url_names(pattern.url_patterns, prefix)
+        elif pattern.name:
+            yield namespace + pattern.name
+
+
+def resolve_routes():
+    """Populate the resolver caches by reversing and resolving every named route."""
+    resolved = 0
+    for name in set(_iter_url_names(get_resolver().url_patterns)):
+        for kwargs in _SAMPLE_KWARGS:
+            try:
+                path = reverse(name, kwargs=kwargs)
+            except NoReverseMatch:
+                continue
+            resolve(path)
+            resolved += 1
+            break
+    return resolved
+
+
+def build_serializers():
+    """Instantiate every serializer in ``api.serializers`` and build its fields."""
+    from api import serializers as module
+
+    built = 0
+    for _, cls in inspect.getmembers(module, inspect.isclass):
+        if issubclass(cls, BaseSerializer) and cls.__module__ == module.__name__:
+            cls().fields
+            built += 1
+    return built
+
+
+def build_admin():
+    """Compile the admin templates and build each registered ModelAdmin's media."""
+    for name in _ADMIN_TEMPLATES:
+        get_template(name)
+    for model_admin in admin.site._registry.values():
+        model_admin.media
+    return len(admin.site._registry)
+
+
+def prime_database():
+    """
+    Open each connection, load the service catalog and render it once.
+
+    Connections are closed again afterwards: a socket or SQLite handle must
+    never be shared between forked workers.
+    """
+    from api.models import Service
+    from api.serializers import ServiceSerializer
+
+    try:
+        for connection in connections.all():
+            connection.ensure_connection()
+        services = list(Service.objects.all())
+        JSONRenderer().render(ServiceSerializer(services, many=True).data)
+        return len(services)
+    except DatabaseError as exc:
+        logger.warning('warmup could not reach the database', extra={'error': str(exc)})
+        return 0
+    finally:
+        connections.close_all()
+
+
+def warmup():
+    """Run every warmup step and log how long each took."""
+    timings = {}
+    counts = {}
+    for label, step in [
+        ('routes', resolve_routes),
+        ('serializers', build_serializers),
+        ('admin', build_admin),
+        ('catalog', prime_database),
+    ]:
+        start = time.perf_counter()
+        counts[label] = step()
+        timings[label] = round((time.perf_counter() - start) * 1000, 2)
+    logger.info('warmup complete', extra={'counts': counts, 'timings_ms': timings})
+    return timings
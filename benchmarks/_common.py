@@ -0,0 +1,61 @@
+"""
+Shared helpers for the scripts in ``benchmarks/``.
+
+Each script boots Django against a throwaway test database so it can be run
+from a checkout without touching ``db.sqlite3``:
+
+    python benchmarks/<script>.py
+"""
+
+import logging
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django(database=None):
+    """
+    Configure Django and create an empty, migrated test database.
+
+    The database is in memory unless ``database`` names a file to use, for
+    measurements that depend on disk writes.
+    """
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'softproject_api.settings')
+
+    import django
+    django.setup()
+    # 4xx responses are expected in benchmarks; don't print one per request.
+    logging.getLogger('django.request').setLevel(logging.ERROR)
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
+    if database:
+        connection.settings_dict['TEST']['NAME'] = database
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+
+def measure(func, iterations=200, warmup=20):
+    """Call ``func`` repeatedly and return latency statistics in milliseconds."""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'mean': statistics.fmean(samples),
+        'p50': samples[len(samples) // 2],
+        'p99': samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+    }
+
+
+def report(label, stats):
+    print(f"{label:<32} mean {stats['mean']:8.3f} ms   "
+          f"p50 {stats['p50']:8.3f} ms   p99 {stats['p99']:8.3f} ms")
@@ -0,0 +1,81 @@
+"""
+Order analytics: a Python loop over the ORM against ``api.analytics``.
+
+Generates ``--orders`` orders, then computes the aggregates of
+``api/analytics/`` (orders per hour, quantity percentiles and delivery-time
+histograms per service) by iterating over ``Order`` rows, and with
+``analytics.summary()`` over the memory-mapped extract. Also times the
+first extract and an incremental refresh after ``--changed`` orders move
+to a new status.
+
+    python benchmarks/bench_analytics.py [--orders N] [--changed N]
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+
+from _common import setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--orders', type=int, default=200_000)
+    parser.add_argument('--changed', type=int, default=1000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    setup_django(database=os.path.join(directory, 'bench_analytics.sqlite3'))
+
+    import io
+
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.utils import timezone
+
+    from api import analytics
+    from api.models import Order
+    from api.orders import bulk_transition
+
+    settings.ANALYTICS_CACHE_DIR = os.path.join(directory, 'analytics_cache')
+    call_command('init_services', stdout=io.StringIO())
+    call_command(
+        'generate_data', '--users', str(max(1, args.orders // 20)), '--orders', str(args.orders),
+        '--days', '60', stdout=io.StringIO(),
+    )
+
+    def orm_loop():
+        per_hour = defaultdict(lambda: [0] * 24)
+        quantities, minutes = defaultdict(list), defaultdict(list)
+        for order in Order.objects.all().iterator(chunk_size=2000):
+            per_hour[order.service_id][timezone.localtime(order.created_at).hour] += 1
+            quantities[order.service_id].append(order.quantity)
+            if order.status == 'delivered' and order.delivered_at:
+                minutes[order.service_id].append((order.delivered_at - order.created_at).total_seconds() // 60)
+        return {
+            service_id: (statistics.quantiles(values, n=100), statistics.quantiles(minutes[service_id], n=100))
+            for service_id, values in quantities.items()
+        }
+
+    def timed(label, func):
+        start = time.perf_counter()
+        result = func()
+        print(f'{label:<40} {(time.perf_counter() - start) * 1000:>10,.1f} ms')
+        return result
+
+    timed('ORM loop over every order', orm_loop)
+    timed('first extract (refresh_analytics)', lambda: analytics.refresh(full=True))
+    timed('analytics.summary(), all orders', lambda: analytics.summary())
+    timed('analytics.summary(), last 30 days', lambda: analytics.summary(days=30))
+
+    pending = list(Order.objects.filter(status='pending').values_list('id', flat=True)[:args.changed])
+    bulk_transition((order_id, 'confirmed') for order_id in pending)
+    result = timed(f'incremental refresh, {len(pending)} changed', lambda: analytics.refresh())
+    print(f"  {result['default']['updated']} rows rewritten in place, {result['default']['added']} added")
+
+
+if __name__ == '__main__':
+    main()
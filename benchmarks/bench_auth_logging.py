@@ -0,0 +1,88 @@
+"""
+Request latency of ``signin`` with different logging setups.
+
+Compares the queue-backed ``api`` logging pipeline against logging disabled
+and against a plain synchronous ``StreamHandler`` writing to a slow sink, which
+is what the old ``print`` debugging amounted to.
+
+    python benchmarks/bench_auth_logging.py [--iterations N] [--sink-delay MS]
+"""
+
+import argparse
+import io
+import logging
+import time
+
+from _common import measure, report, setup_django
+
+
+class SlowStream(io.StringIO):
+    """A stream whose writes stall like a backed-up log pipe."""
+
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+
+    def write(self, s):
+        time.sleep(self.delay)
+        return len(s)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--sink-delay', type=float, default=1.0,
+                        help='milliseconds each write to the log sink takes')
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.contrib.auth.hashers import make_password
+    from django.test.utils import override_settings
+    from rest_framework.test import APIClient
+
+    from api.log import QueueListenerHandler, RedactFilter
+    from api.models import User
+
+    # Cheap hasher so the numbers reflect request handling, not PBKDF2.
+    override_settings(
+        PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']
+    ).enable()
+    User.objects.create(
+        username='bench', mobile_number='0770000000',
+        password=make_password('bench-pass'),
+    )
+    client = APIClient()
+    payload = {'mobile_number': '0770000000', 'password': 'bench-pass'}
+
+    def signin():
+        client.post('/api/auth/signin/', payload, format='json')
+
+    api_logger = logging.getLogger('api')
+    auth_logger = logging.getLogger('api.auth')
+    original_handlers = api_logger.handlers[:]
+    delay = args.sink_delay / 1000
+
+    def use(handler, level):
+        api_logger.handlers = [handler] if handler else []
+        auth_logger.setLevel(level)
+
+    sync_handler = logging.StreamHandler(SlowStream(delay))
+    sync_handler.addFilter(RedactFilter())
+    queue_handler = QueueListenerHandler(stream=SlowStream(delay))
+    queue_handler.addFilter(RedactFilter())
+
+    print(f'signin x{args.iterations}, log sink write delay {args.sink_delay} ms')
+    use(None, logging.CRITICAL)
+    report('logging disabled', measure(signin, args.iterations))
+    use(sync_handler, logging.DEBUG)
+    report('synchronous stream handler', measure(signin, args.iterations))
+    use(queue_handler, logging.DEBUG)
+    report('queue handler', measure(signin, args.iterations))
+    print(f'queue handler dropped {queue_handler.dropped} records')
+
+    api_logger.handlers = original_handlers
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Checkout latency and write throughput on a file-backed SQLite database.
+
+Posts ``/api/orders/checkout/`` under each SQLite journal profile, with the
+service from ``api.catalog`` and with the catalog reloaded on every request
+(the service query checkout used to run). Throughput is measured with
+``--threads`` clients posting at once for ``--seconds``.
+
+    python benchmarks/bench_checkout.py [--iterations N] [--threads N] [--seconds S]
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from _common import measure, report, setup_django
+
+PROFILES = [
+    ('rollback journal, sync FULL', {'journal_mode': 'delete', 'synchronous': 'full'}),
+    ('WAL, sync FULL', {'journal_mode': 'wal', 'synchronous': 'full'}),
+    ('WAL, sync NORMAL', {'journal_mode': 'wal', 'synchronous': 'normal'}),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=3.0)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    setup_django(database=os.path.join(directory, 'bench_checkout.sqlite3'))
+
+    import io
+
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.db import connection, connections
+    from rest_framework.test import APIClient
+
+    from api import catalog
+    from api.models import Service, User
+
+    call_command('init_services', stdout=io.StringIO())
+    user = User.objects.create_user(
+        username='bench', mobile_number='07000000000', password='bench-pass'
+    )
+    body = {
+        'service_id': Service.objects.get(service_type='water').id, 'quantity': '12.5',
+        'location': 'Baghdad, District 7', 'payment_method': 'cash', 'delivery_cost': '2000',
+    }
+
+    def client():
+        api = APIClient()
+        api.force_authenticate(user)
+        return api
+
+    def checkout(api):
+        response = api.post('/api/orders/checkout/', body, format='json')
+        assert response.status_code == 201, response.content
+
+    def throughput():
+        stop = time.monotonic() + args.seconds
+        counts = []
+
+        def worker():
+            api, done = client(), 0
+            try:
+                while time.monotonic() < stop:
+                    checkout(api)
+                    done += 1
+            finally:
+                connections.close_all()
+            counts.append(done)
+
+        threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sum(counts) / (time.monotonic() - started)
+
+    api = client()
+    for label, pragmas in PROFILES:
+        settings.SQLITE_PRAGMAS = pragmas
+        # Reconnect so the PRAGMAs apply (see api.apps)
+        connection.close()
+        print(label)
+        report('  checkout', measure(lambda: checkout(api), args.iterations))
+
+        def uncached():
+            catalog.invalidate()
+            checkout(api)
+
+        report('  checkout, service query', measure(uncached, args.iterations))
+        print(f'  {args.threads} clients: {throughput():,.0f} checkouts/s\n')
+
+
+if __name__ == '__main__':
+    main()
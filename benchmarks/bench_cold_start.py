@@ -0,0 +1,88 @@
+"""
+First-request latency of a fresh WSGI worker, with and without warmup.
+
+Each run starts a new interpreter, imports ``softproject_api.wsgi`` against a
+scratch SQLite database and calls the WSGI application directly, timing the
+first request to each URL and the steady-state median afterwards.
+
+    python benchmarks/bench_cold_start.py [--runs N]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+URLS = ['/api/services/', '/api/services/1/', '/api/orders/']
+
+PRELUDE = """
+import os, sys
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'softproject_api.settings')
+from django.conf import settings
+settings.DATABASES['default']['NAME'] = sys.argv[1]
+"""
+
+MIGRATE = PRELUDE + """
+import django
+django.setup()
+from django.core.management import call_command
+call_command('migrate', verbosity=0)
+call_command('init_services', stdout=open(os.devnull, 'w'))
+"""
+
+PROBE = PRELUDE + """
+import json, time
+from wsgiref.util import setup_testing_defaults
+from softproject_api.wsgi import application
+
+def get(path):
+    environ = {'PATH_INFO': path, 'REQUEST_METHOD': 'GET'}
+    setup_testing_defaults(environ)
+    start = time.perf_counter()
+    body = application(environ, lambda status, headers: None)
+    b''.join(body)
+    body.close()
+    return (time.perf_counter() - start) * 1000
+
+result = {}
+for path in json.loads(sys.argv[2]):
+    first = get(path)
+    steady = sorted(get(path) for _ in range(50))[25]
+    result[path] = [first, steady]
+print(json.dumps(result))
+"""
+
+
+def run(script, db_path, warmup):
+    env = dict(os.environ, DJANGO_WARMUP='1' if warmup else '0', API_LOG_LEVEL='ERROR')
+    proc = subprocess.run(
+        [sys.executable, '-c', script, db_path, json.dumps(URLS)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    return proc.stdout
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.sqlite3')
+        run(MIGRATE, db_path, warmup=False)
+
+        for warmup in (False, True):
+            samples = [json.loads(run(PROBE, db_path, warmup)) for _ in range(args.runs)]
+            print(f"\nwarmup {'on' if warmup else 'off'} (median of {args.runs} fresh workers)")
+            for path in URLS:
+                first = statistics.median(sample[path][0] for sample in samples)
+                steady = statistics.median(sample[path][1] for sample in samples)
+                print(f'  {path:<20} first {first:8.2f} ms   steady {steady:6.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
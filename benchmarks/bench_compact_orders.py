@@ -0,0 +1,82 @@
+"""
+Payload size and latency of the nested versus the compact order list.
+
+Creates one user with N orders spread over the three services and fetches
+``/api/orders/`` and ``/api/orders/changes/`` with the default
+``application/json`` representation and with
+``application/vnd.softproject.compact+json``. Serialization and rendering
+time are also measured on their own, without the request cycle.
+
+    python benchmarks/bench_compact_orders.py [--orders N] [--iterations N]
+"""
+
+import argparse
+import io
+
+from _common import measure, report, setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--orders', type=int, default=500)
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.core.management import call_command
+    from rest_framework.renderers import JSONRenderer
+    from rest_framework.test import APIClient
+
+    from api import compact
+    from api.models import Order, OrderEvent, Service, User
+    from api.orders import order_created_data
+    from api.serializers import OrderSerializer
+
+    call_command('init_services', stdout=io.StringIO())
+    services = list(Service.objects.all())
+    user = User.objects.create_user(
+        username='bench', mobile_number='07000000000', password='bench-pass'
+    )
+    orders = Order.objects.bulk_create([
+        Order(
+            user=user,
+            service=services[n % len(services)],
+            quantity=10,
+            service_cost_minor=10000,
+            delivery_cost_minor=0,
+            total_cost_minor=10000,
+            location='Baghdad',
+            payment_method='cash',
+        )
+        for n in range(args.orders)
+    ])
+    OrderEvent.objects.bulk_create([
+        OrderEvent(user=user, order_id=order.id, event_type='created', data=order_created_data(order))
+        for order in orders
+    ])
+
+    client = APIClient()
+    client.force_authenticate(user)
+    formats = [('nested', 'application/json'), ('compact', compact.COMPACT_MEDIA_TYPE)]
+    renderer = JSONRenderer()
+    queryset = Order.objects.filter(user=user).select_related('user', 'service')
+
+    print(f'{args.orders} orders, {len(services)} services\n')
+    for path in ['/api/orders/', f'/api/orders/changes/?since=0&limit={args.orders}']:
+        for label, accept in formats:
+            size = len(client.get(path, HTTP_ACCEPT=accept).content)
+            stats = measure(lambda: client.get(path, HTTP_ACCEPT=accept), args.iterations, warmup=3)
+            report(f'{path.split("?")[0]} {label}', stats)
+            print(f'{"":<32} {size:,} bytes')
+
+    print('\nserialize + render only')
+    for label, build in [
+        ('nested', lambda: OrderSerializer(list(queryset), many=True).data),
+        ('compact', lambda: compact.order_document(Order.objects.filter(user=user))),
+    ]:
+        report(label, measure(lambda: renderer.render(build()), args.iterations, warmup=3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Integer minor-unit amounts versus the ``DecimalField`` columns they replaced.
+
+Prices N orders with ``api.orders.quote`` and stores every amount twice in a
+scratch table: as integer minor units, like ``Order`` does now, and in the
+old ``DECIMAL(10, 2)`` columns. The rows are otherwise identical, so only the
+column type differs between:
+
+- ``SUM(total_cost)`` in SQL, over every row and grouped by service;
+- reading the amount columns of every row, as an export does;
+- serializing and rendering the list, with ``MoneyField`` against the
+  ``DecimalField`` that ``ModelSerializer`` generated for the old columns.
+
+    python benchmarks/bench_money.py [--orders N] [--iterations N]
+"""
+
+import argparse
+import random
+
+from _common import measure, report, setup_django
+
+AMOUNTS = ['service_cost', 'delivery_cost', 'total_cost']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from decimal import Decimal
+
+    from django.db import connection, models
+    from django.db.models import Sum
+    from rest_framework import serializers
+    from rest_framework.renderers import JSONRenderer
+
+    from api import money
+    from api.orders import quote
+    from api.serializers import MoneyField
+
+    class Amounts(models.Model):
+        service_id = models.IntegerField()
+        quantity = models.DecimalField(max_digits=10, decimal_places=2)
+        service_cost_minor = models.BigIntegerField()
+        delivery_cost_minor = models.BigIntegerField()
+        total_cost_minor = models.BigIntegerField()
+        service_cost = models.DecimalField(max_digits=10, decimal_places=2)
+        delivery_cost = models.DecimalField(max_digits=10, decimal_places=2)
+        total_cost = models.DecimalField(max_digits=10, decimal_places=2)
+
+        class Meta:
+            app_label = 'api'
+            db_table = 'bench_money_amounts'
+
+    with connection.schema_editor() as editor:
+        editor.create_model(Amounts)
+
+    rng = random.Random(0)
+    prices = {1: 20000, 2: 15000, 3: 18000}
+    rows = []
+    for n in range(args.orders):
+        service_id = n % len(prices) + 1
+        quantity, service_cost, delivery_cost, total_cost = quote(
+            prices[service_id],
+            Decimal(rng.randrange(100, 50000)).scaleb(-2),
+            rng.choice(['0', '2000', '5000']),
+        )
+        rows.append(Amounts(
+            service_id=service_id, quantity=quantity,
+            service_cost_minor=service_cost, delivery_cost_minor=delivery_cost,
+            total_cost_minor=total_cost,
+            service_cost=money.to_decimal(service_cost),
+            delivery_cost=money.to_decimal(delivery_cost),
+            total_cost=money.to_decimal(total_cost),
+        ))
+    Amounts.objects.bulk_create(rows, batch_size=1000)
+
+    integer_sum = Amounts.objects.aggregate(total=Sum('total_cost_minor'))['total']
+    decimal_sum = Amounts.objects.aggregate(total=Sum('total_cost'))['total']
+    print(f'{args.orders} orders\n'
+          f'SUM(total_cost) minor units: {money.to_string(integer_sum)}\n'
+          f'SUM(total_cost) decimal:     {decimal_sum}\n')
+
+    def run(label, func):
+        report(label, measure(func, args.iterations, warmup=2))
+
+    print('SUM(total_cost)')
+    run('integer', lambda: Amounts.objects.aggregate(Sum('total_cost_minor')))
+    run('decimal', lambda: Amounts.objects.aggregate(Sum('total_cost')))
+    run('integer, per service', lambda: list(
+        Amounts.objects.values('service_id').annotate(Sum('total_cost_minor')).order_by()
+    ))
+    run('decimal, per service', lambda: list(
+        Amounts.objects.values('service_id').annotate(Sum('total_cost')).order_by()
+    ))
+
+    minor = [f'{name}_minor' for name in AMOUNTS]
+    print('\nread the amount columns of every row')
+    run('integer', lambda: list(Amounts.objects.values_list(*minor)))
+    run('decimal', lambda: list(Amounts.objects.values_list(*AMOUNTS)))
+
+    class MoneySerializer(serializers.ModelSerializer):
+        service_cost = MoneyField(source='service_cost_minor')
+        delivery_cost = MoneyField(source='delivery_cost_minor')
+        total_cost = MoneyField(source='total_cost_minor')
+
+        class Meta:
+            model = Amounts
+            fields = ['id', 'service_id', 'quantity', *AMOUNTS]
+
+    class DecimalSerializer(serializers.ModelSerializer):
+        class Meta:
+            model = Amounts
+            fields = ['id', 'service_id', 'quantity', *AMOUNTS]
+
+    renderer = JSONRenderer()
+    print('\nload, serialize and render the list')
+    run('integer (MoneyField)', lambda: renderer.render(MoneySerializer(
+        Amounts.objects.only('id', 'service_id', 'quantity', *minor), many=True
+    ).data))
+    run('decimal (DecimalField)', lambda: renderer.render(DecimalSerializer(
+        Amounts.objects.only('id', 'service_id', 'quantity', *AMOUNTS), many=True
+    ).data))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Password hashing cost of the auth endpoints and of async password checks.
+
+Part 1 drives signup and signin (success, wrong password, unknown number)
+through the API and reports latency and PBKDF2 computations per request.
+Part 2 runs concurrent async password checks and measures how long the event
+loop is stalled, with hashing inline versus on the bounded hashing pool.
+
+    python benchmarks/bench_password_hashing.py [--iterations N] [--concurrency N]
+"""
+
+import argparse
+import asyncio
+import itertools
+import time
+
+from _common import measure, report, setup_django
+
+
+def count_hashes():
+    """Patch the PBKDF2 primitive used by the hashers to count calls."""
+    from django.contrib.auth import hashers
+
+    counter = {'calls': 0}
+    original = hashers.pbkdf2
+
+    def counting_pbkdf2(*args, **kwargs):
+        counter['calls'] += 1
+        return original(*args, **kwargs)
+
+    hashers.pbkdf2 = counting_pbkdf2
+    return counter
+
+
+async def loop_stall(checks, concurrency):
+    """Largest gap between ticks of a 1 ms heartbeat while checks run."""
+    worst = 0.0
+    done = False
+
+    async def heartbeat():
+        nonlocal worst
+        last = time.perf_counter()
+        while not done:
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            worst = max(worst, now - last)
+            last = now
+
+    beat = asyncio.create_task(heartbeat())
+    start = time.perf_counter()
+    await asyncio.gather(*(checks() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    done = True
+    await beat
+    return elapsed * 1000, worst * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.conf import settings
+    from rest_framework.test import APIClient
+
+    from api.hashers import acheck_password
+    from api.models import User
+
+    counter = count_hashes()
+    client = APIClient()
+    numbers = itertools.count()
+
+    def signup():
+        n = next(numbers)
+        client.post('/api/auth/signup/', {
+            'username': f'bench{n}', 'mobile_number': f'07{n:09d}',
+            'password': 'bench-pass', 'password_confirm': 'bench-pass',
+        }, format='json')
+
+    def signin(password, number='07000000000'):
+        return lambda: client.post(
+            '/api/auth/signin/', {'mobile_number': number, 'password': password}, format='json'
+        )
+
+    print(f'PBKDF2 iterations: {settings.PASSWORD_HASHER_ITERATIONS or "Django default"}')
+    for label, func in [
+        ('signup', signup),
+        ('signin', signin('bench-pass')),
+        ('signin wrong password', signin('wrong')),
+        ('signin unknown number', signin('bench-pass', '0799999999')),
+    ]:
+        counter['calls'] = 0
+        stats = measure(func, args.iterations, warmup=1)
+        report(label, stats)
+        print(f'{"":<32} {counter["calls"] / (args.iterations + 1):.1f} hashes/request')
+
+    user = User.objects.get(mobile_number='07000000000')
+
+    async def inline_check():
+        user.check_password('bench-pass')
+
+    async def pooled_check():
+        await acheck_password(user, 'bench-pass')
+
+    print(f'\n{args.concurrency} concurrent async password checks')
+    for label, check in [('inline', inline_check), ('hashing pool', pooled_check)]:
+        elapsed, stall = asyncio.run(loop_stall(check, args.concurrency))
+        print(f'{label:<32} total {elapsed:8.1f} ms   worst event-loop stall {stall:8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
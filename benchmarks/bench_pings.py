@@ -0,0 +1,94 @@
+"""
+Courier ping ingestion: one write per ping against the write-behind buffer.
+
+``--orders`` active orders each get ``--rounds`` pings on a file-backed
+SQLite database. Writing every ping to ``OrderTracking`` in its own
+transaction is compared with ``api.pings.PingBuffer``, flushed once per
+round as its background thread would be. The latency of
+``POST /api/courier/pings/`` with one ping is reported too.
+
+    python benchmarks/bench_pings.py [--orders N] [--rounds N]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from _common import measure, report, setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--orders', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=10)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    setup_django(database=os.path.join(directory, 'bench_pings.sqlite3'))
+
+    import io
+
+    from django.core.management import call_command
+    from django.db import transaction
+    from django.utils import timezone
+    from rest_framework.test import APIClient
+
+    from api import pings
+    from api.models import Order, OrderTracking, Service, User
+    from api.orders import place_order
+
+    call_command('init_services', stdout=io.StringIO())
+    user = User.objects.create_user(
+        username='bench', mobile_number='07000000000', password='bench-pass', is_staff=True
+    )
+    service = Service.objects.get(service_type='water')
+    data = {'quantity': '10', 'location': 'Baghdad', 'payment_method': 'cash'}
+    order_ids = [place_order(user, service, data).id for _ in range(args.orders)]
+    Order.objects.update(status='in_progress')
+    total = args.orders * args.rounds
+
+    def direct(round_number):
+        for order_id in order_ids:
+            with transaction.atomic():
+                order = Order.objects.only('created_at', 'estimated_delivery_time').get(id=order_id)
+                now = timezone.now()
+                OrderTracking.objects.filter(order_id=order_id).update(
+                    courier_latitude=33.3 + round_number / 1000, courier_longitude=44.3,
+                    courier_pinged_at=now, last_updated=now,
+                    remaining_delivery_time=pings.remaining_minutes(
+                        order.created_at, order.estimated_delivery_time, now
+                    ),
+                )
+
+    buffer = pings.PingBuffer(max_pending=args.orders, flush_size=args.orders + 1, flush_interval=0)
+
+    def buffered(round_number):
+        for order_id in order_ids:
+            buffer.add(order_id, 33.3 + round_number / 1000, 44.3)
+        buffer.flush()
+
+    for label, ingest in [('one transaction per ping', direct), ('write-behind buffer', buffered)]:
+        start = time.perf_counter()
+        for round_number in range(args.rounds):
+            ingest(round_number)
+        elapsed = time.perf_counter() - start
+        print(f'{label:<32} {total / elapsed:>10,.0f} pings/s')
+    stats = buffer.stats()
+    print(f"  {stats['flushes']} flushes, mean {stats['mean_flush_ms']} ms, "
+          f"max {stats['max_flush_ms']} ms\n")
+
+    pings._buffer = pings.PingBuffer(flush_interval=0)
+    api = APIClient()
+    api.force_authenticate(user)
+    body = {'pings': [{'order_id': order_ids[0], 'latitude': 33.3, 'longitude': 44.3}]}
+
+    def post():
+        response = api.post('/api/courier/pings/', body, format='json')
+        assert response.status_code == 202, response.content
+
+    report('POST courier/pings/', measure(post))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Import-time audit of the WSGI entry point.
+
+Runs ``python -X importtime -c "import softproject_api.wsgi"`` in a fresh
+interpreter (with warmup disabled, so only imports are measured) and
+summarises the slowest top-level packages and modules. It also lists the
+modules that are imported lazily on the first request (by the URL resolver,
+views and serializers), which is the work ``api.warmup`` moves before the
+fork. The checked-in
+``results/importtime.txt`` is the reference; regenerate it with
+
+    python benchmarks/importtime_report.py --write
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULT_FILE = os.path.join(ROOT, 'benchmarks', 'results', 'importtime.txt')
+LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+LAZY_PROBE = """
+import json, sys, time
+import softproject_api.wsgi
+before = set(sys.modules)
+from api.warmup import warmup
+start = time.perf_counter()
+warmup()
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    'warmup_ms': elapsed * 1000,
+    'modules': sorted(set(sys.modules) - before),
+}))
+"""
+
+
+def collect():
+    env = dict(os.environ, DJANGO_WARMUP='0', PYTHONDONTWRITEBYTECODE='1')
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import softproject_api.wsgi'],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    modules = []
+    for line in proc.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return modules
+
+
+def collect_lazy():
+    env = dict(os.environ, DJANGO_WARMUP='0', API_LOG_LEVEL='ERROR')
+    proc = subprocess.run(
+        [sys.executable, '-c', LAZY_PROBE],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def build_report(modules, lazy, top):
+    total = sum(self_us for _, self_us, _, _ in modules)
+    packages = defaultdict(int)
+    for name, self_us, _, _ in modules:
+        packages[name.split('.')[0]] += self_us
+
+    lines = [
+        f'Total import time: {total / 1000:.1f} ms across {len(modules)} modules',
+        '',
+        'Self time by top-level package:',
+    ]
+    for name, self_us in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        lines.append(f'  {self_us / 1000:8.1f} ms  {name}')
+    lines += ['', 'Slowest modules by cumulative time:']
+    for name, _, cumulative_us, _ in sorted(modules, key=lambda item: -item[2])[:top]:
+        lines.append(f'  {cumulative_us / 1000:8.1f} ms  {name}')
+    lines += ['', 'Project modules:']
+    for name, self_us, cumulative_us, _ in modules:
+        if name.split('.')[0] in ('api', 'softproject_api'):
+            lines.append(f'  {self_us / 1000:8.1f} ms self  {cumulative_us / 1000:8.1f} ms cumulative  {name}')
+
+    lazy_packages = defaultdict(int)
+    for name in lazy['modules']:
+        lazy_packages[name.split('.')[0]] += 1
+    lines += [
+        '',
+        f'Deferred to first request (loaded by warmup in {lazy["warmup_ms"]:.1f} ms): '
+        f'{len(lazy["modules"])} modules',
+    ]
+    for name, count in sorted(lazy_packages.items(), key=lambda item: -item[1]):
+        lines.append(f'  {count:5d}  {name}')
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--write', action='store_true',
+                        help=f'overwrite {os.path.relpath(RESULT_FILE, ROOT)}')
+    args = parser.parse_args()
+
+    report = build_report(collect(), collect_lazy(), args.top)
+    print(report, end='')
+    if args.write:
+        with open(RESULT_FILE, 'w') as fh:
+            fh.write(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -95,6 +95,20 @@ async function apiRequest(endpoint, options = {}) {
     }
 }
 
+// Run several GET/POST calls in one round trip; resolves to one result per
+// request, each either { ok: true, data } or { ok: false, status, data }
+async function apiBatch(requests) {
+    const data = await apiRequest('/batch/', {
+        method: 'POST',
+        body: JSON.stringify({ requests })
+    });
+    return data.responses.map(item => ({
+        ok: item.status >= 200 && item.status < 300,
+        status: item.status,
+        data: item.body
+    }));
+}
+
 // Authentication Functions
 async function signup(formData) {
     try {
@@ -283,12 +297,14 @@ function showAuth() {
     logoutBtn.style.display = 'none';
 }
 
-function showDashboard() {
+function showDashboard(reloadOrders = true) {
     authSection.style.display = 'none';
     dashboardSection.style.display = 'block';
     userInfo.textContent = `Welcome, ${state.user.username}!`;
     logoutBtn.style.display = 'inline-block';
-    loadOrders();
+    if (reloadOrders) {
+        loadOrders();
+    }
 }
 
 // Event Listeners
@@ -344,13 +360,25 @@ refreshOrdersBtn.addEventListener('click', loadOrders);
 // Initialize
 async function init() {
     try {
-        // Try to get profile (check if already logged in)
-        const profile = await apiRequest('/profile/');
-        state.user = profile;
-        showDashboard();
-        loadServices();
+        // Profile (to check if already logged in), services and orders in one round trip
+        const [profile, services, orders] = await apiBatch([
+            { method: 'GET', path: '/profile/' },
+            { method: 'GET', path: '/services/' },
+            { method: 'GET', path: '/orders/' }
+        ]);
+        if (!profile.ok) {
+            // Not logged in, show auth
+            showAuth();
+            return;
+        }
+        state.user = profile.data;
+        state.services = services.ok ? services.data : [];
+        state.orders = orders.ok ? orders.data : [];
+        showDashboard(false);
+        renderServices();
+        populateServiceSelects();
+        renderOrders();
     } catch (error) {
-        // Not logged in, show auth
         showAuth();
     }
 }
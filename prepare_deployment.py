@@ -13,6 +13,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'softproject_api.settings')
 sys.path.insert(0, os.path.dirname(__file__))
 django.setup()
 
+from api import money
 from api.models import User, Service, Order
 
 def check_services():
@@ -26,7 +27,7 @@ def check_services():
     else:
         print(f"   ✅ Found {services.count()} services:")
         for service in services:
-            print(f"      - {service.name_en} ({service.name_ar}): {service.price_per_unit} IQD/{service.unit_name}")
+            print(f"      - {service.name_en} ({service.name_ar}): {money.to_string(service.price_per_unit_minor)} IQD/{service.unit_name}")
         return True
 
 def check_users():
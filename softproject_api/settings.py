@@ -37,6 +37,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'api.middleware.AdmissionControlMiddleware',
+    'api.middleware.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -74,12 +76,105 @@ DATABASES = {
     }
 }
 
+# PRAGMAs run on every new SQLite connection (see api.apps)
+# In WAL mode, readers don't block the writer and a commit appends to the
+# log instead of rewriting pages through a rollback journal. With
+# synchronous=NORMAL the log is synced at checkpoints rather than on every
+# commit: a power loss (not a process crash) can undo the last commits.
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'wal'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'normal'),
+}
+
+# Read replicas
+# DB_REPLICAS=N adds aliases replica1..replicaN that serve reads for safe
+# requests. Locally they are file copies of the primary SQLite database,
+# refreshed with `python manage.py sync_replicas`.
+DATABASE_REPLICAS = []
+for _index in range(1, int(os.environ.get('DB_REPLICAS', 0)) + 1):
+    _alias = f'replica{_index}'
+    DATABASES[_alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'db.{_alias}.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(_alias)
+
+# Order shards
+# Orders and their tracking rows live on one shard per user (see
+# api.sharding); users, services and everything else stay on 'default',
+# which is also the first shard. DB_SHARDS=N adds local SQLite shards
+# shard1..shardN; create their tables with `migrate --database shardN` and
+# move users onto them with `python manage.py reshard`. Shards must only
+# ever be appended: a shard's position is part of the order IDs it issues.
+ORDER_SHARDS = ['default']
+for _index in range(1, int(os.environ.get('DB_SHARDS', 0)) + 1):
+    _alias = f'shard{_index}'
+    DATABASES[_alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'db.{_alias}.sqlite3',
+    }
+    ORDER_SHARDS.append(_alias)
+
+# Threads used to query every shard at once
+ORDER_SHARD_WORKERS = int(os.environ.get('ORDER_SHARD_WORKERS', len(ORDER_SHARDS)))
+
+DATABASE_ROUTERS = ['api.db_routers.ShardRouter', 'api.db_routers.ReplicaRouter']
+
+# Seconds a client's reads stay on the primary after it writes
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 5))
+
+# Add an X-DB-Queries response header with per-alias query counts
+REPORT_DB_QUERY_COUNTS = DEBUG
+
+# Admission control (see api.admission)
+# Per route class and per process: requests in flight, seconds a request may
+# wait for a slot, slots kept for critical routes, and the Retry-After value
+ADMISSION_CONTROL = {
+    'auth': {'limit': 8, 'queue_timeout': 1.0, 'reserved': 2, 'retry_after': 2},
+    'read': {'limit': 32, 'queue_timeout': 0.25, 'reserved': 4, 'retry_after': 1},
+    'write': {'limit': 16, 'queue_timeout': 1.0, 'reserved': 4, 'retry_after': 2},
+}
+# Routes that may use the reserved slots
+ADMISSION_CRITICAL_PATHS = ['/api/orders/checkout/', '/api/auth/signin/']
+
+# Serialized order detail payloads (see api.payload_cache)
+# Entries kept in each process's LRU
+PAYLOAD_CACHE_MAX_ENTRIES = int(os.environ.get('PAYLOAD_CACHE_MAX_ENTRIES', 1000))
+# Optional CACHES alias shared by all processes, e.g. a Redis or Memcached cache
+PAYLOAD_CACHE_ALIAS = os.environ.get('PAYLOAD_CACHE_ALIAS') or None
+# Seconds an entry lives; bounds how long nested user/service changes go unseen
+PAYLOAD_CACHE_TIMEOUT = int(os.environ.get('PAYLOAD_CACHE_TIMEOUT', 300))
+
+# Courier location pings (see api.pings), buffered per process
+# Orders whose latest ping may wait in memory; pings for further orders are dropped
+PING_BUFFER_MAX_PENDING = int(os.environ.get('PING_BUFFER_MAX_PENDING', 10000))
+# Write the buffer once this many orders are waiting...
+PING_FLUSH_SIZE = int(os.environ.get('PING_FLUSH_SIZE', 500))
+# ...or every this many seconds (0 writes only when the buffer reaches PING_FLUSH_SIZE)
+PING_FLUSH_INTERVAL = float(os.environ.get('PING_FLUSH_INTERVAL', 2.0))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
 AUTH_PASSWORD_VALIDATORS = []
 
+# Password hashing
+# The first hasher encodes new passwords; the rest only verify old hashes.
+# Run `python manage.py calibrate_hasher` to pick PASSWORD_HASHER_ITERATIONS
+# for the deployment hardware.
+PASSWORD_HASHERS = [
+    'api.hashers.CalibratedPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+PASSWORD_HASHER_ITERATIONS = int(os.environ.get('PASSWORD_HASHER_ITERATIONS', 0)) or None
+# Threads available to async password checks (defaults to min(4, CPUs))
+PASSWORD_HASHING_WORKERS = int(os.environ.get('PASSWORD_HASHING_WORKERS', 0)) or None
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
@@ -115,6 +210,20 @@ AUTHENTICATION_BACKENDS = [
 # Project defaults
 DEFAULT_CURRENCY = 'IQD'
 
+# Delivery-time quantile used for order estimates: 'p50', 'p80' or 'p95'
+ETA_QUANTILE = os.environ.get('ETA_QUANTILE', 'p80')
+
+# Directory of the columnar order extract behind api/analytics/ (see api.analytics)
+ANALYTICS_CACHE_DIR = Path(os.environ.get('ANALYTICS_CACHE_DIR', BASE_DIR / 'analytics_cache'))
+
+# Rows counted exactly before admin changelists and api/debug/users/ switch
+# to an estimate (see api.counts)
+COUNT_CAP = int(os.environ.get('COUNT_CAP', 10000))
+
+# api/batch/ limits: sub-requests per batch and seconds before the rest are skipped
+BATCH_MAX_REQUESTS = int(os.environ.get('BATCH_MAX_REQUESTS', 20))
+BATCH_TIME_LIMIT = float(os.environ.get('BATCH_TIME_LIMIT', 10))
+
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -125,6 +234,41 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Logging
+# The api loggers write through a queue so request threads never block on
+# stream I/O. Levels and sampling rates can be tuned per logger from the
+# environment, e.g. API_AUTH_LOG_LEVEL=DEBUG or API_AUTH_LOG_SAMPLE_RATE=0.1.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'redact': {
+            '()': 'api.log.RedactFilter',
+        },
+        'auth_sample': {
+            '()': 'api.log.SampleFilter',
+            'rate': os.environ.get('API_AUTH_LOG_SAMPLE_RATE', '1.0'),
+        },
+    },
+    'handlers': {
+        'api_queue': {
+            '()': 'api.log.QueueListenerHandler',
+            'filters': ['redact'],
+        },
+    },
+    'loggers': {
+        'api': {
+            'handlers': ['api_queue'],
+            'level': os.environ.get('API_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+        'api.auth': {
+            'level': os.environ.get('API_AUTH_LOG_LEVEL', 'INFO'),
+            'filters': ['auth_sample'],
+        },
+    },
+}
+
 # CORS settings - Allow all origins for school project
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
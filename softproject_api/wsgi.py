@@ -15,3 +15,11 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'softproject_api.settings')
 
 application = get_wsgi_application()
 
+# Build URL resolvers, serializer field caches and database backend state
+# before the server forks so new workers start warm. Set DJANGO_WARMUP=0 to
+# skip (e.g. for management commands that import this module).
+if os.environ.get('DJANGO_WARMUP', '1') != '0':
+    from api.warmup import warmup
+
+    warmup()
+